@@ -1,6 +1,8 @@
+from hpycc.aggregation import aggregate
 from hpycc.connection import Connection
 from hpycc.delete import delete_logical_file, delete_workunit
-from hpycc.get import get_output, get_outputs, get_thor_file
+from hpycc.get import (get_output, get_outputs, get_thor_file, iter_thor_file,
+                       get_rows)
 from hpycc.run import run_script
 from hpycc.save import save_output, save_thor_file
 from hpycc.spray import spray_file
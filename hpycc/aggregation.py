@@ -0,0 +1,146 @@
+"""
+Functions to summarise logical files on a HPCC instance, so that
+only the summary has to be downloaded. The first input to all
+functions is an instance of `Connection`.
+
+Functions
+---------
+- `aggregate` -- Return aggregates of a logical file by group.
+
+"""
+__all__ = ["aggregate"]
+
+import re
+
+from hpycc.get import _check_output, _parse_first_output
+from hpycc.utils.pushdown import AGGREGATES, aggregate_script, compile_where
+
+
+def aggregate(connection, logical_file, by=None, aggs=None, where=None,
+              delete_workunit=True, output="pandas", max_attempts=3,
+              max_sleep=60):
+    """
+    Return aggregates of a logical file for each group of rows.
+
+    The aggregation is run on the cluster as an ECL
+    `TABLE(..., GROUP)` job, so however large the logical file only
+    one row per group is downloaded.
+
+    Parameters
+    ----------
+    connection: hpycc.Connection
+        HPCC Connection instance, see also `Connection`.
+    logical_file: str
+        Name of logical file to aggregate.
+    by: str or list of str, optional
+        Columns to group by. None, a single group of all rows, by
+        default.
+    aggs: dict, optional
+        Aggregates to return, in one of the forms, as for
+        pandas.DataFrame.agg:
+        {column: function}, named column;
+        {column: [function, ...]}, named column_function;
+        {name: (column, function)}, named name.
+        Functions are "count", "sum", "mean", "min", "max", "var"
+        and "std". "var" and "std" are sample statistics, as in
+        pandas, and are 0 for groups of a single row, as ECL
+        returns 0 when dividing by 0. None, {"count": ("*",
+        "count")}, by default.
+    where: str, optional
+        Python expression over the file's columns which rows must
+        match to be aggregated, see `get_thor_file`. None, all
+        rows, by default.
+    delete_workunit: bool, optional
+        Delete the workunit once completed. True by default.
+    output: {"pandas", "arrow"}, optional
+        Type of output to return, see `get_output`. "pandas" by
+        default.
+    max_attempts: int, optional
+        Maximum number of times a request for the file's metadata
+        should be attempted in the case of an exception being
+        raised. 3 by default.
+    max_sleep: int, optional
+        Maximum time, in seconds, to sleep between attempts.
+        60 by default.
+
+    Returns
+    -------
+    df: pandas.DataFrame
+        One row per group, sorted by `by`, with the `by` columns
+        followed by the aggregates. A pyarrow.Table if `output` is
+        "arrow".
+
+    Raises
+    ------
+    ValueError:
+        If a function is not supported, an aggregate name is not a
+        valid ECL field name, or `where` can't be compiled to ECL.
+    KeyError:
+        If a column in `by`, `aggs` or `where` is not in the file.
+
+    See Also
+    --------
+    get_thor_file
+
+    Examples
+    --------
+    >>> import hpycc
+    >>> conn = hpycc.Connection("user")
+    >>> hpycc.aggregate(conn, "example", by="col1",
+    ...                 aggs={"col2": ["sum", "max"],
+    ...                       "rows": ("col2", "count")})
+       col1  col2_sum  col2_max  rows
+    0     a         3         2     2
+    1     b         3         3     1
+
+    """
+    _check_output(output)
+    if isinstance(by, str):
+        by = [by]
+    by = list(by or [])
+    aggs = _normalise_aggs(aggs or {"count": ("*", "count")})
+
+    metadata = connection.get_file_metadata(logical_file, max_attempts,
+                                            max_sleep)
+    columns = metadata.schema.keys()
+    used = by + [col for _, func, col in aggs if func != "count"]
+    missing = set(used).difference(columns)
+    if missing:
+        raise KeyError("Columns {} do not exist in {}".format(
+            sorted(missing), logical_file))
+    if where is not None:
+        where = compile_where(where, columns)
+
+    file_detail = metadata.file_detail
+    if not file_detail:
+        # DFUInfo failed while fetching the metadata, so retry it and
+        # raise if it still fails.
+        file_detail = connection.get_logical_file_info(
+            logical_file, max_attempts, max_sleep)
+    script = aggregate_script(logical_file, file_detail, by, aggs, where)
+    result = connection.run_ecl_string(script, False, delete_workunit, None)
+    return _parse_first_output(result.stdout, output)
+
+
+def _normalise_aggs(aggs):
+    """
+    Return aggregates in the form [(name, function, column)], see
+    `aggregate`.
+    """
+    out = []
+    for key, value in aggs.items():
+        if isinstance(value, tuple):
+            out.append((key, value[1], value[0]))
+        elif isinstance(value, str):
+            out.append((key, value, key))
+        else:
+            out.extend(("{}_{}".format(key, func), func, key)
+                       for func in value)
+
+    for name, func, _ in out:
+        if func not in AGGREGATES:
+            raise ValueError("{} is not one of {}".format(
+                func, sorted(AGGREGATES)))
+        if not re.match("^[A-Za-z_][A-Za-z0-9_]*$", name):
+            raise ValueError("{} is not a valid ECL field name".format(name))
+    return out
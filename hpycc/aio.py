@@ -0,0 +1,482 @@
+"""
+Asyncio counterparts of the HTTP based parts of `hpycc`.
+
+This module provides an `AsyncConnection` class and coroutine
+versions of the functions which only need ECL Watch, so that a
+single event loop can download many logical files concurrently
+without needing an OS thread per request. Concurrency is limited by
+semaphores rather than thread pools. Note that this requires
+`aiohttp` to be installed.
+
+Classes
+-------
+- `AsyncConnection` -- asyncio HPCC connection class.
+
+Functions
+---------
+- `get_thor_file` -- Return the contents of a thor file.
+- `delete_workunit` -- Delete given workunit (based on WUID).
+
+"""
+__all__ = ["AsyncConnection", "get_thor_file", "delete_workunit"]
+
+import asyncio
+import random
+from math import ceil
+from urllib import parse
+
+import pandas as pd
+from requests.exceptions import RetryError
+
+from hpycc.connection import FileMetadata
+from hpycc.get import (DEFAULT_CHUNK_BYTES, _assemble_thor_file,
+                       _plan_download)
+from hpycc.utils.parsers import parse_record_size, parse_wuresult_metadata
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+
+class AsyncConnection:
+    def __init__(self, username, server="localhost", port=8010,
+                 password="password", max_concurrency=100):
+        """
+        Asyncio connection to a HPCC instance.
+
+        Takes the connection details of a HPCC instance and allows
+        logical files to be downloaded from within an event loop.
+        Unlike `Connection` this cannot run ECL scripts. Requests are
+        made through a single keep-alive `aiohttp.ClientSession`,
+        which is created on first use and should be closed with
+        `close()`, or by using the connection as an async context
+        manager.
+
+        Parameters
+        ----------
+        username : str
+            The username to provide to HPCC.
+        server : str, optional
+            The ip address of the HPCC instance in the form
+            `XX.XX.XX.XX`. Neither `http://` nor the port
+            number should be included. 'localhost' by default.
+        port : int, optional
+            The port number ECL Watch is running on on the HPCC
+            instance. 8010 by default.
+        password : str
+            Password to provide to HPCC alongside the username.
+            "password" by default. Note: this cannot be blank.
+        max_concurrency : int, optional
+            Maximum number of requests in flight at once across
+            everything using this connection. 100 by default.
+
+        Attributes
+        ----------
+        username: str
+            The username to provide to HPCC.
+        server: str
+            The ip address of the HPCC instance in the form
+            'XX.XX.XX.XX' or 'localhost'.
+        port: int
+            The port number ECL Watch is running on on the HPCC
+            instance.
+        password: str
+            Password to provide to HPCC alongside the username.
+        max_concurrency: int
+            Maximum number of requests in flight at once.
+
+        Raises
+        ------
+        ImportError:
+            If aiohttp is not installed.
+
+        """
+        if aiohttp is None:
+            raise ImportError("AsyncConnection requires aiohttp, install it "
+                              "with `pip install aiohttp`.")
+        if not isinstance(username, str) or not username:
+            raise AttributeError("username must be a string, not {}".format(
+                username))
+        if not isinstance(password, str) or not password.strip():
+            raise AttributeError("password must be a string, not {}".format(
+                password))
+
+        self.server = server
+        self.username = username
+        self.port = port
+        self.password = password
+        self.max_concurrency = max_concurrency
+
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._session = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    @property
+    def session(self):
+        """
+        Return the connection's `aiohttp.ClientSession`, creating
+        it if required. This must be called from within a running
+        event loop.
+        """
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.max_concurrency)
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                auth=aiohttp.BasicAuth(self.username, self.password))
+        return self._session
+
+    async def close(self):
+        """
+        Close the connection's HTTP session.
+
+        Returns
+        -------
+        None
+        """
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def test_connection(self):
+        """
+        Assert that the `AsyncConnection` can connect to the HPCC
+        instance.
+
+        Returns
+        -------
+        True
+
+        Raises
+        ------
+        aiohttp.ClientResponseError:
+            If the connection fails.
+        """
+        url = "http://{}:{}".format(self.server, self.port)
+        timeout = aiohttp.ClientTimeout(total=5)
+        async with self._semaphore:
+            async with self.session.get(url, timeout=timeout) as r:
+                r.raise_for_status()
+
+        return True
+
+    async def run_url_request(self, url, max_attempts, max_sleep):
+        """
+        Return the JSON contents of a url.
+
+        See `Connection.run_url_request`, the only difference
+        being that the decoded JSON is returned rather than the
+        response as the body must be read before the response is
+        released back to the pool.
+
+        Parameters
+        ----------
+        url: str
+            URL to query.
+        max_attempts: int
+            Maximum number of times url should be queried in the
+            case of an exception being raised.
+        max_sleep: int
+            Maximum time, in seconds, to sleep between attempts.
+            The true sleep time is a random int between `max_sleep`
+            and `max_sleep` * 0.75.
+
+        Returns
+        -------
+        resp: dict
+            Decoded JSON response from `url`.
+
+        Raises
+        ------
+        requests.exceptions.RetryError:
+            If max_attempts is exceeded. Timeouts are retried like
+            any other failed request.
+
+        """
+        min_sleep = int(ceil(max_sleep*0.75))
+        attempts = 0
+        while attempts < max_attempts:
+            try:
+                async with self._semaphore:
+                    async with self.session.get(url) as r:
+                        r.raise_for_status()
+                        return await r.json(content_type=None)
+            except (aiohttp.ClientError, asyncio.TimeoutError,
+                    ValueError) as e:
+                attempts += 1
+                if attempts == max_attempts:
+                    raise RetryError(e)
+                await asyncio.sleep(random.randint(min_sleep, max_sleep))
+
+    async def get_chunk_from_hpcc(self, logical_file, start_row, n_rows,
+                                  max_attempts, max_sleep):
+        """
+        Return the JSON response to a request for a part of a
+        `logical_file`, see `Connection.get_chunk_from_hpcc`.
+
+        Parameters
+        ----------
+        logical_file: str
+            Name of logical file.
+        start_row: int
+            First row to return where 0 is the first row of the
+            dataset.
+        n_rows: int
+            Number of rows to return.
+        max_attempts: int
+            Maximum number of times url should be queried in the
+            case of an exception being raised.
+        max_sleep: int
+            Maximum time, in seconds, to sleep between attempts.
+
+        Returns
+        -------
+        resp: dict
+            JSON formatted response containing rows and all
+            associated metadata.
+        """
+        url = ("http://{}:{}/WsWorkunits/WUResult.json?LogicalName={}"
+               "&Cluster=thor&Start={}&Count={}").format(
+            self.server, self.port, parse.quote_plus(logical_file),
+            start_row, n_rows)
+
+        return await self.run_url_request(url, max_attempts, max_sleep)
+
+    async def get_logical_file_info(self, logical_file, max_attempts,
+                                    max_sleep):
+        """
+        Return the WsDfu details of a logical file, see
+        `Connection.get_logical_file_info`.
+
+        Parameters
+        ----------
+        logical_file: str
+            Name of logical file.
+        max_attempts: int
+            Maximum number of times url should be queried in the
+            case of an exception being raised.
+        max_sleep: int
+            Maximum time, in seconds, to sleep between attempts.
+
+        Returns
+        -------
+        file_detail: dict
+            The "FileDetail" of a DFUInfo response.
+
+        Raises
+        ------
+        KeyError, TypeError:
+            If the response doesn't contain the file's details.
+        """
+        url = "http://{}:{}/WsDfu/DFUInfo.json?Name={}".format(
+            self.server, self.port, parse.quote_plus(logical_file.lstrip("~")))
+
+        resp = await self.run_url_request(url, max_attempts, max_sleep)
+        return resp["DFUInfoResponse"]["FileDetail"]
+
+    async def get_file_metadata(self, logical_file, max_attempts, max_sleep):
+        """
+        Return the schema, row count and record size of a logical
+        file, see `Connection.get_file_metadata`. Unlike
+        `Connection` nothing is cached.
+
+        Parameters
+        ----------
+        logical_file: str
+            Name of logical file.
+        max_attempts: int
+            Maximum number of times url should be queried in the
+            case of an exception being raised.
+        max_sleep: int
+            Maximum time, in seconds, to sleep between attempts.
+
+        Returns
+        -------
+        metadata: hpycc.connection.FileMetadata
+            NamedTuple in the form (schema, num_rows, record_size,
+            modified, file_detail).
+        """
+        try:
+            # The record size only sizes chunks, so as for Connection
+            # a missing DFUInfo isn't worth retrying.
+            info = await self.get_logical_file_info(logical_file, 1, 0)
+        except (RetryError, KeyError, TypeError, ValueError):
+            info = {}
+
+        resp = await self.get_chunk_from_hpcc(logical_file, 0, 1,
+                                              max_attempts, max_sleep)
+        schema, num_rows = parse_wuresult_metadata(resp)
+        return FileMetadata(schema, num_rows, parse_record_size(info),
+                            info.get("Modified"), info)
+
+    async def get_logical_file_chunk(self, logical_file, start_row, n_rows,
+                                     max_attempts, max_sleep):
+        """
+        Return a chunk of a logical file, see
+        `Connection.get_logical_file_chunk`.
+
+        Parameters
+        ----------
+        logical_file: str
+            Name of logical file.
+        start_row: int
+            First row to return where 0 is the first row of the
+            dataset.
+        n_rows: int
+            Number of rows to return.
+        max_attempts: int
+            Maximum number of times url should be queried in the
+            case of an exception being raised.
+        max_sleep: int
+            Maximum time, in seconds, to sleep between attempts.
+
+        Returns
+        -------
+        result_response: dict
+            Rows of logical file as a dict of lists. In the form
+            {"col1": [1, 1, ...], "col2": [2, 2, ...]}.
+
+        """
+        resp = await self.get_chunk_from_hpcc(
+            logical_file, start_row, n_rows, max_attempts, max_sleep)
+
+        try:
+            resp = resp["WUResultResponse"]["Result"]["Row"]
+        except (KeyError, TypeError) as exc:
+            msg = ("json can't be parsed as a WU:\n{}".format(resp))
+            raise type(exc)(msg) from exc
+
+        return {key: [a_dict[key] for a_dict in resp] for key in resp[0]}
+
+
+async def get_thor_file(connection, thor_file, max_workers=10,
+                        chunk_size='auto', max_attempts=3, max_sleep=60,
+                        dtype=None, chunk_bytes=DEFAULT_CHUNK_BYTES):
+    """
+    Return a thor file as a pandas.DataFrame.
+
+    Coroutine version of `hpycc.get_thor_file`. Chunks are requested
+    concurrently, with at most `max_workers` in flight for this file
+    and at most `connection.max_concurrency` in flight across the
+    connection.
+
+    Parameters
+    ----------
+    connection: hpycc.aio.AsyncConnection
+        HPCC AsyncConnection instance.
+    thor_file: str
+        Name of thor file to be downloaded.
+    max_workers: int, optional
+        Maximum number of chunks of this file to request at once.
+        Also used to size chunks if `chunk_size` is 'auto'. 10 by
+        default.
+    chunk_size: int, optional
+        Size of chunks, in rows, to use when downloading file. If
+        auto this is rows / workers, bounded by `chunk_bytes`, see
+        `hpycc.get_thor_file`. 'auto' by default.
+    max_attempts: int, optional
+        Maximum number of times a chunk should attempt to be
+        downloaded in the case of an exception being raised.
+        3 by default.
+    max_sleep: int, optional
+        Maximum time, in seconds, to sleep between attempts.
+        The true sleep time is a random int between `max_sleep` and
+        `max_sleep` * 0.75.
+    dtype: type name or dict of col -> type, optional
+        Data type for data or columns, see `hpycc.get_thor_file`.
+        None by default.
+    chunk_bytes: int, optional
+        Target size, in bytes of records, of each chunk if
+        `chunk_size` is 'auto'. The record size is taken from DFU,
+        or estimated from the schema, so chunks are the same as for
+        `hpycc.get_thor_file`. 16MiB by default.
+
+    Returns
+    -------
+    df: pandas.DataFrame
+        Thor file as a pandas.DataFrame.
+
+    See Also
+    --------
+    hpycc.get_thor_file
+
+    Examples
+    --------
+    >>> import asyncio
+    >>> from hpycc.aio import AsyncConnection, get_thor_file
+    >>> async def main():
+    ...     async with AsyncConnection("user") as conn:
+    ...         return await asyncio.gather(
+    ...             get_thor_file(conn, "example_1"),
+    ...             get_thor_file(conn, "example_2"))
+    >>> asyncio.run(main())
+
+    """
+    metadata = await connection.get_file_metadata(thor_file, max_attempts,
+                                                  max_sleep)
+    schema, num_rows, chunks, _, _ = _plan_download(
+        connection, thor_file, max_workers, chunk_size, max_attempts,
+        max_sleep, dtype, chunk_bytes, metadata)
+
+    if not num_rows:
+        return pd.DataFrame(columns=schema.keys())
+
+    semaphore = asyncio.Semaphore(max_workers)
+
+    async def get_chunk(start_row, n_rows):
+        async with semaphore:
+            return await connection.get_logical_file_chunk(
+                thor_file, start_row, n_rows, max_attempts, max_sleep)
+
+    chunks = list(chunks)
+    results = await asyncio.gather(
+        *[get_chunk(start_row, n_rows) for start_row, n_rows in chunks])
+
+    starts = [start_row for start_row, _ in chunks]
+    return _assemble_thor_file(zip(starts, results), schema, num_rows)
+
+
+async def delete_workunit(connection, wuid, max_attempts=3, max_sleep=15):
+    """
+    Delete a workunit, see `hpycc.delete_workunit`.
+
+    Parameters
+    ----------
+    connection: hpycc.aio.AsyncConnection
+        HPCC AsyncConnection instance.
+    wuid: string
+        Workunit ID
+    max_attempts: int, optional
+        Maximum number of times url should be queried in the
+        case of an exception being raised. 3 by default.
+    max_sleep: int, optional
+        Maximum time, in seconds, to sleep between attempts.
+        The true sleep time is a random int between  `max_sleep` and
+        `max_sleep` * 0.75. 15 by default.
+
+    Returns
+    -------
+    True:
+        If the workunit is deleted successfully.
+
+    Raises
+    ------
+    ValueError:
+        If the workunit could not be deleted.
+
+    """
+    url = (
+        "http://{}:{}/WsWorkunits/WUDelete.json?Wuids={}&"
+        "BlockTillFinishTimer=True").format(
+        connection.server, connection.port, wuid)
+
+    rj = await connection.run_url_request(url, max_attempts, max_sleep)
+    if rj == {"WUDeleteResponse": {}}:
+        return True
+    else:
+        raise ValueError(rj)
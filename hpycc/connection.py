@@ -16,20 +16,30 @@ import collections
 import os
 import random
 import requests
+from requests.adapters import HTTPAdapter
 from requests.exceptions import HTTPError, RetryError
 import subprocess
+import threading
 from tempfile import TemporaryDirectory
-from time import sleep
+from time import monotonic, sleep
 from warnings import warn
 from urllib import parse
 from json import JSONDecodeError
 from simplejson.errors import JSONDecodeError as simpleJSONDecodeError
 from math import ceil
 
-from hpycc.utils.parsers import parse_wuid_from_xml
+from hpycc.utils.cache import (LRUCache, FileCache, fingerprint_repo,
+                               hash_text)
+from hpycc.utils.parsers import (parse_wuid_from_xml, parse_wuresult_metadata,
+                                 parse_record_size)
 from hpycc import delete
 
 
+FileMetadata = collections.namedtuple(
+    "FileMetadata",
+    ["schema", "num_rows", "record_size", "modified", "file_detail"])
+
+
 def check_ecl_cmd(cmd='ecl'):
     """
     Check that executionable is on the system path
@@ -53,7 +63,11 @@ def check_ecl_cmd(cmd='ecl'):
 
 class Connection:
     def __init__(self, username, server="localhost", port=8010, repo=None,
-                 password="password", legacy=False, test_conn=True):
+                 password="password", legacy=False, test_conn=True,
+                 pool_size=15, engine="cli", compile_cache_size=0,
+                 syntax_cache_size=128, syntax_cache_dir=None,
+                 metadata_cache_size=128, metadata_cache_ttl=0,
+                 file_cache_dir=None, file_cache_max_bytes=2 ** 30):
         """
         Connection to a HPCC instance.
 
@@ -86,6 +100,59 @@ class Connection:
         test_conn : bool, optional
             Test connection to the server on initialisation.
             True by default.
+        pool_size : int, optional
+            Maximum number of keep-alive HTTP connections to hold
+            open to ECL Watch, and so of concurrent requests, as
+            further requests wait for a free connection. Functions
+            taking `max_workers` grow the pool to `max_workers` if
+            it is larger, so this only caps requests made from the
+            caller's own threads. 15 by default.
+        engine : str, optional
+            How ECL scripts are executed. "cli" runs them with the
+            `ecl` command line client. "esp" submits them straight
+            to the WsWorkunits service of ECL Watch, avoiding a
+            process spawn and local compile for every script. As the
+            ESP compiles scripts on the cluster, scripts are still
+            run with the command line client if `repo` or `legacy`
+            are set. "cli" by default.
+        compile_cache_size : int, optional
+            Number of compiled workunits to keep for reuse. If
+            greater than 0, each distinct script is compiled once and
+            later runs of it, with any `stored` values, clone and run
+            the compiled workunit instead. Scripts are matched on
+            their text, the files in `repo` and `legacy`. Compiled
+            workunits evicted to make room, or which fail to run,
+            are deleted, the rest by `clear_compile_cache`. 0, no
+            caching, by default.
+        syntax_cache_size : int, optional
+            Number of passed syntax checks to remember. A script
+            whose text, `repo` files and `legacy` flag match one
+            which has already passed is not checked again. 0 disables
+            the cache. 128 by default.
+        syntax_cache_dir : str, optional
+            Directory in which to also record passed syntax checks,
+            so they are remembered across connections and processes.
+            None, memory only, by default.
+        metadata_cache_size : int, optional
+            Number of logical files whose metadata (schema, row count
+            and record size) is remembered, see
+            `get_file_metadata`. 0 disables the cache. 128 by
+            default.
+        metadata_cache_ttl : float, optional
+            Number of seconds remembered metadata is used without
+            checking that the logical file is unchanged. After this,
+            it is still reused if the file's modification time has
+            not changed. 0, always check, by default.
+        file_cache_dir : str, optional
+            Directory in which to keep copies of logical files
+            downloaded with `get_thor_file`, as Arrow IPC files.
+            Later downloads of a file whose DFU modification time and
+            row count are unchanged are read from here instead.
+            Requires pyarrow. None, no caching, by default.
+        file_cache_max_bytes : int, optional
+            Maximum total size, in bytes, of the files kept in
+            `file_cache_dir`. The least recently used are deleted
+            to stay within it. 1GiB by default.
 
         Attributes
         ----------
@@ -107,6 +174,32 @@ class Connection:
         legacy: bool
             If the legacy flag is enabled when executing ECL
             commands.
+        pool_size: int
+            Minimum number of keep-alive HTTP connections to hold
+            open to ECL Watch.
+        engine: str
+            How ECL scripts are executed, either "cli" or "esp".
+        compile_cache_size: int
+            Number of compiled workunits to keep for reuse.
+        syntax_cache_size: int
+            Number of passed syntax checks to remember.
+        syntax_cache_dir: str or None
+            Directory in which passed syntax checks are recorded.
+        metadata_cache_size: int
+            Number of logical files whose metadata is remembered.
+        metadata_cache_ttl: float
+            Number of seconds remembered metadata is used without
+            checking that the logical file is unchanged.
+        file_cache_dir: str or None
+            Directory in which copies of logical files are kept.
+        file_cache_max_bytes: int
+            Maximum total size, in bytes, of the kept files.
+
+        Raises
+        ------
+        ImportError:
+            If `file_cache_dir` is given and pyarrow is not
+            installed.
 
         """
         if not isinstance(username, str) or not username:
@@ -115,6 +208,9 @@ class Connection:
         if not isinstance(password, str) or not password.strip():
             raise AttributeError("password must be a string, not {}".format(
                 password))
+        if engine not in ("cli", "esp"):
+            raise AttributeError("engine must be 'cli' or 'esp', not {}".format(
+                engine))
 
         self.server = server
         self.username = username
@@ -122,6 +218,23 @@ class Connection:
         self.repo = repo
         self.password = password
         self.legacy = legacy
+        self.pool_size = pool_size
+        self.engine = engine
+        self.compile_cache_size = compile_cache_size
+        self._compile_cache = LRUCache(
+            compile_cache_size, on_evict=self._delete_compiled_workunit)
+        self.syntax_cache_size = syntax_cache_size
+        self.syntax_cache_dir = syntax_cache_dir
+        self._syntax_cache = LRUCache(syntax_cache_size)
+        self.metadata_cache_size = metadata_cache_size
+        self.metadata_cache_ttl = metadata_cache_ttl
+        self._metadata_cache = LRUCache(metadata_cache_size)
+        self.file_cache_dir = file_cache_dir
+        self.file_cache_max_bytes = file_cache_max_bytes
+        self._file_cache = (FileCache(file_cache_dir, file_cache_max_bytes)
+                            if file_cache_dir else None)
+
+        self._init_pool()
 
         if test_conn:
             self.test_connection()
@@ -129,6 +242,67 @@ class Connection:
         check_ecl_cmd('ecl')
         check_ecl_cmd('eclcc')
 
+    def _init_pool(self):
+        # A single adapter (and so a single urllib3 connection pool) is
+        # shared by every thread, each of which gets its own light
+        # weight Session as Sessions themselves are not thread safe.
+        # The adapter is created on first use, and replaced by a
+        # larger one if more workers need connections.
+        self._adapter = None
+        self._pool_maxsize = self.pool_size
+        self._adapter_lock = threading.Lock()
+        self._local = threading.local()
+
+    def __getstate__(self):
+        # Pooled connections, locks and sessions belong to this
+        # process, so a copy opens its own.
+        state = self.__dict__.copy()
+        for name in ("_adapter", "_adapter_lock", "_local",
+                     "_pool_maxsize"):
+            del state[name]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._init_pool()
+
+    def _get_adapter(self):
+        """
+        Return the `HTTPAdapter` shared by this connection's sessions,
+        creating it on first use.
+        """
+        with self._adapter_lock:
+            if self._adapter is None:
+                self._adapter = HTTPAdapter(pool_connections=1,
+                                            pool_maxsize=self._pool_maxsize,
+                                            pool_block=True)
+            return self._adapter
+
+    def _reserve_pool(self, max_workers):
+        """
+        Grow the connection pool to at least `max_workers`
+        connections, so that `max_workers` threads can make requests
+        at once rather than waiting on `pool_size` connections.
+
+        Sessions move to the larger pool on their next request. The
+        old pool isn't closed, as threads may be waiting on it, and
+        is released once no session uses it.
+
+        Parameters
+        ----------
+        max_workers: int
+            Number of threads which will make requests at once.
+
+        Returns
+        -------
+        None
+        """
+        with self._adapter_lock:
+            if max_workers <= self._pool_maxsize:
+                return
+            self._pool_maxsize = max_workers
+            self._adapter = None
+
     def test_connection(self):
         """
         Assert that the `Connection` can connect to the HPCC
@@ -148,13 +322,53 @@ class Connection:
             If the connection fails, the relevant exception is
             raised.
         """
-        r = requests.get("http://{}:{}".format(self.server, self.port),
-                         auth=(self.username, self.password),
-                         timeout=5)
+        r = self.session.get("http://{}:{}".format(self.server, self.port),
+                             auth=(self.username, self.password),
+                             timeout=5)
         r.raise_for_status()
 
         return True
 
+    @property
+    def session(self):
+        """
+        Return this thread's `requests.Session` for ECL Watch.
+
+        Sessions are created lazily, one per thread, but all of them
+        share the connection's `HTTPAdapter`. Keep-alive connections
+        are therefore reused across threads and across calls, so
+        each request avoids a fresh TCP handshake.
+
+        Returns
+        -------
+        session: requests.Session
+            Session using the connection's pooled adapter.
+        """
+        adapter = self._get_adapter()
+        session = getattr(self._local, "session", None)
+        if session is None or self._local.adapter is not adapter:
+            session = requests.Session()
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            self._local.session = session
+            self._local.adapter = adapter
+        return session
+
+    def close(self):
+        """
+        Close all pooled HTTP connections to ECL Watch.
+
+        The connection can still be used afterwards, new HTTP
+        connections are opened as required.
+
+        Returns
+        -------
+        None
+        """
+        with self._adapter_lock:
+            if self._adapter is not None:
+                self._adapter.close()
+
     @staticmethod
     def _run_command(cmd):
         """
@@ -183,8 +397,13 @@ class Connection:
         Uses eclcc to run a syntax check on `script`. If the syntax
         check fails, ie. an error is present, a SyntaxError
         will be raised.
-        Note that this requires that `eclcc.exe` is on the path.
-        Attributes `legacy` and `repo` are also used.
+        Note that this requires that `eclcc.exe` is on the path,
+        unless `engine` is "esp", in which case the script is
+        checked by the WsWorkunits service instead.
+        Attributes `legacy` and `repo` are also used. Passed checks
+        are remembered, see `syntax_cache_size` and
+        `syntax_cache_dir`, so an unchanged script is only checked
+        once.
 
         Parameters
         ----------
@@ -201,14 +420,83 @@ class Connection:
             If the script fails the syntax check.
 
         """
-        b = ["eclcc", "-syntax"]
-        b += self._legacy_arg
-        b += self._repo_arg
-        b += [script]
+        key = self._syntax_key(script)
+        if key is not None and self._syntax_passed(key):
+            return
+
+        if self._use_esp:
+            self._check_syntax_esp(script)
+        else:
+            b = ["eclcc", "-syntax"]
+            b += self._legacy_arg
+            b += self._repo_arg
+            b += [script]
+            try:
+                self._run_command(b)
+            except subprocess.SubprocessError as e:
+                raise SyntaxError(e)
+
+        if key is not None:
+            self._record_syntax_pass(key)
+
+    def _check_syntax_esp(self, script):
+        """
+        Run an ECL syntax check on an ECL script with the
+        WsWorkunits WUSyntaxCheckECL method, raising a SyntaxError
+        if it reports any errors. Warnings are ignored, as they are
+        by eclcc.
+        """
+        with open(script, "r", encoding="utf-8") as file:
+            query_text = file.read()
+
+        rj = self._run_esp_method("WUSyntaxCheckECL", {
+            "ECL": query_text, "Cluster": "thor"})
+        errors = (rj.get("Errors") or {}).get("ECLException") or []
+        errors = [e for e in errors
+                  if e.get("Severity") in ("Error", "Fatal")]
+        if errors:
+            raise SyntaxError("\n".join(
+                "{}({},{}): {}".format(script, e.get("LineNo"),
+                                       e.get("Column"), e.get("Message"))
+                for e in errors))
+
+    def _syntax_key(self, script):
+        """
+        Return the syntax cache key of an ECL script, or None if the
+        cache is disabled or the script can't be read.
+        """
+        if not self.syntax_cache_size and not self.syntax_cache_dir:
+            return None
         try:
-            self._run_command(b)
-        except subprocess.SubprocessError as e:
-            raise SyntaxError(e)
+            with open(script, "r", encoding="utf-8") as file:
+                query_text = file.read()
+        except (OSError, UnicodeDecodeError):
+            return None
+        return hash_text(query_text, fingerprint_repo(self.repo),
+                         str(bool(self.legacy)))
+
+    def _syntax_passed(self, key):
+        """
+        Return True if a script with syntax cache key `key` has
+        already passed a syntax check.
+        """
+        if self._syntax_cache.get(key):
+            return True
+        if self.syntax_cache_dir and os.path.isfile(
+                os.path.join(self.syntax_cache_dir, key)):
+            self._syntax_cache.set(key, True)
+            return True
+        return False
+
+    def _record_syntax_pass(self, key):
+        """
+        Remember that a script with syntax cache key `key` passed a
+        syntax check.
+        """
+        self._syntax_cache.set(key, True)
+        if self.syntax_cache_dir:
+            os.makedirs(self.syntax_cache_dir, exist_ok=True)
+            open(os.path.join(self.syntax_cache_dir, key), "w").close()
 
     @property
     def _repo_arg(self):
@@ -233,7 +521,9 @@ class Connection:
         `server`:`port`, using the credentials `username` and
         `password`. If `syntax_check`, run a syntax
         check before execution. Attributes `legacy` and `repo` are
-        also used.
+        also used. The script is run with the `ecl` command line
+        client unless `engine` is "esp", in which case it is
+        submitted to WsWorkunits directly.
 
         Parameters
         ----------
@@ -283,19 +573,317 @@ class Connection:
         if syntax_check:
             self.check_syntax(script)
 
-        try:
-            result = self._run_command(base_cmd)
+        if self.compile_cache_size:
+            result = self._run_ecl_script_cached(script, stored)
+        elif self._use_esp:
+            result = self._run_ecl_script_esp(script, stored)
+        else:
+            try:
+                result = self._run_command(base_cmd)
 
-        except subprocess.SubprocessError as e:
-            msg = "Failed to run ecl command"
-            raise subprocess.SubprocessError(msg) from e
+            except subprocess.SubprocessError as e:
+                msg = "Failed to run ecl command"
+                raise subprocess.SubprocessError(msg) from e
 
         if delete_workunit:
             wuid = parse_wuid_from_xml(result.stdout)
             delete.delete_workunit(self, wuid)
         return result
 
-    def run_url_request(self, url, max_attempts, max_sleep):
+    @property
+    def _use_esp(self):
+        # Imports from a repo and the legacy flag need a local eclcc.
+        return (self.engine == "esp" and not self._repo_arg
+                and not self._legacy_arg)
+
+    def _run_esp_method(self, method, params, max_attempts=3, max_sleep=5):
+        """
+        Call a WsWorkunits method and return its JSON response.
+
+        Parameters
+        ----------
+        method: str
+            Name of the WsWorkunits method, e.g. "WUSubmit".
+        params: dict
+            Form parameters of the request. These are POSTed so may
+            be arbitrarily large.
+        max_attempts: int, optional
+            Maximum number of times the method should be called in
+            the case of an exception being raised. 3 by default.
+        max_sleep: int, optional
+            Maximum time, in seconds, to sleep between attempts. 5
+            by default.
+
+        Returns
+        -------
+        rj: dict
+            The response of the method, without its outer
+            "<method>Response" key.
+
+        Raises
+        ------
+        ValueError:
+            If the ESP reports an exception.
+        """
+        url = "http://{}:{}/WsWorkunits/{}.json".format(
+            self.server, self.port, method)
+        r = self.run_url_request(url, max_attempts, max_sleep, data=params)
+        rj = r.json()
+        if "Exceptions" in rj:
+            raise ValueError(rj)
+        rj = next(iter(rj.values()), {})
+        if "Exceptions" in rj:
+            raise ValueError(rj)
+        return rj
+
+    def _run_ecl_script_esp(self, script, stored):
+        """
+        Run an ECL script through WsWorkunits and return output in
+        the same form as `ecl run`.
+
+        The workunit is created, compiled on the cluster and then
+        run with WURun, which takes the stored values and returns
+        the results.
+
+        Parameters
+        ----------
+        script: str
+            path to ECL script.
+        stored : dict or None
+            Key value pairs to replace stored variables within the
+            script.
+
+        Returns
+        -------
+        result: namedtuple
+            NamedTuple in the form (stdout, stderr).
+
+        Raises
+        ------
+        subprocess.SubprocessError:
+            If the workunit fails to compile or run.
+        """
+        try:
+            wuid = self._compile_workunit_esp(script)
+            return self._run_compiled_workunit(wuid, stored, clone=False)
+        except (KeyError, TypeError, ValueError, RetryError) as e:
+            msg = "Failed to run ECL through WsWorkunits"
+            raise subprocess.SubprocessError(msg) from e
+
+    def _compile_workunit_esp(self, script):
+        """
+        Create a workunit from an ECL script and compile it on the
+        cluster, without running it.
+
+        Parameters
+        ----------
+        script: str
+            path to ECL script.
+
+        Returns
+        -------
+        wuid: str
+            Workunit ID of the compiled workunit.
+
+        Raises
+        ------
+        ValueError:
+            If the workunit fails to compile.
+        """
+        with open(script, "r", encoding="utf-8") as file:
+            query_text = file.read()
+
+        wu = self._run_esp_method("WUCreateAndUpdate", {
+            "QueryText": query_text,
+            "Jobname": os.path.basename(script),
+            "Action": 1,  # WUActionCompile
+            "ActionEx": "compile"
+        }, max_attempts=1)
+        wuid = wu["Workunit"]["Wuid"]
+
+        self._run_esp_method("WUSubmit", {"Wuid": wuid, "Cluster": "thor"},
+                             max_attempts=1)
+        compiled = self._run_esp_method("WUWaitCompiled", {
+            "Wuid": wuid, "Wait": -1, "ReturnOnWait": 1})
+        if compiled.get("StateID") not in (1, 3):  # compiled, completed
+            raise ValueError("Workunit {} failed to compile: {}".format(
+                wuid, compiled))
+
+        return wuid
+
+    def _compile_workunit_cli(self, script):
+        """
+        Compile an ECL script locally with `ecl deploy`, without
+        running it.
+
+        Parameters
+        ----------
+        script: str
+            path to ECL script.
+
+        Returns
+        -------
+        wuid: str
+            Workunit ID of the compiled workunit.
+
+        Raises
+        ------
+        subprocess.SubprocessError:
+            If the script fails to compile or deploy.
+        """
+        base_cmd = ['ecl', 'deploy', '-v', '--server={}'.format(self.server),
+                    '--port={}'.format(self.port),
+                    '--username={}'.format(self.username),
+                    '--password={}'.format(self.password)]
+        base_cmd += self._legacy_arg
+        base_cmd += ['thor', script]
+        base_cmd += self._repo_arg
+
+        result = self._run_command(base_cmd)
+        return parse_wuid_from_xml(result.stdout)
+
+    def _compile_key(self, script):
+        """
+        Return the compile cache key of an ECL script.
+        """
+        with open(script, "r", encoding="utf-8") as file:
+            query_text = file.read()
+        return hash_text(query_text, fingerprint_repo(self.repo),
+                         str(bool(self.legacy)), self.engine)
+
+    def _run_ecl_script_cached(self, script, stored):
+        """
+        Run an ECL script by cloning a previously compiled workunit
+        of it, compiling and caching one first if required.
+
+        Parameters
+        ----------
+        script: str
+            path to ECL script.
+        stored : dict or None
+            Key value pairs to replace stored variables within the
+            script.
+
+        Returns
+        -------
+        result: namedtuple
+            NamedTuple in the form (stdout, stderr).
+
+        Raises
+        ------
+        subprocess.SubprocessError:
+            If the workunit fails to compile or run.
+        """
+        key = self._compile_key(script)
+        try:
+            wuid = self._compile_cache.get(key)
+            if wuid is None:
+                if self._use_esp:
+                    wuid = self._compile_workunit_esp(script)
+                else:
+                    wuid = self._compile_workunit_cli(script)
+                self._compile_cache.set(key, wuid)
+            return self._run_compiled_workunit(wuid, stored, clone=True)
+        except (KeyError, TypeError, ValueError, RetryError,
+                subprocess.SubprocessError) as e:
+            # The cached workunit may have been deleted or archived,
+            # compile it again next time.
+            wuid = self._compile_cache.pop(key)
+            if wuid is not None:
+                self._delete_compiled_workunit(key, wuid)
+            msg = "Failed to run compiled ECL workunit"
+            raise subprocess.SubprocessError(msg) from e
+
+    def _delete_compiled_workunit(self, key, wuid):
+        """
+        Delete a compiled workunit which is no longer cached under
+        `key`. A failure is only warned about, as the workunit may
+        already have been deleted or archived.
+        """
+        try:
+            delete.delete_workunit(self, wuid)
+        except (ValueError, RetryError) as e:
+            warn("Failed to delete compiled workunit {}: {}".format(wuid, e))
+
+    def clear_compile_cache(self, delete_workunits=True):
+        """
+        Forget all compiled workunits held for reuse.
+
+        Parameters
+        ----------
+        delete_workunits: bool, optional
+            Delete the compiled workunits from the HPCC instance.
+            True by default.
+
+        Returns
+        -------
+        None
+        """
+        wuids = self._compile_cache.values()
+        self._compile_cache.clear()
+        if delete_workunits:
+            for wuid in wuids:
+                delete.delete_workunit(self, wuid)
+
+    def clear_file_cache(self):
+        """
+        Delete all logical files kept in `file_cache_dir`.
+
+        Returns
+        -------
+        None
+        """
+        if self._file_cache is not None:
+            self._file_cache.clear()
+
+    def _run_compiled_workunit(self, wuid, stored, clone):
+        """
+        Run a compiled workunit with WURun and return output in the
+        same form as `ecl run`.
+
+        Parameters
+        ----------
+        wuid: str
+            Workunit ID of a compiled workunit.
+        stored : dict or None
+            Key value pairs to replace stored variables within the
+            workunit.
+        clone: bool
+            Run a copy of the workunit, leaving `wuid` itself
+            compiled and ready to run again.
+
+        Returns
+        -------
+        result: namedtuple
+            NamedTuple in the form (stdout, stderr). stdout starts
+            with the WUID and state of the workunit which was run.
+
+        Raises
+        ------
+        ValueError:
+            If the workunit does not complete.
+        """
+        params = {"Wuid": wuid, "Cluster": "thor", "Wait": -1,
+                  "CloneWorkunit": int(clone)}
+        stored = stored or {}
+        for i, (key, value) in enumerate(stored.items()):
+            params["Variables.NamedValue.{}.Name".format(i)] = key
+            params["Variables.NamedValue.{}.Value".format(i)] = value
+        params["Variables.NamedValue.itemcount"] = len(stored)
+
+        run = self._run_esp_method("WURun", params, max_attempts=1)
+        wuid, state = run["Wuid"], run.get("State", "")
+        if state != "completed":
+            raise ValueError("Workunit {} finished in state {}: {}".format(
+                wuid, state, run))
+
+        stdout = "wuid: {}   state: {}\r\n{}".format(
+            wuid, state, run.get("Results", ""))
+        Result = collections.namedtuple("Result", ["stdout", "stderr"])
+        return Result(stdout, "")
+
+    def run_url_request(self, url, max_attempts, max_sleep, data=None,
+                        files=None, headers=None):
         """
         Return the contents of a url.
 
@@ -303,7 +891,8 @@ class Connection:
         contents of `url`. Parameter `max_attempts` can be used to
         retry if an exception is raised. Each attempt is delayed by
         up to `max_sleep` seconds, so a large number of retries may
-        be slow.
+        be slow. If `data` or `files` are given they are POSTed to
+        `url`, otherwise a GET request is made.
 
         Parameters
         ----------
@@ -316,6 +905,16 @@ class Connection:
             Maximum time, in seconds, to sleep between attempts.
             The true sleep time is a random int between  `max_sleep` and
             `max_sleep` * 0.75.
+        data: dict or file, optional
+            Form data to POST to `url`, or an open file to stream as
+            the body of the request, which is rewound before each
+            attempt. None by default.
+        files: dict, optional
+            Files to POST to `url` as multipart/form-data, in the
+            form {field: (file_name, content)}. None by default.
+        headers: dict, optional
+            Extra HTTP headers to send, e.g. the Content-Type of a
+            file `data`. None by default.
 
         Returns
         -------
@@ -332,7 +931,15 @@ class Connection:
         attempts = 0
         while attempts < max_attempts:
             try:
-                r = requests.get(url, auth=(self.username, self.password))
+                if data is None and files is None:
+                    r = self.session.get(url, auth=(self.username,
+                                                    self.password))
+                else:
+                    if hasattr(data, "seek"):
+                        data.seek(0)
+                    r = self.session.post(url, data=data, files=files,
+                                          headers=headers,
+                                          auth=(self.username, self.password))
                 r.raise_for_status()
                 return r
             except (HTTPError, ValueError) as e:
@@ -387,6 +994,121 @@ class Connection:
 
         return resp
 
+    def get_logical_file_info(self, logical_file, max_attempts, max_sleep):
+        """
+        Return the WsDfu details of a logical file.
+
+        Parameters
+        ----------
+        logical_file: str
+            Name of logical file.
+        max_attempts: int
+            Maximum number of times url should be queried in the
+            case of an exception being raised.
+        max_sleep: int
+            Maximum time, in seconds, to sleep between attempts.
+            The true sleep time is a random int between `max_sleep` and
+            `max_sleep` * 0.75.
+
+        Returns
+        -------
+        file_detail: dict
+            The "FileDetail" of a DFUInfo response. This includes
+            the file's "Modified" time, "RecordSize", "RecordCount"
+            and "Ecl" record definition.
+
+        Raises
+        ------
+        KeyError, TypeError:
+            If the response doesn't contain the file's details, for
+            example if the file does not exist.
+        """
+        url = "http://{}:{}/WsDfu/DFUInfo.json?Name={}".format(
+            self.server, self.port, parse.quote_plus(logical_file.lstrip("~")))
+
+        resp = self.run_url_request(url, max_attempts, max_sleep)
+        try:
+            resp = resp.json()
+        except (JSONDecodeError, simpleJSONDecodeError) as exc:
+            msg = ("response can't be parsed as JSON:\n{}".format(resp))
+            raise type(exc)(msg, exc.doc, exc.pos) from exc
+
+        try:
+            return resp["DFUInfoResponse"]["FileDetail"]
+        except (KeyError, TypeError) as exc:
+            msg = ("json can't be parsed as DFUInfo:\n{}".format(resp))
+            raise type(exc)(msg) from exc
+
+    def get_file_metadata(self, logical_file, max_attempts, max_sleep):
+        """
+        Return the schema, row count and record size of a logical
+        file.
+
+        Metadata is remembered, see `metadata_cache_size`. It is
+        reused without any requests for `metadata_cache_ttl` seconds,
+        and after that for as long as the file's DFU modification
+        time is unchanged, so only a single cheap DFUInfo request is
+        made. `spray_file` and `delete_logical_file` forget the
+        metadata of the file they write or delete.
+
+        Parameters
+        ----------
+        logical_file: str
+            Name of logical file.
+        max_attempts: int
+            Maximum number of times url should be queried in the
+            case of an exception being raised.
+        max_sleep: int
+            Maximum time, in seconds, to sleep between attempts.
+            The true sleep time is a random int between `max_sleep` and
+            `max_sleep` * 0.75.
+
+        Returns
+        -------
+        metadata: FileMetadata
+            NamedTuple in the form (schema, num_rows, record_size,
+            modified, file_detail), where `file_detail` is as
+            returned by `get_logical_file_info`. `schema` and
+            `file_detail` are shared with the cache so must not be
+            modified. `record_size` and `modified` are None, and
+            `file_detail` is empty, if DFUInfo doesn't give them.
+
+        """
+        cached = self._metadata_cache.get(logical_file)
+        now = monotonic()
+        if cached and now - cached[1] <= self.metadata_cache_ttl:
+            return cached[0]
+
+        try:
+            # A missing DFUInfo only stops the cache from being used, so
+            # it isn't worth retrying.
+            info = self.get_logical_file_info(logical_file, 1, 0)
+        except (RetryError, KeyError, TypeError, ValueError):
+            info = {}
+        modified = info.get("Modified")
+
+        if cached and modified and cached[0].modified == modified:
+            metadata = cached[0]
+        else:
+            resp = self.get_chunk_from_hpcc(logical_file, 0, 1, max_attempts,
+                                            max_sleep)
+            schema, num_rows = parse_wuresult_metadata(resp)
+            metadata = FileMetadata(schema, num_rows, parse_record_size(info),
+                                    modified, info)
+
+        self._metadata_cache.set(logical_file, (metadata, now))
+        return metadata
+
+    def _forget_file_metadata(self, logical_file):
+        """
+        Remove any remembered metadata of a logical file, with or
+        without its leading "~", after it has been written to or
+        deleted through this connection.
+        """
+        name = logical_file.lstrip("~")
+        self._metadata_cache.pop(name)
+        self._metadata_cache.pop("~" + name)
+
     def get_logical_file_chunk(self, logical_file, start_row, n_rows,
                                max_attempts, max_sleep):
         """
@@ -474,7 +1196,7 @@ class Connection:
         """
         with TemporaryDirectory() as d:
             p = os.path.join(d, "ecl_string.ecl")
-            with open(p, "w+") as file:
+            with open(p, "w+", encoding="utf-8") as file:
                 file.write(string)
 
             r = self.run_ecl_script(p, syntax_check, delete_workunit, stored)
@@ -30,8 +30,11 @@ def delete_logical_file(connection, logical_file, delete_workunit=True):
     script = "IMPORT std; STD.File.DeleteLogicalFile('{}');".format(
         logical_file)
 
-    connection.run_ecl_string(script, True, delete_workunit=delete_workunit,
-                              stored={})
+    try:
+        connection.run_ecl_string(script, True,
+                                  delete_workunit=delete_workunit, stored={})
+    finally:
+        connection._forget_file_metadata(logical_file)
 
 
 def delete_workunit(connection, wuid, max_attempts=3, max_sleep=15):
@@ -10,21 +10,44 @@ Functions
 - `get_output` -- Return the first output of an ECL script.
 - `get_outputs` -- Return all outputs of an ECL script.
 - `get_thor_file` -- Return the contents of a thor file.
+- `iter_thor_file` -- Yield the contents of a thor file in chunks.
+- `get_rows` -- Return given rows of a thor file.
 
 """
-__all__ = ["get_output", "get_outputs", "get_thor_file"]
+__all__ = ["get_output", "get_outputs", "get_thor_file", "iter_thor_file",
+           "get_rows"]
 
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 import re
 import warnings
+import numpy as np
 import pandas as pd
 from hpycc.utils import filechunker
-from hpycc.utils.parsers import parse_xml, parse_schema_from_xml, apply_custom_dtypes
+from hpycc.delete import delete_logical_file
+from hpycc.utils.cache import hash_text
+from hpycc.utils.pushdown import (pushdown_script, compile_where,
+                                   temp_logical_file)
+from hpycc.utils.resume import ChunkStore
+from copy import deepcopy
+from hpycc.utils.parsers import (parse_xml, parse_xml_to_arrow,
+                                  apply_custom_dtypes, to_arrow_array,
+                                  arrow_type)
 from math import ceil
+from time import monotonic
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+DEFAULT_CHUNK_BYTES = 16 * 2 ** 20
+MAX_CHUNK_ROWS = 1000000
+SAMPLE_RUNS_PER_WORKER = 4
 
 
 def get_output(connection, script, syntax_check=True, delete_workunit=True,
-               stored=None):
+               stored=None, output="pandas"):
     """
     Return the first output of an ECL script as a pandas.DataFrame.
 
@@ -48,16 +71,24 @@ def get_output(connection, script, syntax_check=True, delete_workunit=True,
     stored : dict or None, optional
         Key value pairs to replace stored variables within the
         script. Values should be str, int or bool. None by default.
+    output: {"pandas", "arrow"}, optional
+        Type of output to return. If "arrow", a pyarrow.Table is
+        built directly from the result without going through pandas;
+        this requires pyarrow. "pandas" by default.
 
 
     Returns
     -------
-    pandas.DataFrame of the first output of `script`.
+    pandas.DataFrame (or pyarrow.Table) of the first output of `script`.
 
     Raises
     ------
     SyntaxError:
         If script fails syntax check.
+    ValueError:
+        If `output` is not "pandas" or "arrow".
+    ImportError:
+        If `output` is "arrow" and pyarrow is not installed.
 
     See Also
     --------
@@ -107,19 +138,40 @@ def get_output(connection, script, syntax_check=True, delete_workunit=True,
     Index: []
 
     """
+    _check_output(output)
 
     result = connection.run_ecl_script(script, syntax_check, delete_workunit,
                                        stored)
-    result = result.stdout.replace("\r\n", "")
+    return _parse_first_output(result.stdout, output)
+
+
+def _parse_first_output(stdout, output="pandas"):
+    """
+    Return the first dataset in the output of an ECL workunit, see
+    `get_output`.
+
+    Parameters
+    ----------
+    stdout: str
+        Output of `Connection.run_ecl_script`.
+    output: {"pandas", "arrow"}, optional
+        Type of output to return. "pandas" by default.
+
+    Returns
+    -------
+    pandas.DataFrame (or pyarrow.Table) of the first output.
+    """
+    parse = parse_xml_to_arrow if output == "arrow" else parse_xml
+    result = stdout.replace("\r\n", "")
 
     regex = "<Dataset name='(?P<name>.+?)'>(?P<content>.+?)</Dataset>"
     match = re.search(regex, result)
     warn_msg = "The output does not appear to contain a dataset. Returning an empty DataFrame."
     try:
         match_content = match.group()
-        parsed = parse_xml(match_content)
+        parsed = parse(match_content)
     except AttributeError:
-        parsed = pd.DataFrame()
+        parsed = pa.table({}) if output == "arrow" else pd.DataFrame()
 
     if len(parsed) == 0:
         warnings.warn(warn_msg)
@@ -128,7 +180,7 @@ def get_output(connection, script, syntax_check=True, delete_workunit=True,
 
 
 def get_outputs(connection, script, syntax_check=True, delete_workunit=True,
-                stored=None):
+                stored=None, output="pandas"):
     """
     Return all outputs of an ECL script.
 
@@ -150,17 +202,26 @@ def get_outputs(connection, script, syntax_check=True, delete_workunit=True,
     stored : dict or None, optional
         Key value pairs to replace stored variables within the
         script. Values should be str, int or bool. None by default.
+    output: {"pandas", "arrow"}, optional
+        Type of output to return. If "arrow", a pyarrow.Table is
+        built directly from the result without going through pandas;
+        this requires pyarrow. "pandas" by default.
 
     Returns
     -------
     as_dict: dict of pandas.DataFrames
         Outputs of `script` in the form
-        {output_name: pandas.DataFrame}
+        {output_name: pandas.DataFrame}, or pyarrow.Tables if
+        `output` is "arrow".
 
     Raises
     ------
     SyntaxError:
         If script fails syntax check.
+    ValueError:
+        If `output` is not "pandas" or "arrow".
+    ImportError:
+        If `output` is "arrow" and pyarrow is not installed.
 
     See Also
     --------
@@ -228,6 +289,9 @@ def get_outputs(connection, script, syntax_check=True, delete_workunit=True,
     }
 
     """
+    _check_output(output)
+    parse = parse_xml_to_arrow if output == "arrow" else parse_xml
+
     result = connection.run_ecl_script(script, syntax_check, delete_workunit,
                                        stored)
     regex = "<Dataset name='(?P<name>.+?)'>(?P<content>.*?)</Dataset>"
@@ -238,18 +302,23 @@ def get_outputs(connection, script, syntax_check=True, delete_workunit=True,
         warnings.warn(
             "One or more of the outputs do not appear to contain a dataset. "
             "They have been replaced with an empty DataFrame")
-    as_dict = {name.replace(" ", "_"): parse_xml(xml) for name, xml in results}
+    as_dict = {name.replace(" ", "_"): parse(xml) for name, xml in results}
 
     return as_dict
 
 
 def get_thor_file(connection, thor_file, max_workers=10, chunk_size='auto', max_attempts=3,
-                  max_sleep=60, dtype=None):
+                  max_sleep=60, dtype=None, chunk_bytes=DEFAULT_CHUNK_BYTES,
+                  output="pandas", resume_dir=None, columns=None,
+                  where=None, limit=None, sample=None, fraction=None,
+                  random_state=None):
     """
-    Return a thor file as a pandas.DataFrame.
+    Return a thor file as a pandas.DataFrame or pyarrow.Table.
 
-    Note: Ordering of the resulting DataFrame is
-    not deterministic and may not be the same as on the HPCC cluster.
+    Rows are returned in the order they are stored on the HPCC
+    cluster. If the connection has a `file_cache_dir` and the file
+    is unchanged since it was last downloaded with the same `dtype`
+    and `output`, it is read from there instead.
 
     Parameters
     ----------
@@ -260,10 +329,15 @@ def get_thor_file(connection, thor_file, max_workers=10, chunk_size='auto', max_
     max_workers: int, optional
         Number of concurrent threads to use when downloading file.
         Warning: too many may cause instability! 10 by default.
-    chunk_size: int, optional
-        Size of chunks to use when downloading file. If auto
-        this is rows / workers (bounded between 100,000 and
-        400,000). If give then no limits are enforced.
+    chunk_size: int, 'auto' or filechunker.AdaptiveChunker, optional
+        Size of chunks, in rows, to use when downloading file. If
+        auto this is rows / workers, bounded so that no chunk holds
+        more than `chunk_bytes` of records. Small files are not
+        chunked. If given then no limits are enforced. If an
+        `AdaptiveChunker`, chunk size and the number of chunks in
+        flight (up to `max_workers`) are tuned while downloading,
+        and the settled values can be read from it afterwards.
+        'auto' by default.
     max_attempts: int, optional
         Maximum number of times a chunk should attempt to be
         downloaded in the case of an exception being raised.
@@ -278,11 +352,81 @@ def get_thor_file(connection, thor_file, max_workers=10, chunk_size='auto', max_
         INSTEAD of dtype conversion. If None, or columns are missing
         from the provided dict, they will be converted to one of
         bool, str or int based on the HPCC datatype. None by default.
+    chunk_bytes: int, optional
+        Target size, in bytes of records, of each chunk if
+        `chunk_size` is 'auto'. The record size is taken from DFU,
+        or estimated from the schema. 16MiB by default.
+    output: {"pandas", "arrow"}, optional
+        Type of output to return. If "arrow", a pyarrow.Table is
+        built directly from the downloaded rows, with one record
+        batch per chunk and sets as list columns; this requires
+        pyarrow. "pandas" by default.
+    resume_dir: str, optional
+        Directory to save downloaded chunks in, so that if the
+        download fails it can be resumed by calling again with the
+        same `resume_dir`, fetching only the chunks which are
+        missing. The chunk plan is kept from the first attempt. Once
+        the download completes the saved chunks are deleted, and the
+        directory too if nothing else is in it. Can't be
+        used with an `AdaptiveChunker`. None, not resumable, by
+        default.
+    columns: list of str, optional
+        Columns to return. If given, an ECL job first writes just
+        these columns to a temporary logical file on the cluster,
+        which is downloaded in place of `thor_file` and then
+        deleted, so unwanted columns are never transferred. Can't
+        be used with `resume_dir`. None, all columns, by default.
+    where: str, optional
+        Python expression over the file's columns which rows must
+        match to be returned, e.g. "(a > 1) and b in ('x', 'y')".
+        It is compiled to an ECL filter, see
+        `hpycc.utils.pushdown.compile_where`, and run on the cluster
+        as for `columns`, so only matching rows are transferred.
+        None, all rows, by default.
+    limit: int, optional
+        Return only the first `limit` rows. The chunk size is picked
+        for `limit` rows rather than the whole file, so small limits
+        are fetched with a single request. None, all rows, by
+        default.
+    sample: int, optional
+        Return a random sample of this many rows, in file order. The
+        sample is drawn as a spread of short runs of rows, by
+        default 4 per worker or `chunk_size` rows each if it is an
+        int, which are fetched in parallel. If `limit` is also
+        given, the sample is of the first `limit` rows. Can't be
+        used with `resume_dir`. None by default.
+    fraction: float, optional
+        Return a random sample of this fraction of the rows, as for
+        `sample`. None by default.
+    random_state: int, optional
+        Seed for `sample` and `fraction`, for a repeatable sample.
+        Samples are only cached in the connection's file cache if
+        this is given. None by default.
 
     Returns
     -------
     df: pandas.DataFrame
-        Thor file as a pandas.DataFrame.
+        Thor file as a pandas.DataFrame, or a pyarrow.Table if
+        `output` is "arrow". If sampled, a DataFrame is indexed by
+        the row numbers of the sampled rows in the file.
+
+    Raises
+    ------
+    ValueError:
+        If `output` is not "pandas" or "arrow". If `resume_dir`
+        holds a download of a different file, or of this file before
+        it was last modified, or DFU doesn't give the file's
+        modification time, or `chunk_size` is an `AdaptiveChunker`.
+        If `columns` or `where`, and `resume_dir` are given. If
+        `where` uses an expression which can't be compiled to ECL.
+        If both `sample` and `fraction` are given, either is given
+        with `resume_dir`, `limit` or `sample` is negative, or
+        `fraction` is not between 0 and 1.
+    KeyError:
+        If any of `columns`, or names used in `where`, are not in
+        the file.
+    ImportError:
+        If `output` is "arrow" and pyarrow is not installed.
 
     See Also
     --------
@@ -316,49 +460,842 @@ def get_thor_file(connection, thor_file, max_workers=10, chunk_size='auto', max_
 
     """
 
-    resp = connection.get_chunk_from_hpcc(thor_file, 0, 1, max_attempts, max_sleep)
-    try:
-        wuresultresponse = resp["WUResultResponse"]
-        schema_str = wuresultresponse["Result"]["XmlSchema"]["xml"]
-        schema = parse_schema_from_xml(schema_str)
-        schema = apply_custom_dtypes(schema, dtype)
-        num_rows = wuresultresponse["Total"]
-    except (KeyError, TypeError) as exc:
-        msg = "Can't find schema in returned json: {}".format(resp)
-        raise type(exc)(msg) from exc
-
-    if chunk_size == 'auto':  # Automagically optimise. TODO: we could use width too.
-        suggested_size = ceil(num_rows/max_workers)
-        chunk_size = num_rows if suggested_size < 10000 else suggested_size  # Don't chunk small stuff.
-        chunk_size = 325000 if suggested_size > 325000 else chunk_size  # More chunks than workers for big stuff.
-
-    if not num_rows or num_rows == 0:  # if there are no rows to go and get, we should return an empty dataframe
-        return pd.DataFrame(columns=schema.keys())
-
-    chunks = filechunker.make_chunks(num_rows, chunk_size)
+    _check_output(output)
+    _check_rows(limit, sample, fraction, resume_dir)
+    metadata = connection.get_file_metadata(thor_file, max_attempts, max_sleep)
+    push_down = columns is not None or where is not None
+    if push_down and resume_dir is not None:
+        raise ValueError("resume_dir can't be used with columns or where, "
+                         "they are written to a new file each time")
+    if columns is not None:
+        missing = set(columns).difference(metadata.schema.keys())
+        if missing:
+            raise KeyError("Columns {} do not exist in {}".format(
+                sorted(missing), thor_file))
+    if where is not None:
+        where = compile_where(where, metadata.schema.keys())
+
+    rows = (limit, sample, fraction, random_state)
+    random = (sample is not None or fraction is not None) and \
+        random_state is None
+    cache_key = None if random else _file_cache_key(
+        connection, thor_file, metadata, output, dtype, columns, where, rows)
+    if cache_key:
+        cached = connection._file_cache.get(cache_key)
+        if cached is not None:
+            return _from_cached(cached, output)
+
+    if push_down:
+        temp_file = _push_down(connection, thor_file, max_attempts, max_sleep,
+                               columns, where)
+        try:
+            file = _download_thor_file(
+                connection, temp_file, max_workers, chunk_size, max_attempts,
+                max_sleep, dtype, chunk_bytes, output, rows=rows)
+        finally:
+            delete_logical_file(connection, temp_file)
+    else:
+        file = _download_thor_file(
+            connection, thor_file, max_workers, chunk_size, max_attempts,
+            max_sleep, dtype, chunk_bytes, output, resume_dir, metadata, rows)
+
+    if cache_key:
+        _to_cache(connection, cache_key, file)
+    return file
+
+
+def _download_thor_file(connection, thor_file, max_workers, chunk_size,
+                        max_attempts, max_sleep, dtype, chunk_bytes, output,
+                        resume_dir=None, metadata=None, rows=None):
+    """
+    Download a thor file, see `get_thor_file`.
+
+    Parameters
+    ----------
+    metadata: FileMetadata, optional
+        Metadata of the file, if it has already been fetched with
+        `Connection.get_file_metadata`. None by default.
+    rows: tuple, optional
+        Rows to download in the form (limit, sample, fraction,
+        random_state), see `get_thor_file`. None, all rows, by
+        default.
+    Others:
+        See `get_thor_file`.
+
+    Returns
+    -------
+    file: pandas.DataFrame or pyarrow.Table
+        The thor file.
+    """
+    schema, num_rows, chunks, tuner, modified = _plan_download(
+        connection, thor_file, max_workers, chunk_size, max_attempts,
+        max_sleep, dtype, chunk_bytes, metadata, *(rows or ()))
+    sampled = rows is not None and (rows[1] is not None or
+                                    rows[2] is not None)
+
+    if output == "arrow":
+        results = _fetch_chunks(connection, thor_file, num_rows, chunks,
+                                tuner, modified, max_workers, max_attempts,
+                                max_sleep, resume_dir, ordered=True)
+        file = _assemble_arrow_table(results, schema)
+    elif not num_rows or num_rows == 0:  # if there are no rows to go and get, we should return an empty dataframe
+        file = pd.DataFrame(columns=schema.keys())
+    elif sampled:
+        # Sampled chunks are spread across the file, so pack them
+        # together and index them by their rows in the file instead.
+        offsets = dict(zip((start for start, _ in chunks),
+                           np.cumsum([0] + [n for _, n in chunks])))
+        results = _fetch_chunks(connection, thor_file, num_rows, chunks,
+                                tuner, modified, max_workers, max_attempts,
+                                max_sleep, resume_dir)
+        file = _assemble_thor_file(
+            ((offsets[start], result) for start, result in results),
+            schema, num_rows)
+        file.index = np.concatenate([np.arange(start, start + n)
+                                     for start, n in chunks])
+    else:
+        results = _fetch_chunks(connection, thor_file, num_rows, chunks,
+                                tuner, modified, max_workers, max_attempts,
+                                max_sleep, resume_dir)
+        file = _assemble_thor_file(results, schema, num_rows)
+
+    return file
+
+
+def iter_thor_file(connection, thor_file, max_workers=10, chunk_size='auto',
+                   max_attempts=3, max_sleep=60, dtype=None,
+                   chunk_bytes=DEFAULT_CHUNK_BYTES, max_in_flight=None,
+                   output="pandas", resume_dir=None):
+    """
+    Yield a thor file as pandas.DataFrames or pyarrow.Tables of one
+    chunk each, in row order.
+
+    Unlike `get_thor_file` the whole file is never held in memory:
+    at most `max_in_flight` chunks are being downloaded or waiting
+    to be yielded at once, so files larger than memory can be
+    processed a chunk at a time. Each DataFrame is typed as
+    `get_thor_file` would type it and is indexed by its row numbers
+    in the file. An empty file yields a single empty DataFrame.
+
+    Parameters
+    ----------
+    connection: hpycc.Connection
+        HPCC Connection instance, see also `Connection`.
+    thor_file: str
+        Name of thor file to be downloaded.
+    max_workers: int, optional
+        Number of concurrent threads to use when downloading file.
+        Warning: too many may cause instability! 10 by default.
+    chunk_size: int, 'auto' or filechunker.AdaptiveChunker, optional
+        Size of chunks, in rows, to use when downloading file, see
+        `get_thor_file`. 'auto' by default.
+    max_attempts: int, optional
+        Maximum number of times a chunk should attempt to be
+        downloaded in the case of an exception being raised.
+        3 by default.
+    max_sleep: int, optional
+        Maximum time, in seconds, to sleep between attempts.
+        The true sleep time is a random int between `max_sleep` and
+        `max_sleep` * 0.75.
+    dtype: type name or dict of col -> type, optional
+        Data type for data or columns, see `get_thor_file`. None
+        by default.
+    chunk_bytes: int, optional
+        Target size, in bytes of records, of each chunk if
+        `chunk_size` is 'auto'. 16MiB by default.
+    max_in_flight: int, optional
+        Maximum number of chunks downloading or downloaded but not
+        yet yielded. None, `max_workers`, by default.
+    output: {"pandas", "arrow"}, optional
+        Type of chunk to yield, see `get_thor_file`. Arrow chunks
+        are not indexed. "pandas" by default.
+    resume_dir: str, optional
+        Directory to save downloaded chunks in so that an
+        interrupted download can be resumed, see `get_thor_file`.
+        None by default.
+
+    Yields
+    ------
+    df: pandas.DataFrame
+        Consecutive chunks of the thor file, or pyarrow.Tables if
+        `output` is "arrow".
+
+    See Also
+    --------
+    get_thor_file
+
+    Examples
+    --------
+    >>> import hpycc
+    >>> conn = hpycc.Connection("user")
+    >>> total = 0
+    >>> for df in hpycc.iter_thor_file(conn, "example"):
+    ...     total += df["col1"].sum()
+
+    """
+    _check_output(output)
+    schema, num_rows, chunks, tuner, modified = _plan_download(
+        connection, thor_file, max_workers, chunk_size, max_attempts,
+        max_sleep, dtype, chunk_bytes)
+
+    if not num_rows:
+        if output == "arrow":
+            yield _assemble_arrow_table([], schema)
+        else:
+            yield pd.DataFrame(columns=schema.keys())
+        return
+
+    results = _fetch_chunks(connection, thor_file, num_rows, chunks, tuner,
+                            modified, max_workers, max_attempts, max_sleep,
+                            resume_dir, ordered=True,
+                            max_in_flight=max_in_flight or max_workers)
+    for start_row, result in results:
+        if output == "arrow":
+            yield _assemble_arrow_table([(start_row, result)], schema)
+            continue
+        n_rows = _chunk_length(result)
+        df = _assemble_thor_file([(0, result)], schema, n_rows)
+        df.index = pd.RangeIndex(start_row, start_row + n_rows)
+        yield df
+
+
+def get_rows(connection, thor_file, row_ids, gap=100, max_workers=10,
+             max_attempts=3, max_sleep=60, dtype=None,
+             chunk_bytes=DEFAULT_CHUNK_BYTES, output="pandas"):
+    """
+    Return given rows of a thor file, by row number.
+
+    The row numbers are sorted and merged into as few ranges of rows
+    as possible, allowing up to `gap` unwanted rows within a range,
+    and the ranges are downloaded in parallel. Only the requested
+    rows are returned.
+
+    Parameters
+    ----------
+    connection: hpycc.Connection
+        HPCC Connection instance, see also `Connection`.
+    thor_file: str
+        Name of thor file to get rows of.
+    row_ids: list-like of int
+        Row numbers to return, where 0 is the first row of the file,
+        in any order. Duplicates are allowed.
+    gap: int, optional
+        Largest number of unwanted rows to download between two
+        requested rows rather than making a separate request. 100
+        by default.
+    max_workers: int, optional
+        Number of concurrent threads to use when downloading rows.
+        10 by default.
+    max_attempts: int, optional
+        Maximum number of times a range should attempt to be
+        downloaded in the case of an exception being raised.
+        3 by default.
+    max_sleep: int, optional
+        Maximum time, in seconds, to sleep between attempts.
+        60 by default.
+    dtype: type name or dict of col -> type, optional
+        Data type for data or columns, see `get_thor_file`. None by
+        default.
+    chunk_bytes: int, optional
+        Largest size, in bytes of records, of a range requested at
+        once, see `get_thor_file`. 16MiB by default.
+    output: {"pandas", "arrow"}, optional
+        Type of output to return, see `get_thor_file`. "pandas" by
+        default.
+
+    Returns
+    -------
+    df: pandas.DataFrame
+        The rows in the order of `row_ids`, indexed by row number.
+        A pyarrow.Table, which is not indexed, if `output` is
+        "arrow".
+
+    Raises
+    ------
+    IndexError:
+        If any of `row_ids` is not a row of the file.
+    ValueError:
+        If `output` is not "pandas" or "arrow".
+    ImportError:
+        If `output` is "arrow" and pyarrow is not installed.
+
+    See Also
+    --------
+    get_thor_file
+
+    Examples
+    --------
+    >>> import hpycc
+    >>> conn = hpycc.Connection("user")
+    >>> hpycc.get_rows(conn, "example", [2, 0])
+       col1
+    2     3
+    0     1
+
+    """
+    _check_output(output)
+    metadata = connection.get_file_metadata(thor_file, max_attempts, max_sleep)
+    schema = apply_custom_dtypes(deepcopy(metadata.schema), dtype)
+    row_ids = np.asarray(row_ids, dtype=np.int64)
+    if row_ids.size and (row_ids.min() < 0 or
+                         row_ids.max() >= metadata.num_rows):
+        raise IndexError("row_ids must be between 0 and {}".format(
+            metadata.num_rows - 1))
+
+    record_size = metadata.record_size or _estimate_record_size(schema)
+    max_rows = max(1, min(chunk_bytes // max(record_size, 1),
+                          MAX_CHUNK_ROWS))
+    chunks = filechunker.coalesce_rows(row_ids, gap, max_rows)
+    fetched = np.concatenate([np.arange(start, start + n)
+                              for start, n in chunks] or [[]])
+    positions = np.searchsorted(fetched, row_ids)
+
+    results = _iter_chunks(connection, thor_file, chunks, max_workers,
+                           max_attempts, max_sleep, ordered=True)
+    if output == "arrow":
+        return _assemble_arrow_table(results, schema).take(positions)
+    if not chunks:
+        return pd.DataFrame(columns=schema.keys(), index=row_ids)
+
+    offsets = np.cumsum([0] + [n for _, n in chunks])
+    df = _assemble_thor_file(
+        ((offset, result) for offset, (_, result) in zip(offsets, results)),
+        schema, len(fetched))
+    df = df.iloc[positions]
+    df.index = row_ids
+    return df
+
+
+def _check_rows(limit, sample, fraction, resume_dir):
+    """
+    Raise an error if the rows to download, see `get_thor_file`, are
+    not valid.
+    """
+    if sample is not None and fraction is not None:
+        raise ValueError("Only one of sample and fraction can be given")
+    if (sample is not None or fraction is not None) and \
+            resume_dir is not None:
+        raise ValueError("resume_dir can't be used with sample or fraction, "
+                         "a new sample is drawn each time")
+    for name, value in (("limit", limit), ("sample", sample)):
+        if value is not None and value < 0:
+            raise ValueError("{} must not be negative, not {}".format(
+                name, value))
+    if fraction is not None and not 0 <= fraction <= 1:
+        raise ValueError("fraction must be between 0 and 1, not {}".format(
+            fraction))
+
+
+def _check_output(output):
+    """
+    Raise an error if `output` is not a supported output type, or
+    needs pyarrow and it isn't installed.
+    """
+    if output not in ("pandas", "arrow"):
+        raise ValueError(
+            "output must be 'pandas' or 'arrow', not {}".format(output))
+    if output == "arrow" and pa is None:
+        raise ImportError("output='arrow' requires pyarrow, install it "
+                          "with `pip install pyarrow`.")
+
+
+def _plan_download(connection, thor_file, max_workers, chunk_size,
+                   max_attempts, max_sleep, dtype, chunk_bytes, metadata=None,
+                   limit=None, sample=None, fraction=None, random_state=None):
+    """
+    Return the schema, row count and chunks to download of a logical
+    file.
+
+    Parameters
+    ----------
+    metadata: FileMetadata, optional
+        Metadata of the file, if it has already been fetched with
+        `Connection.get_file_metadata`. None by default.
+    Others:
+        See `get_thor_file`.
+
+    Returns
+    -------
+    schema: OrderedDict
+        Schema of the file with `dtype` applied.
+    num_rows: int
+        Number of rows to download.
+    chunks: iterable of tuples or None
+        Chunks in the form (start_row, n_rows), None if there are no
+        rows to download. If sampling they are not contiguous.
+    tuner: filechunker.AdaptiveChunker or None
+        `chunk_size`, if it is a tuner and not sampling.
+    modified: str or None
+        DFU modification time of the file, if known.
+    """
+    if metadata is None:
+        metadata = connection.get_file_metadata(thor_file, max_attempts,
+                                                max_sleep)
+    schema = apply_custom_dtypes(deepcopy(metadata.schema), dtype)
+    num_rows = metadata.num_rows
+    if limit is not None:
+        num_rows = min(num_rows, limit)
+
+    record_size = metadata.record_size or _estimate_record_size(schema)
+    auto_size = _auto_chunk_size(num_rows, max_workers, record_size,
+                                 chunk_bytes)
+    run_size = chunk_size if isinstance(chunk_size, int) else None
+    tuner = None
+    if isinstance(chunk_size, filechunker.AdaptiveChunker):
+        tuner = chunk_size
+        tuner.start(auto_size, max_workers, record_size)
+    elif chunk_size == 'auto':
+        chunk_size = auto_size
+
+    if fraction is not None:
+        sample = int(round(fraction * num_rows))
+    if sample is not None:
+        tuner = None
+        if run_size:
+            n_chunks = ceil(sample / run_size)
+        else:
+            n_chunks = max(SAMPLE_RUNS_PER_WORKER * max_workers,
+                           ceil(sample / auto_size))
+        chunks = filechunker.sample_chunks(num_rows, sample, n_chunks,
+                                           random_state) or None
+        num_rows = min(sample, num_rows)
+    elif not num_rows:
+        chunks = None
+    elif tuner:
+        chunks = tuner.chunks(num_rows)
+    else:
+        chunks = filechunker.make_chunks(num_rows, chunk_size)
+
+    return schema, num_rows, chunks, tuner, metadata.modified
+
+
+def _file_cache_key(connection, thor_file, metadata, output, dtype,
+                    columns=None, where=None, rows=None):
+    """
+    Return the key of a logical file in the connection's file cache,
+    or None if it isn't cached or can't be checked for changes.
+    """
+    if connection._file_cache is None or not metadata.modified:
+        return None
+    if isinstance(dtype, dict):
+        dtype = sorted((str(k), repr(v)) for k, v in dtype.items())
+    return hash_text(thor_file, metadata.modified, str(metadata.num_rows),
+                     output, repr(dtype), repr(columns), where, repr(rows))
+
+
+def _push_down(connection, thor_file, max_attempts, max_sleep, columns,
+               where=None):
+    """
+    Write the selected rows and columns of a logical file to a
+    temporary logical file on the cluster and return its name. The
+    caller should delete it.
+
+    Parameters
+    ----------
+    where: str, optional
+        ECL filter, as returned by `compile_where`. None by default.
+    Others:
+        See `get_thor_file`.
+
+    Returns
+    -------
+    temp_file: str
+        Name of the temporary logical file.
+    """
+    file_detail = connection.get_logical_file_info(thor_file, max_attempts,
+                                                   max_sleep)
+    temp_file = temp_logical_file(thor_file)
+    script = pushdown_script(thor_file, file_detail, temp_file, columns,
+                             where)
+    connection.run_ecl_string(script, False, True, None)
+    return temp_file
+
+
+def _to_cache(connection, cache_key, file):
+    """
+    Store a downloaded logical file in the connection's file cache.
+    DataFrames that Arrow can't represent are not stored. The index
+    is kept, as samples are indexed by their row numbers.
+    """
+    if isinstance(file, pd.DataFrame):
+        try:
+            file = pa.Table.from_pandas(file)
+        except (pa.ArrowInvalid, pa.ArrowTypeError,
+                pa.ArrowNotImplementedError):
+            return
+    connection._file_cache.set(cache_key, file)
+
+
+def _from_cached(table, output):
+    """
+    Return a logical file read from the file cache in the type
+    given by `output`.
+    """
+    if output == "arrow":
+        return table
+    df = table.to_pandas()
+    for field in table.schema:
+        if pa.types.is_list(field.type):  # Sets come back as numpy arrays
+            df[field.name] = df[field.name].map(
+                lambda x: x.tolist() if x is not None else x)
+    return df
+
+
+def _fetch_chunks(connection, thor_file, num_rows, chunks, tuner, modified,
+                  max_workers, max_attempts, max_sleep, resume_dir=None,
+                  ordered=False, max_in_flight=None):
+    """
+    Download chunks of a logical file, see `_iter_chunks`, saving
+    them to and resuming from `resume_dir` if it is given.
+
+    Parameters
+    ----------
+    num_rows, chunks, tuner, modified:
+        As returned by `_plan_download`.
+    resume_dir: str, optional
+        Directory to save chunks in, see `get_thor_file`. None by
+        default.
+    Others:
+        See `_iter_chunks`.
+
+    Yields
+    ------
+    tuple
+        In the form (start_row, chunk). Chunks already saved in
+        `resume_dir` are loaded rather than downloaded.
+
+    Raises
+    ------
+    ValueError:
+        If `resume_dir` can't be used, see `ChunkStore`, or `tuner`
+        is given with `resume_dir`.
+    """
+    if resume_dir is None or not chunks:
+        yield from _iter_chunks(connection, thor_file, chunks or [],
+                                max_workers, max_attempts, max_sleep, tuner,
+                                ordered, max_in_flight)
+        return
+    if tuner:
+        raise ValueError("resume_dir can't be used with an AdaptiveChunker, "
+                         "its chunk plan isn't known in advance")
+
+    store = ChunkStore(resume_dir, thor_file, modified, num_rows, chunks)
+    missing = store.missing()
+    fetched = _iter_chunks(connection, thor_file, missing, max_workers,
+                           max_attempts, max_sleep, ordered=ordered,
+                           max_in_flight=max_in_flight)
+    missing = {start_row for start_row, _ in missing}
+
+    if ordered:
+        for start_row, _ in store.chunks:
+            if start_row in missing:
+                start_row, result = next(fetched)
+                store.save(start_row, result)
+            else:
+                result = store.load(start_row)
+            yield start_row, result
+    else:
+        for start_row, _ in store.chunks:
+            if start_row not in missing:
+                yield start_row, store.load(start_row)
+        for start_row, result in fetched:
+            store.save(start_row, result)
+            yield start_row, result
+
+    store.clear()
+
+
+def _timed(func, *args):
+    """
+    Return the time taken to call `func(*args)` and its result.
+    """
+    start = monotonic()
+    result = func(*args)
+    return monotonic() - start, result
+
+
+def _iter_chunks(connection, thor_file, chunks, max_workers, max_attempts,
+                 max_sleep, tuner=None, ordered=False, max_in_flight=None):
+    """
+    Download chunks of a logical file concurrently, yielding each as
+    it completes.
+
+    Chunks are requested lazily so that no more than `max_in_flight`,
+    or the tuner's current `workers`, are downloading or waiting to
+    be yielded at once.
+
+    Parameters
+    ----------
+    connection: hpycc.Connection
+        HPCC Connection instance, see also `Connection`.
+    thor_file: str
+        Name of thor file to be downloaded.
+    chunks: iterable of tuples
+        Chunks to download in the form (start_row, n_rows).
+    max_workers: int
+        Number of threads to download with.
+    max_attempts: int
+        Maximum number of times a chunk should attempt to be
+        downloaded in the case of an exception being raised.
+    max_sleep: int
+        Maximum time, in seconds, to sleep between attempts.
+    tuner: filechunker.AdaptiveChunker, optional
+        Tuner to report chunk timings to. None by default.
+    ordered: bool, optional
+        Yield chunks in the order of `chunks` rather than as they
+        complete. Completed chunks are held until all chunks before
+        them have been yielded. False by default.
+    max_in_flight: int, optional
+        Maximum number of chunks downloading or held. None,
+        `max_workers`, by default.
+
+    Yields
+    ------
+    tuple
+        In the form (start_row, chunk), where chunk is as returned
+        by `Connection.get_logical_file_chunk`.
+    """
+    chunks = iter(chunks)
+    in_flight = {}
+    submitted = deque()
+    held = {}
+    connection._reserve_pool(max_workers)
     with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        futures = [
-            executor.submit(connection.get_logical_file_chunk, thor_file, start_row,
-                            n_rows, max_attempts, max_sleep)
-            for start_row, n_rows in chunks
-        ]
-
-    results = {key: [] for key in schema.keys()}
-    for result in as_completed(futures):
-        result = result.result()
-        [results[k].extend(result[k]) for k in results.keys()]
+        while True:
+            limit = tuner.workers if tuner else (max_in_flight or max_workers)
+            while len(in_flight) + len(held) < limit:
+                chunk = next(chunks, None)
+                if chunk is None:
+                    break
+                start_row, n_rows = chunk
+                requested = tuner.chunk_size if tuner else n_rows
+                in_flight[executor.submit(
+                    _timed, connection.get_logical_file_chunk, thor_file,
+                    start_row, n_rows, max_attempts, max_sleep)] = (
+                    start_row, n_rows, requested)
+                submitted.append(start_row)
+            if not in_flight:
+                return
+
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                start_row, n_rows, requested = in_flight.pop(future)
+                seconds, result = future.result()
+                if tuner:
+                    tuner.record(n_rows, seconds, requested)
+                if ordered:
+                    held[start_row] = result
+                else:
+                    yield start_row, result
+
+            while submitted and submitted[0] in held:
+                start_row = submitted.popleft()
+                yield start_row, held.pop(start_row)
+            if not ordered:
+                submitted.clear()
+
+
+def _auto_chunk_size(num_rows, max_workers, record_size, chunk_bytes):
+    """
+    Return a chunk size for downloading `num_rows` rows with
+    `max_workers` workers.
+
+    Rows are split evenly between workers, unless that would give
+    fewer than 10,000 rows each in which case the file isn't
+    chunked. Either way chunks are capped at `chunk_bytes` of
+    records, and at `MAX_CHUNK_ROWS` rows, so wide files get
+    proportionally shorter chunks than narrow ones.
+
+    Parameters
+    ----------
+    num_rows: int
+        Number of rows in the logical file.
+    max_workers: int
+        Number of concurrent workers downloading the file.
+    record_size: int
+        Size of a record, in bytes.
+    chunk_bytes: int
+        Maximum size of a chunk, in bytes.
+
+    Returns
+    -------
+    chunk_size: int
+        Number of rows to request per chunk.
+    """
+    max_rows = min(chunk_bytes // max(record_size, 1), MAX_CHUNK_ROWS)
+    suggested_size = ceil(num_rows/max_workers)
+    chunk_size = num_rows if suggested_size < 10000 else suggested_size  # Don't chunk small stuff.
+    return max(1, min(chunk_size, max_rows))
+
+
+def _estimate_record_size(schema):
+    """
+    Estimate the size of a record, in bytes, from its schema. Used
+    when DFU does not give a record size.
+
+    Parameters
+    ----------
+    schema: OrderedDict
+        Schema of the logical file, see `parse_schema_from_xml`.
+
+    Returns
+    -------
+    record_size: int
+        Estimated size of a record, in bytes.
+    """
+    sizes = {bool: 1, int: 8, float: 8}
+    return sum(64 if c['is_a_set'] else sizes.get(c['type'], 32)
+               for c in schema.values()) or 1
+
+
+def _assemble_thor_file(chunks, schema, num_rows):
+    """
+    Build a typed DataFrame from downloaded chunks of a logical file.
+
+    Each column is preallocated for `num_rows` rows and every chunk
+    is written into it at its start row as it arrives, so the rows
+    are in file order however the chunks complete and the data is
+    only copied once. Numeric and boolean columns are written
+    straight into typed arrays, other columns into object arrays
+    which are cast once all chunks are in. Rows which no chunk
+    covers are dropped.
+
+    Parameters
+    ----------
+    chunks: iterable of tuples
+        Chunks in the form (start_row, chunk), where chunk is as
+        returned by `Connection.get_logical_file_chunk`.
+    schema: OrderedDict
+        Schema of the logical file with `dtype` applied, see
+        `_plan_download`.
+    num_rows: int
+        Number of rows in the logical file.
+
+    Returns
+    -------
+    results: pandas.DataFrame
+        The chunks as a single DataFrame, with each column cast to
+        its type in `schema`.
+    """
+    columns = {col: np.empty(num_rows, dtype=_buffer_dtype(c))
+               for col, c in schema.items()}
+    filled = []
+    for start_row, result in chunks:
+        n = _chunk_length(result)
+        end_row = start_row + n
+        for col, c in schema.items():
+            buf = columns[col]
+            if end_row > len(buf):
+                buf = np.concatenate(
+                    [buf, np.empty(end_row - len(buf), dtype=buf.dtype)])
+            columns[col] = _fill_column(buf, start_row, result[col], c)
+        filled.append((start_row, end_row))
         del result
-    results = pd.DataFrame(results)
-
-    for col in schema.keys():
-        c = schema[col]
-        nam = col
-        typ = c['type']
-        if c['is_a_set']:  # TODO: Nested DF are also caught here. Open issue to fix
-            results[nam] = results[nam].map(lambda x: [typ(i) for i in x["Item"]])
-        else:
-            try:
-                results[nam] = results[nam].astype(typ)
-            except OverflowError:  # An int that is horrifically long cannot be converted properly. Use float instead
-                results[nam] = results[nam].astype('float')
+
+    filled.sort()
+    covered = 0
+    for start_row, end_row in filled:
+        if start_row != covered:
+            break
+        covered = end_row
+    else:
+        if covered == num_rows:
+            filled = None
+    if filled is not None:  # chunks were short, keep only the rows we have
+        rows = np.concatenate(
+            [np.arange(a, b) for a, b in filled] or [np.arange(0)])
+        columns = {col: buf[rows] for col, buf in columns.items()}
+
+    results = pd.DataFrame(columns, copy=False)
+    for col, c in schema.items():
+        if c['is_a_set'] or results[col].dtype != object:
+            continue
+        try:
+            results[col] = results[col].astype(c['type'])
+        except OverflowError:  # An int that is horrifically long cannot be converted properly. Use float instead
+            results[col] = results[col].astype('float')
     return results
+
+
+def _assemble_arrow_table(chunks, schema):
+    """
+    Build a pyarrow.Table from downloaded chunks of a logical file.
+
+    Parameters
+    ----------
+    chunks: iterable of tuples
+        Chunks in the form (start_row, chunk), in row order, where
+        chunk is as returned by `Connection.get_logical_file_chunk`.
+    schema: OrderedDict
+        Schema of the logical file with `dtype` applied, see
+        `_plan_download`.
+
+    Returns
+    -------
+    table: pyarrow.Table
+        The chunks as a single table, one record batch per chunk,
+        with each column of the type given by `arrow_type`. If any
+        chunk has an integer too long for int64, its column is
+        float64.
+    """
+    arrays = {col: [] for col in schema.keys()}
+    for _, result in chunks:
+        for col, c in schema.items():
+            arrays[col].append(to_arrow_array(result[col], c))
+        del result
+
+    columns = {}
+    for col, c in schema.items():
+        typ = arrow_type(c)
+        if pa.types.is_integer(typ) and any(a.type != typ
+                                            for a in arrays[col]):
+            typ = pa.float64()
+        columns[col] = pa.chunked_array(
+            [a if a.type == typ else a.cast(typ) for a in arrays[col]],
+            type=typ)
+    return pa.table(columns)
+
+
+def _chunk_length(result):
+    """
+    Return the number of rows in a chunk of a logical file.
+    """
+    for col in result:
+        return len(result[col])
+    return 0
+
+
+def _buffer_dtype(column):
+    """
+    Return the numpy dtype to preallocate a column of a schema as.
+    Numeric and boolean columns get their own dtype, others object.
+    """
+    if column['is_a_set']:  # TODO: Nested DF are also caught here. Open issue to fix
+        return object
+    try:
+        dtype = np.dtype(column['type'])
+    except TypeError:
+        return object
+    return dtype if dtype.kind in "biuf" else object
+
+
+def _fill_column(buf, start_row, values, column):
+    """
+    Write the values of a column from one chunk into `buf` at
+    `start_row`, returning the buffer. If an integer is too long for
+    the buffer the whole column becomes float.
+    """
+    end_row = start_row + len(values)
+    if column['is_a_set']:
+        typ = column['type']
+        values = ([typ(i) for i in x["Item"]] for x in values)
+    if buf.dtype == object:
+        buf[start_row:end_row] = np.fromiter(values, dtype=object,
+                                             count=end_row - start_row)
+        return buf
+    try:
+        buf[start_row:end_row] = values
+    except OverflowError:  # An int that is horrifically long cannot be converted properly. Use float instead
+        buf = buf.astype('float')
+        buf[start_row:end_row] = values
+    return buf
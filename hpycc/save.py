@@ -18,16 +18,41 @@ Functions
 
 """
 
-from hpycc import get_output, get_thor_file
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import gzip
+import io
+import os
+
+from hpycc import get_output, get_thor_file, iter_thor_file
+from hpycc.get import DEFAULT_CHUNK_BYTES
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+CSV_CHUNK_ROWS = 100000
 
 
 def save_output(connection, script, path_or_buf=None, syntax_check=True,
-                delete_workunit=True, stored=None, **kwargs):
+                delete_workunit=True, stored=None, compression="infer",
+                compress_workers=None, **kwargs):
     """
     Save the first output of an ECL script as a csv. See
     save_outputs() for saving multiple outputs to file and
     get_output() for returning as a DataFrame.
 
+    The csv is written in blocks of rows, which are compressed in
+    parallel if `compression` is "gzip" or "zstd".
+
     Parameters
     ----------
     connection: `Connection`
@@ -45,6 +70,17 @@ def save_output(connection, script, path_or_buf=None, syntax_check=True,
     stored : dict or None, optional
         Key value pairs to replace stored variables within the
         script. Values should be str, int or bool. None by default.
+    compression: str or None, optional
+        Compression to use. "gzip" and "zstd" (which requires
+        zstandard) are streamed, with blocks of rows compressed in
+        parallel as separate gzip members or zstd frames which any
+        decompressor reads as one stream. Other values are passed to
+        pandas.DataFrame.to_csv() and the whole file is written at
+        once. "infer", from the extension of `path_or_buf`, by
+        default.
+    compress_workers: int or None, optional
+        Number of threads to compress with. None, the number of
+        CPUs, by default.
     kwargs
         Additional parameters to be provided to
         pandas.DataFrame.to_csv().
@@ -59,7 +95,15 @@ def save_output(connection, script, path_or_buf=None, syntax_check=True,
                         syntax_check=syntax_check,
                         delete_workunit=delete_workunit,
                         stored=stored)
-    return result.to_csv(path_or_buf=path_or_buf, **kwargs)
+    compression = _infer_compression(path_or_buf, compression)
+    if compression not in (None, "gzip", "zstd"):
+        return result.to_csv(path_or_buf=path_or_buf,
+                             compression=compression, **kwargs)
+
+    frames = (result.iloc[i:i + CSV_CHUNK_ROWS]
+              for i in range(0, max(len(result), 1), CSV_CHUNK_ROWS))
+    return _write_csv(frames, path_or_buf, compression, compress_workers,
+                      **kwargs)
 
 
 # def save_outputs(connection, script, directory=".", overwrite=True,
@@ -124,12 +168,18 @@ def save_output(connection, script, path_or_buf=None, syntax_check=True,
 
 def save_thor_file(connection, thor_file, path_or_buf=None,
                    max_workers=15, chunk_size='auto', max_attempts=3,
-                   max_sleep=60, dtype=None,
-                   **kwargs):
+                   max_sleep=60, dtype=None, chunk_bytes=DEFAULT_CHUNK_BYTES,
+                   format="csv", compression="infer", compress_workers=None,
+                   resume_dir=None, **kwargs):
     """
     Save a logical file to disk, see `get_thor_file()` for returning a
     DataFrame.
 
+    The file is streamed to disk: each chunk is written, as csv rows
+    or a parquet row group, as soon as it and all chunks before it
+    have downloaded, so memory use does not grow with the size of
+    the file.
+
     Parameters
     ----------
     connection: `Connection`
@@ -138,14 +188,14 @@ def save_thor_file(connection, thor_file, path_or_buf=None,
         Logical file to be downloaded
     path_or_buf : string or file handle, default None
         File path or object, if None is provided the result is returned as
-        a string.
+        a string. Required if `format` is "parquet".
     max_workers: int, optional
         Number of concurrent threads to use when downloading.
         Warning: too many will likely cause either your machine or
         your cluster to crash! 15 by default.
     chunk_size: int, optional.
-        Size of chunks to use when downloading file. 10000 by
-        default.
+        Size of chunks, in rows, to use when downloading file, see
+        `get_thor_file()`. 'auto' by default.
     max_attempts: int, optional
         Maximum number of times a chunk should attempt to be
         downloaded in the case of an exception being raised.
@@ -160,9 +210,34 @@ def save_thor_file(connection, thor_file, path_or_buf=None,
         INSTEAD of dtype conversion. If None, or columns are missing
         from the provided dict, they will be converted to one of
         bool, str or int based on the HPCC datatype. None by default.
+    chunk_bytes: int, optional
+        Target size, in bytes of records, of each chunk if
+        `chunk_size` is 'auto', see `get_thor_file()`. 16MiB by
+        default.
+    format: {"csv", "parquet"}, optional
+        Format to save the file as. "parquet" requires pyarrow, with
+        column types taken from the logical file's record layout.
+        "csv" by default.
+    compression: str or None, optional
+        Compression to use for csv. "gzip" and "zstd" (which requires
+        zstandard) are streamed, with blocks of rows compressed in
+        parallel as separate gzip members or zstd frames which any
+        decompressor reads as one stream. Other values are passed to
+        pandas.DataFrame.to_csv() and the whole file is written at
+        once. "infer", from the extension of `path_or_buf`, by
+        default.
+    compress_workers: int or None, optional
+        Number of threads to compress with. None, the number of
+        CPUs, by default.
+    resume_dir: str, optional
+        Directory to save downloaded chunks in so that an
+        interrupted download can be resumed, see `get_thor_file()`.
+        The output is rewritten in full when resuming. None by
+        default.
     kwargs
         Additional parameters to be provided to
-        pandas.DataFrame.to_csv().
+        pandas.DataFrame.to_csv(), or pyarrow.parquet.ParquetWriter
+        if `format` is "parquet".
 
     Returns
     -------
@@ -170,10 +245,200 @@ def save_thor_file(connection, thor_file, path_or_buf=None,
         if path_or_buf is not None, else a string
         representation of the output csv.
 
+    Raises
+    ------
+    ValueError:
+        If `format` is not "csv" or "parquet", or is "parquet" and
+        `path_or_buf` is None.
+    ImportError:
+        If `format` is "parquet" and pyarrow is not installed.
+
     """
+    if format == "parquet":
+        if path_or_buf is None:
+            raise ValueError("path_or_buf must be given to save as parquet")
+        if pq is None:
+            raise ImportError("format='parquet' requires pyarrow, install "
+                              "it with `pip install pyarrow`.")
+        tables = iter_thor_file(
+            connection, thor_file, max_workers=max_workers,
+            chunk_size=chunk_size, max_attempts=max_attempts,
+            max_sleep=max_sleep, dtype=dtype, chunk_bytes=chunk_bytes,
+            output="arrow", resume_dir=resume_dir)
+        return _write_parquet(tables, path_or_buf, **kwargs)
+    elif format != "csv":
+        raise ValueError(
+            "format must be 'csv' or 'parquet', not {}".format(format))
+
+    compression = _infer_compression(path_or_buf, compression)
+    if compression not in (None, "gzip", "zstd"):
+        file = get_thor_file(
+            connection, thor_file, max_workers=max_workers,
+            chunk_size=chunk_size, max_attempts=max_attempts,
+            max_sleep=max_sleep, dtype=dtype, chunk_bytes=chunk_bytes,
+            resume_dir=resume_dir)
+        return file.to_csv(path_or_buf, compression=compression, **kwargs)
+
+    frames = iter_thor_file(
+        connection, thor_file, max_workers=max_workers,
+        chunk_size=chunk_size, max_attempts=max_attempts,
+        max_sleep=max_sleep, dtype=dtype, chunk_bytes=chunk_bytes,
+        resume_dir=resume_dir)
+    return _write_csv(frames, path_or_buf, compression, compress_workers,
+                      **kwargs)
+
+
+def _write_parquet(tables, path_or_buf, **kwargs):
+    """
+    Write pyarrow.Tables to a parquet file as they are yielded, one
+    or more row groups each.
+
+    Parameters
+    ----------
+    tables: iterable of pyarrow.Table
+        Consecutive chunks of the file. The schema of the first is
+        used for the whole file.
+    path_or_buf: string or file handle
+        File path or object to write to.
+    kwargs
+        Additional parameters to be provided to
+        pyarrow.parquet.ParquetWriter.
+
+    Returns
+    -------
+    None
+
+    Raises
+    ------
+    ValueError:
+        If a later chunk can't be stored with the schema of the
+        first, e.g. an integer column which is too long for int64
+        part way through the file.
+    """
+    writer = None
+    try:
+        for table in tables:
+            if writer is None:
+                writer = pq.ParquetWriter(path_or_buf, table.schema, **kwargs)
+            elif table.schema != writer.schema:
+                try:
+                    table = table.cast(writer.schema)
+                except (pa.ArrowInvalid, pa.ArrowNotImplementedError) as exc:
+                    raise ValueError(
+                        "Chunk doesn't fit the schema {}, pass dtype to set "
+                        "column types: {}".format(writer.schema, exc)) from exc
+            writer.write_table(table)
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+def _compress_zstd(data):
+    return zstandard.ZstdCompressor().compress(data)
+
+
+_COMPRESSORS = {
+    None: None,
+    "gzip": gzip.compress,
+    "zstd": _compress_zstd,
+}
+
+_EXTENSIONS = {".gz": "gzip", ".zst": "zstd"}
+
+
+def _infer_compression(path_or_buf, compression):
+    """
+    Return the compression to use for `path_or_buf`, inferring it
+    from the file extension if `compression` is "infer". Extensions
+    that pandas would infer but aren't streamed are returned as
+    "infer" for pandas to handle.
+    """
+    if compression != "infer":
+        return compression
+    if not isinstance(path_or_buf, (str, os.PathLike)):
+        return None
+    ext = os.path.splitext(os.fspath(path_or_buf))[1].lower()
+    if ext in (".bz2", ".xz", ".zip", ".tar"):
+        return "infer"
+    return _EXTENSIONS.get(ext)
+
+
+def _write_csv(frames, path_or_buf, compression=None, compress_workers=None,
+               **kwargs):
+    """
+    Write DataFrames to a csv one after another, as they are yielded.
+
+    Only the first DataFrame's header is written. If `compression`
+    is given each DataFrame's csv is compressed separately, in
+    parallel, and the results are written in order.
+
+    Parameters
+    ----------
+    frames: iterable of pandas.DataFrame
+        Consecutive chunks of the csv.
+    path_or_buf: string or file handle, default None
+        File path or object, if None is provided the result is
+        returned as a string. File objects must be binary if
+        `compression` is given.
+    compression: {None, "gzip", "zstd"}, optional
+        Compression to use. None by default.
+    compress_workers: int or None, optional
+        Number of threads to compress with. None, the number of
+        CPUs, by default.
+    kwargs
+        Additional parameters to be provided to
+        pandas.DataFrame.to_csv().
+
+    Returns
+    -------
+    None or str
+        if path_or_buf is not None, else a string representation of
+        the csv.
+
+    Raises
+    ------
+    ValueError:
+        If `compression` is given and `path_or_buf` is None.
+    ImportError:
+        If `compression` is "zstd" and zstandard is not installed.
+    """
+    if compression == "zstd" and zstandard is None:
+        raise ImportError("compression='zstd' requires zstandard, install "
+                          "it with `pip install zstandard`.")
+    compress = _COMPRESSORS[compression]
+    encoding = kwargs.pop("encoding", None) or "utf-8"
+    if path_or_buf is None:
+        if compress is not None:
+            raise ValueError("path_or_buf must be given to compress")
+        buf = io.StringIO()
+        _write_csv(frames, buf, **kwargs)
+        return buf.getvalue()
+
+    if isinstance(path_or_buf, (str, os.PathLike)):
+        if compress is None:
+            f = open(path_or_buf, kwargs.pop("mode", "w"), newline="",
+                     encoding=encoding)
+        else:
+            f = open(path_or_buf, "wb")
+        with f:
+            return _write_csv(frames, f, compression, compress_workers,
+                              encoding=encoding, **kwargs)
 
-    file = get_thor_file(
-        connection, thor_file, max_workers=max_workers, chunk_size=chunk_size,
-        max_attempts=max_attempts, max_sleep=max_sleep, dtype=dtype)
+    header = kwargs.pop("header", True)
+    texts = (frame.to_csv(header=header if i == 0 else False, **kwargs)
+             for i, frame in enumerate(frames))
+    if compress is None:
+        for text in texts:
+            path_or_buf.write(text)
+        return None
 
-    return file.to_csv(path_or_buf, **kwargs)
+    workers = compress_workers or os.cpu_count() or 1
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for text in texts:
+            pending.append(executor.submit(compress, text.encode(encoding)))
+            while len(pending) > workers:
+                path_or_buf.write(pending.popleft().result())
+        while pending:
+            path_or_buf.write(pending.popleft().result())
+    return None
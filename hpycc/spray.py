@@ -6,10 +6,34 @@ Functions
 - `spray_file` -- Spray a given csv or pandas DataFrame to HPCC.
 
 """
-from concurrent.futures import ThreadPoolExecutor, wait
+from concurrent.futures import (Future, ProcessPoolExecutor,
+                                ThreadPoolExecutor, wait, FIRST_COMPLETED)
+from contextlib import ExitStack
+import re
+from tempfile import TemporaryFile
+from time import monotonic, sleep
+from urllib import parse
+import uuid
+import numpy as np
 import pandas as pd
 from hpycc.delete import delete_logical_file
 from hpycc.utils.filechunker import make_chunks
+from hpycc.utils.pushdown import temp_logical_file
+from hpycc.utils.sharedframe import SharedFrame, attach
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+except ImportError:
+    pa = None
+    pc = None
+
+INLINE_MAX_ROWS = 1000
+DFU_POLL_SECONDS = 1
+# DFU workunit states, see FileSpray's DFUstate.
+DFU_FINISHED = 6
+DFU_FAILED = (4, 5, 8, 9)  # aborted, failed, aborting, not found
+_ESCAPES = (("\\", "\\\\"), ("'", "\\'"), ("\n", "\\n"), ("\r", "\\r"))
 
 
 def _spray_stringified_data(connection, data, record_set, logical_file,
@@ -51,7 +75,7 @@ def _spray_stringified_data(connection, data, record_set, logical_file,
                               stored=None)
 
 
-def _get_type(typ):
+def _get_type(typ, has_nulls=False):
     """
     Return the HPCC data type equivalent of a pandas/ numpy dtype.
 
@@ -59,35 +83,97 @@ def _get_type(typ):
     ----------
     typ: dtype
         Numpy or pandas dtype.
+    has_nulls: bool, optional
+        Whether the column has values which can't be written as its
+        type, see `_get_types`, so must be sprayed as UTF8. False by
+        default.
 
     Returns
     -------
     type: string
-        ECL data type.
-    """
-    typ = str(typ)
-    #  TODO: Can we make this work again? Non-nullable data types are a pain!
-    if 'float' in typ:
-        # return 'DECIMAL32_12'
-        pass
-    elif 'int' in typ:
-        # return 'INTEGER'
-        pass
-    elif 'bool' in typ:
-        # return 'BOOLEAN'
-        pass
-    else:
-        # return 'STRING'
-        pass
+        ECL data type. One of INTEGER1-8, UNSIGNED1-8, REAL4,
+        REAL8, BOOLEAN or UTF8.
+    """
+    if has_nulls:
+        return 'UTF8'
+
+    typ = str(pd.api.types.pandas_dtype(typ)).lower()
+    integer = re.match("^(u?)int(8|16|32|64)$", typ)
+    if integer:
+        return "{}{}".format("UNSIGNED" if integer.group(1) else "INTEGER",
+                             int(integer.group(2)) // 8)
+    elif typ in ('float16', 'float32'):
+        return 'REAL4'
+    elif typ == 'float64':
+        return 'REAL8'
+    elif typ in ('bool', 'boolean'):
+        return 'BOOLEAN'
+
+    return 'UTF8'
+
+
+def _get_types(df, na_value=None):
+    """
+    Return the HPCC data type of each column of a DataFrame, see
+    `_get_type`.
+
+    ECL has no nulls, so numeric and boolean columns with missing
+    values are sprayed as UTF8, with missing values as empty
+    strings, unless `na_value` is given in which case they keep
+    their type and missing values are written as `na_value`, see
+    `_fill_nulls`. Float columns with infinities are always sprayed
+    as UTF8, as ECL has no literal for them.
 
-    return 'STRING'
+    Parameters
+    ----------
+    df: pd.DataFrame
+        DataFrame to type.
+    na_value: int, float, bool or None, optional
+        Value missing values will be written as. None, keep them as
+        empty strings, by default.
+
+    Returns
+    -------
+    types: dict
+        ECL data type of each column, in the form {column: type}.
+    """
+    types = {}
+    for col, dtype in df.dtypes.items():
+        values = df[col]
+        has_nulls = na_value is None and values.hasnans
+        if not has_nulls and pd.api.types.is_float_dtype(dtype):
+            has_nulls = np.isinf(values.to_numpy(float, na_value=0)).any()
+        types[col] = _get_type(dtype, has_nulls)
+    return types
 
 
-def _stringify_rows(df, start_row, num_rows):
+def _fill_nulls(df, types, na_value=None):
+    """
+    Return a DataFrame with the missing values of columns not sprayed
+    as UTF8 replaced by `na_value`, or for BOOLEAN columns by
+    bool(`na_value`). `df` is returned if there are none.
+    """
+    filled = df
+    for col in df.columns:
+        typ = types[col]
+        if typ == "UTF8" or not df[col].hasnans:
+            continue
+        if filled is df:
+            filled = df.copy(deep=False)
+        filled[col] = df[col].fillna(bool(na_value) if typ == "BOOLEAN"
+                                     else na_value)
+    return filled
+
+
+def _stringify_rows(df, start_row, num_rows, types=None, na_value=None):
     """
     Return rows of a DataFrame as a HPCC ready string. Note: this ignores the
     index
 
+    Each column is converted to ECL literals in one go, with Arrow
+    compute if pyarrow is installed, and the rows are then joined
+    once, rather than row by row.
+
     Parameters
     ----------
     df: pd.DataFrame
@@ -96,35 +182,130 @@ def _stringify_rows(df, start_row, num_rows):
         Start index number.
     num_rows: int
         Number of rows to include.
+    types: dict, optional
+        ECL data type of each column, see `_get_types`. If None
+        they are found from `df`. None by default.
+    na_value: int, float, bool or None, optional
+        Value to write missing values as, see `_get_types`. None by
+        default.
 
     Returns
     -------
     str
         ECL ready string of the slice.
     """
-    sliced_df = df.loc[start_row:(start_row + num_rows - 1), df.columns]
+    if types is None:
+        types = _get_types(df, na_value)
+    sliced_df = df.iloc[start_row:start_row + num_rows]
+    if not len(sliced_df):
+        return ""
+    sliced_df = _fill_nulls(sliced_df, types, na_value)
+
+    if pa is None:
+        columns = [_python_literals(sliced_df[col], types[col])
+                   for col in sliced_df.columns]
+        return "{" + "},{".join(map(",".join, zip(*columns))) + "}"
+
+    columns = [_arrow_literals(sliced_df[col], types[col])
+               for col in sliced_df.columns]
+    rows = pc.binary_join_element_wise(
+        "{", pc.binary_join_element_wise(*columns, ","), "}", "")
+    return pc.binary_join(pa.ListArray.from_arrays([0, len(rows)], rows),
+                          ",")[0].as_py()
+
+
+def _utf8_strings(values):
+    """
+    Return a Series of a UTF8 column as the strings it is sprayed as,
+    with missing values as empty strings. Used by both the inline
+    and landing zone sprays so that they store the same values.
+    """
+    return values.astype(object).where(values.notna(), "").astype(str)
 
-    for col in sliced_df.columns:
-        dtype = sliced_df.dtypes[col]
-        ecl_type = _get_type(dtype)
-        if ecl_type == "STRING":
-            sliced_df[col] = sliced_df[col].fillna(
-                "").astype(str).str.replace("'", "\\'")
-            sliced_df[col] = "'" + sliced_df[col] + "'"
-        else:
-            sliced_df[col] = sliced_df[col].fillna(0)
 
-    return ','.join(
-        ["{" + ','.join(i) + "}" for i in
-         sliced_df.astype(str).values.tolist()]
-    ).encode('ascii', 'ignore').decode()
+def _escaped_strings(values):
+    """
+    Return a Series as strings escaped for an ECL string literal,
+    see `_utf8_strings`.
+    """
+    values = _utf8_strings(values)
+    for char, escaped in _ESCAPES:
+        values = values.str.replace(char, escaped, regex=False)
+    return values
+
+
+def _python_literals(values, ecl_type):
+    """
+    Return a Series as a list of ECL literals of type `ecl_type`.
+    """
+    if ecl_type == "BOOLEAN":
+        return [("FALSE", "TRUE")[v] for v in values.to_numpy(bool).tolist()]
+    elif ecl_type == "UTF8":
+        return ("U'" + _escaped_strings(values) + "'").tolist()
+    elif ecl_type.startswith("REAL"):
+        return list(map(repr, values.to_numpy(float).tolist()))
+    return list(map(str, values.to_numpy().tolist()))
+
+
+def _arrow_literals(values, ecl_type):
+    """
+    Return a Series as a pyarrow string array of ECL literals of
+    type `ecl_type`.
+    """
+    if ecl_type == "BOOLEAN":
+        return pc.if_else(pa.array(values.to_numpy(bool)), "TRUE", "FALSE")
+    elif ecl_type == "UTF8":
+        return pc.binary_join_element_wise(
+            "U'", pa.array(_escaped_strings(values), pa.string()), "'", "")
+    # Arrow writes the shortest form which reads back as the same
+    # number, e.g. 0.1 and 1e+20.
+    return pa.array(values.to_numpy()).cast(pa.string())
+
+
+def _to_csv(df, types, na_value=None):
+    """
+    Return a DataFrame as CSV bytes to spray with the record set of
+    `types`, without its index or header.
+
+    Parameters
+    ----------
+    df: pd.DataFrame
+        DataFrame to write.
+    types: dict
+        ECL data type of each column, see `_get_types`.
+    na_value: int, float, bool or None, optional
+        Value to write missing values as, see `_get_types`. None by
+        default.
+
+    Returns
+    -------
+    bytes
+        UTF-8 encoded CSV.
+    """
+    df = _fill_nulls(df, types, na_value).copy(deep=False)
+    for col in df.columns:
+        if types[col] == "UTF8":
+            df[col] = _utf8_strings(df[col])
+        elif types[col] == "BOOLEAN":
+            # A blank field is read as FALSE and anything else as TRUE.
+            df[col] = df[col].map({True: "1", False: ""})
+    return df.to_csv(index=False, header=False).encode("utf-8")
 
 
 def spray_file(connection, source_file, logical_file, overwrite=False,
                expire=None, chunk_size=100000, max_workers=5,
-               delete_workunit=True):
+               delete_workunit=True, method="auto", dest_group="mythor",
+               max_attempts=3, max_sleep=60, queue_depth=None,
+               serialise_workers=None, na_value=None, dfu_timeout=3600):
     """
-    Spray a file to a HPCC logical file, bypassing the landing zone.
+    Spray a file to a HPCC logical file.
+
+    By default the file is uploaded as a CSV to the cluster's
+    landing zone, sprayed with DFU and then written to
+    `logical_file` as a THOR file. Frames of up to
+    `INLINE_MAX_ROWS` rows are instead written straight from ECL
+    `DATASET` literals, bypassing the landing zone, as that needs
+    fewer round trips.
 
     Parameters
     ----------
@@ -138,10 +319,11 @@ def spray_file(connection, source_file, logical_file, overwrite=False,
         Should the file overwrite any pre-existing logical file.
         False by default.
     chunk_size: int, optional
-        Size of chunks to use when spraying file. 100000 by
-        default.
+        Size of chunks to use when spraying file. Through the
+        landing zone, this is the number of rows written to the CSV
+        at a time. 100000 by default.
     max_workers: int, optional
-        Number of concurrent threads to use when spraying.
+        Number of concurrent threads to use when spraying inline.
         Warning: too many will likely cause either your machine or
         your cluster to crash! 3 by default.
     expire: int
@@ -149,12 +331,71 @@ def spray_file(connection, source_file, logical_file, overwrite=False,
         (ie no expiry) by default
     delete_workunit: bool
         Delete workunit once completed.
+    method: {"auto", "landing_zone", "inline"}, optional
+        How to spray the file. "landing_zone" uploads it to the
+        first landing zone of the cluster and sprays it with DFU.
+        "inline" writes it in chunks from ECL `DATASET` literals,
+        which are then concatenated. "auto" is "inline" for frames
+        of up to `INLINE_MAX_ROWS` rows and "landing_zone"
+        otherwise. "auto" by default.
+    dest_group: str, optional
+        Cluster group to spray to through the landing zone.
+        "mythor" by default.
+    max_attempts: int, optional
+        Maximum number of times a request to the landing zone or
+        DFU should be attempted in the case of an exception being
+        raised. 3 by default.
+    max_sleep: int, optional
+        Maximum time, in seconds, to sleep between attempts.
+        60 by default.
+    queue_depth: int, optional
+        Maximum number of chunks held in memory at once when
+        spraying inline, counting those being sprayed and those
+        waiting for a free thread. Chunks are serialised as
+        threads free up, so serialising overlaps with spraying.
+        None, `max_workers` + 1, by default.
+    serialise_workers: int, optional
+        Number of processes to serialise chunks in, so that
+        serialising isn't limited to one core. Only used when
+        spraying inline, which "auto" does only for frames of up to
+        `INLINE_MAX_ROWS` rows. The frame's columns are copied once
+        into shared memory rather than pickled for each chunk, which
+        requires pyarrow. `queue_depth` should be at least
+        `max_workers` + `serialise_workers` to keep both busy.
+        None, serialise on the calling thread, by default.
+    na_value: int, float, bool or None, optional
+        As ECL has no nulls, numeric and boolean columns with
+        missing values are sprayed as UTF8, with missing values as
+        empty strings. If `na_value` is given they instead keep
+        their ECL type and missing values are written as
+        `na_value`, or bool(`na_value`) in boolean columns, which
+        can't be told apart from real values once sprayed. Missing
+        values in other columns are always empty strings. None by
+        default.
+    dfu_timeout: float, optional
+        Maximum time, in seconds, to wait for the DFU spray from
+        the landing zone to finish. 3600 by default.
 
     Returns
     -------
     None
 
+    Raises
+    ------
+    ValueError:
+        If `method` is not one of the above, the cluster has no
+        landing zone, or the upload or DFU spray fails.
+    TimeoutError:
+        If the DFU spray doesn't finish within `dfu_timeout`.
+    ImportError:
+        If `serialise_workers` is given when spraying inline and
+        pyarrow is not installed.
+
     """
+    if method not in ("auto", "landing_zone", "inline"):
+        raise ValueError("method must be 'auto', 'landing_zone' or "
+                         "'inline', not {}".format(method))
+
     if isinstance(source_file, pd.DataFrame):
         df = source_file
     elif isinstance(source_file, str):
@@ -166,35 +407,464 @@ def spray_file(connection, source_file, logical_file, overwrite=False,
         SyntaxWarning("""Your Logical file name (%s) did not start with
                         ~ so may not be sprayed to root""" % logical_file)
 
-    record_set = _make_record_set(df)
+    types = _get_types(df, na_value)
+    record_set = _make_record_set(df, types)
 
     chunks = make_chunks(len(df), chunk_size=chunk_size)
 
-    print('Any unicode characters will be converted to ASCII, not saying you '
-          'have any, just warning you! If you are getting odd errors you may '
-          'want to deal with your UTF before spraying.')
-    stringified_rows = (_stringify_rows(df, start_row, num_rows)
-                        for start_row, num_rows in chunks)
+    try:
+        if method == "landing_zone" or (method == "auto" and
+                                        len(df) > INLINE_MAX_ROWS):
+            _spray_landing_zone(connection, df, chunks, logical_file,
+                                types, overwrite, expire, delete_workunit,
+                                dest_group, max_attempts, max_sleep,
+                                na_value, dfu_timeout)
+            return
+
+        target_names = ["~TEMPHPYCC::{}from{}to{}".format(
+                logical_file.replace("~", ""), start_row,
+                start_row + num_rows)
+            for start_row, num_rows in chunks]
+
+        sprayed = []
+        try:
+            _spray_chunks(connection, df, chunks, target_names, types,
+                          record_set, overwrite, delete_workunit,
+                          max_workers, queue_depth or max_workers + 1,
+                          sprayed, serialise_workers, na_value)
+            _concatenate_logical_files(connection, target_names,
+                                       logical_file, record_set, overwrite,
+                                       expire, delete_workunit)
+        finally:
+            for tmp in sprayed:
+                delete_logical_file(connection, tmp, delete_workunit)
+    finally:
+        # Metadata read before the spray no longer describes the file.
+        connection._forget_file_metadata(logical_file)
+
+
+def _spray_chunks(connection, df, chunks, target_names, types, record_set,
+                  overwrite, delete_workunit, max_workers, queue_depth,
+                  sprayed, serialise_workers=None, na_value=None):
+    """
+    Spray chunks of a DataFrame to logical files from ECL `DATASET`
+    literals, see `_spray_stringified_data`.
+
+    Chunks are serialised, on the calling thread or by a pool of
+    `serialise_workers` processes, and sprayed by a pool of
+    `max_workers` threads. No more than `queue_depth` chunks are
+    being serialised or sprayed at once, so memory is bounded
+    whatever the size of `df`. If a chunk fails, no more are
+    started.
 
-    target_names = ["~TEMPHPYCC::{}from{}to{}".format(
-            logical_file.replace("~", ""), start_row, start_row + num_rows)
-        for start_row, num_rows in chunks]
+    Parameters
+    ----------
+    chunks: list of tuples
+        Chunks of rows to spray, in the form (start_row, num_rows).
+    target_names: list of str
+        Logical file to spray each chunk to.
+    types: dict
+        ECL data type of each column, see `_get_types`.
+    record_set: str
+        Recordset of `types`, see `_make_record_set`.
+    queue_depth: int
+        Maximum number of chunks being serialised or sprayed at once.
+    sprayed: list
+        List to append each logical file to once its chunk has been
+        sprayed, so they can be deleted even if a later chunk fails.
+    serialise_workers: int, optional
+        Number of processes to serialise chunks in. The columns of
+        `df` are copied once into shared memory, see `SharedFrame`,
+        rather than pickled for each chunk. None, serialise on the
+        calling thread, by default.
+    na_value: int, float, bool or None, optional
+        Value to write missing values as, see `_get_types`. None by
+        default.
+    Others:
+        See `spray_file`.
+
+    Returns
+    -------
+    None
+    """
+    with ExitStack() as stack:
+        connection._reserve_pool(max_workers)
+        threads = stack.enter_context(ThreadPoolExecutor(max_workers))
+        if serialise_workers:
+            processes = stack.enter_context(
+                ProcessPoolExecutor(serialise_workers))
+            spec = stack.enter_context(SharedFrame(df)).spec
+
+            def serialise(start_row, num_rows):
+                return processes.submit(_stringify_shared, spec, start_row,
+                                        num_rows, types, na_value)
+        else:
+            def serialise(start_row, num_rows):
+                future = Future()
+                try:
+                    future.set_result(_stringify_rows(
+                        df, start_row, num_rows, types, na_value))
+                except Exception as exc:
+                    future.set_exception(exc)
+                return future
+
+        pending = iter(zip(chunks, target_names))
+        serialising = {}
+        spraying = {}
+        try:
+            while True:
+                while len(serialising) + len(spraying) < queue_depth:
+                    chunk = next(pending, None)
+                    if chunk is None:
+                        break
+                    (start_row, num_rows), name = chunk
+                    serialising[serialise(start_row, num_rows)] = name
+                if not serialising and not spraying:
+                    break
+
+                done, _ = wait(list(serialising) + list(spraying),
+                               return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future in serialising:
+                        name = serialising.pop(future)
+                        spraying[threads.submit(
+                            _spray_stringified_data, connection,
+                            future.result(), record_set, name, overwrite,
+                            delete_workunit)] = name
+                    else:
+                        name = spraying.pop(future)
+                        future.result()
+                        sprayed.append(name)
+        except BaseException:
+            for future in list(serialising) + list(spraying):
+                future.cancel()
+            # Let chunks already being sprayed finish, so their
+            # logical files can be deleted.
+            for future, name in spraying.items():
+                if not future.cancelled() and future.exception() is None:
+                    sprayed.append(name)
+            raise
+
+
+def _stringify_shared(spec, start_row, num_rows, types, na_value=None):
+    """
+    Return rows of a `SharedFrame` as a HPCC ready string, see
+    `_stringify_rows`. Used to serialise chunks in another process.
+    """
+    return _stringify_rows(attach(spec, start_row, num_rows), 0, num_rows,
+                           types, na_value)
 
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        futures = [
-            executor.submit(_spray_stringified_data, connection, row,
-                            record_set, name, overwrite, delete_workunit)
-            for row, name in zip(stringified_rows, target_names)]
-        _, __ = wait(futures)
-        _ = [f.result() for f in futures]
 
-    _concatenate_logical_files(connection, target_names, logical_file, record_set, overwrite, expire, delete_workunit)
+def _spray_landing_zone(connection, df, chunks, logical_file, types,
+                        overwrite, expire, delete_workunit, dest_group,
+                        max_attempts, max_sleep, na_value=None,
+                        dfu_timeout=3600):
+    """
+    Spray a DataFrame to a HPCC logical file through the landing
+    zone.
+
+    The DataFrame is written, without its index or header, to a CSV
+    which is uploaded to the landing zone. The CSV is written a
+    chunk at a time to a temporary file, which is streamed to the
+    upload, so it is never held in memory whole. DFU sprays it to a
+    temporary CSV logical file, which ECL then writes to
+    `logical_file` with the record set of `types`. The CSV and the
+    temporary file are deleted afterwards, whether or not the spray
+    succeeds.
 
-    for tmp in target_names:
-        delete_logical_file(connection, tmp, delete_workunit)
+    Parameters
+    ----------
+    chunks: list of tuples
+        Chunks of rows to write to the CSV at a time, in the form
+        (start_row, num_rows).
+    types: dict
+        ECL data type of each column, see `_get_types`.
+    Others:
+        See `spray_file`.
+
+    Returns
+    -------
+    None
+
+    Raises
+    ------
+    ValueError:
+        If the cluster has no landing zone, or the upload or spray
+        fails.
+    TimeoutError:
+        If the spray doesn't finish within `dfu_timeout`.
+    """
+    zone = _get_landing_zone(connection, max_attempts, max_sleep)
+    file_name = "hpycc_{}.csv".format(uuid.uuid4().hex)
+    with TemporaryFile() as body:
+        content_type = _write_upload_body(
+            body, file_name, (_to_csv(df.iloc[start_row:start_row + num_rows],
+                                      types, na_value)
+                              for start_row, num_rows in chunks))
+        _upload_file(connection, zone, file_name, body, content_type,
+                     max_attempts, max_sleep)
+    try:
+        temp_file = temp_logical_file(logical_file)
+        wuid = _spray_variable(connection, zone, file_name, temp_file,
+                               dest_group, max_attempts, max_sleep)
+        _wait_for_dfu_workunit(connection, wuid, max_attempts, max_sleep,
+                               dfu_timeout)
+        try:
+            _concatenate_logical_files(
+                connection, [temp_file], logical_file,
+                _make_record_set(df, types), overwrite, expire,
+                delete_workunit, file_type="CSV(QUOTE('\"'), UNICODE)")
+        finally:
+            delete_logical_file(connection, temp_file, delete_workunit)
+    finally:
+        _delete_landing_zone_file(connection, zone, file_name, max_attempts,
+                                  max_sleep)
+
+
+def _get_landing_zone(connection, max_attempts, max_sleep):
+    """
+    Return the first landing zone of a HPCC instance.
+
+    Parameters
+    ----------
+    connection: `Connection`
+        HPCC Connection instance, see also `Connection`.
+    max_attempts, max_sleep: int
+        See `Connection.run_url_request`.
+
+    Returns
+    -------
+    zone: dict
+        The landing zone's "NetAddress", "Path" and "OS", as used
+        by FileSpray.
+
+    Raises
+    ------
+    ValueError:
+        If the instance has no landing zone.
+    """
+    url = "http://{}:{}/FileSpray/DropZoneFiles.json".format(
+        connection.server, connection.port)
+    rj = connection.run_url_request(url, max_attempts, max_sleep).json()
+    try:
+        zone = rj["DropZoneFilesResponse"]["DropZones"]["DropZone"][0]
+    except (KeyError, IndexError, TypeError) as exc:
+        raise ValueError("No landing zone found: {}".format(rj)) from exc
+
+    is_linux = str(zone.get("Linux", "true")).lower() == "true"
+    return {"NetAddress": zone["NetAddress"], "Path": zone["Path"],
+            "OS": 2 if is_linux else 0}
+
+
+def _write_upload_body(body, file_name, parts):
+    """
+    Write the multipart/form-data body of an upload of a file to a
+    landing zone.
+
+    Parameters
+    ----------
+    body: file
+        Open binary file to write the body to.
+    file_name: str
+        Name to give the file in the landing zone.
+    parts: iterable of bytes
+        Contents of the file, written as they are produced.
+
+    Returns
+    -------
+    content_type: str
+        Content-Type header of the body.
+    """
+    boundary = uuid.uuid4().hex
+    body.write((
+        '--{}\r\nContent-Disposition: form-data; name="UploadedFiles[]"; '
+        'filename="{}"\r\nContent-Type: text/csv\r\n\r\n').format(
+        boundary, file_name).encode("utf-8"))
+    for part in parts:
+        body.write(part)
+    body.write("\r\n--{}--\r\n".format(boundary).encode("utf-8"))
+    return "multipart/form-data; boundary={}".format(boundary)
+
+
+def _upload_file(connection, zone, file_name, body, content_type,
+                 max_attempts, max_sleep):
+    """
+    Upload a file to a landing zone.
+
+    Parameters
+    ----------
+    connection: `Connection`
+        HPCC Connection instance, see also `Connection`.
+    zone: dict
+        Landing zone, see `_get_landing_zone`.
+    file_name: str
+        Name to give the file in the landing zone.
+    body: file
+        Open file holding the multipart/form-data body of the
+        upload, see `_write_upload_body`. It is streamed rather
+        than read into memory.
+    content_type: str
+        Content-Type header of `body`.
+    max_attempts, max_sleep: int
+        See `Connection.run_url_request`.
+
+    Returns
+    -------
+    None
+
+    Raises
+    ------
+    ValueError:
+        If the upload fails.
+    """
+    url = ("http://{}:{}/FileSpray/UploadFile.json?upload_&rawxml_=1&"
+           "NetAddress={}&Path={}&OS={}").format(
+        connection.server, connection.port, zone["NetAddress"],
+        parse.quote_plus(zone["Path"]), zone["OS"])
+    rj = connection.run_url_request(
+        url, max_attempts, max_sleep, data=body,
+        headers={"Content-Type": content_type}).json()
+    try:
+        results = rj["UploadFilesResponse"]["UploadFileResults"][
+            "DFUActionResult"]
+    except (KeyError, TypeError) as exc:
+        raise ValueError("Upload of {} failed: {}".format(
+            file_name, rj)) from exc
+    if any(result.get("Result") != "Success" for result in results):
+        raise ValueError("Upload of {} failed: {}".format(file_name, rj))
+
+
+def _spray_variable(connection, zone, file_name, logical_file, dest_group,
+                    max_attempts, max_sleep):
+    """
+    Start a DFU spray of a CSV in a landing zone to a logical file.
+
+    Parameters
+    ----------
+    connection: `Connection`
+        HPCC Connection instance, see also `Connection`.
+    zone: dict
+        Landing zone, see `_get_landing_zone`.
+    file_name: str
+        Name of the CSV in the landing zone.
+    logical_file: str
+        Logical file to spray to.
+    dest_group: str
+        Cluster group to spray to.
+    max_attempts, max_sleep: int
+        See `Connection.run_url_request`.
+
+    Returns
+    -------
+    wuid: str
+        ID of the DFU workunit doing the spray.
+
+    Raises
+    ------
+    ValueError:
+        If the spray can't be started.
+    """
+    url = "http://{}:{}/FileSpray/SprayVariable.json".format(
+        connection.server, connection.port)
+    params = {
+        "sourceIP": zone["NetAddress"],
+        "sourcePath": "{}/{}".format(zone["Path"].rstrip("/"), file_name),
+        "sourceFormat": 1,  # csv
+        "sourceCsvSeparate": ",",
+        "sourceCsvTerminate": "\\n,\\r\\n",
+        "sourceCsvQuote": '"',
+        "destGroup": dest_group,
+        "destLogicalName": logical_file.lstrip("~"),
+        "overwrite": 1,
+    }
+    rj = connection.run_url_request(url, max_attempts, max_sleep,
+                                    data=params).json()
+    try:
+        return rj["SprayResponse"]["wuid"]
+    except (KeyError, TypeError) as exc:
+        raise ValueError("Spray of {} failed to start: {}".format(
+            file_name, rj)) from exc
+
+
+def _wait_for_dfu_workunit(connection, wuid, max_attempts, max_sleep,
+                           timeout=3600):
+    """
+    Wait for a DFU workunit to finish.
+
+    Parameters
+    ----------
+    connection: `Connection`
+        HPCC Connection instance, see also `Connection`.
+    wuid: str
+        ID of the DFU workunit.
+    max_attempts, max_sleep: int
+        See `Connection.run_url_request`.
+    timeout: float, optional
+        Maximum time, in seconds, to wait. 3600 by default.
+
+    Returns
+    -------
+    None
+
+    Raises
+    ------
+    ValueError:
+        If the workunit fails, is aborted or can't be found.
+    TimeoutError:
+        If the workunit hasn't finished within `timeout`.
+    """
+    url = "http://{}:{}/FileSpray/GetDFUWorkunit.json?wuid={}".format(
+        connection.server, connection.port, wuid)
+    deadline = monotonic() + timeout
+    while True:
+        rj = connection.run_url_request(url, max_attempts, max_sleep).json()
+        try:
+            result = rj["GetDFUWorkunitResponse"]["result"]
+            state = int(result["State"])
+        except (KeyError, TypeError, ValueError) as exc:
+            raise ValueError("Can't get state of {}: {}".format(
+                wuid, rj)) from exc
+        if state == DFU_FINISHED:
+            return
+        if state in DFU_FAILED:
+            raise ValueError("DFU workunit {} failed: {}".format(
+                wuid, result.get("StateMessage", result)))
+        if monotonic() >= deadline:
+            raise TimeoutError("DFU workunit {} didn't finish within {}s, "
+                               "it is {}".format(
+                                   wuid, timeout,
+                                   result.get("StateMessage", state)))
+        sleep(DFU_POLL_SECONDS)
+
+
+def _delete_landing_zone_file(connection, zone, file_name, max_attempts,
+                              max_sleep):
+    """
+    Delete a file from a landing zone.
+
+    Parameters
+    ----------
+    connection: `Connection`
+        HPCC Connection instance, see also `Connection`.
+    zone: dict
+        Landing zone, see `_get_landing_zone`.
+    file_name: str
+        Name of the file in the landing zone.
+    max_attempts, max_sleep: int
+        See `Connection.run_url_request`.
+
+    Returns
+    -------
+    None
+    """
+    url = "http://{}:{}/FileSpray/DeleteDropZoneFiles.json".format(
+        connection.server, connection.port)
+    connection.run_url_request(url, max_attempts, max_sleep, data={
+        "NetAddress": zone["NetAddress"], "Path": zone["Path"],
+        "OS": zone["OS"], "Names_i0": file_name})
 
 
-def _make_record_set(df):
+def _make_record_set(df, types=None):
     """
     Make an ECL recordset from a DataFrame.
 
@@ -202,20 +872,25 @@ def _make_record_set(df):
     ----------
     df: pd.DataFrame
         DataFrame to make recordset from.
+    types: dict, optional
+        ECL data type of each column, see `_get_types`. If None
+        they are found from `df`. None by default.
 
     Returns
     -------
     record_set: string
         String recordset.
     """
-    record_set = ";".join([" ".join((_get_type(dtype), col))
-                           for col, dtype
-                           in df.dtypes.to_dict().items()])
+    if types is None:
+        types = _get_types(df)
+    record_set = ";".join([" ".join((types[col], col))
+                           for col in df.columns])
     return record_set
 
 
 def _concatenate_logical_files(connection, to_concat, logical_file, record_set,
-                               overwrite, expire, delete_workunit):
+                               overwrite, expire, delete_workunit,
+                               file_type="THOR"):
     """
     Concatenate a list of logical files (with the same recordset)
     into a single logical file.
@@ -236,14 +911,17 @@ def _concatenate_logical_files(connection, to_concat, logical_file, record_set,
         Delete workunit once completed.
     expire: int
         How long (days) until the produced logical file expires?
+    file_type: str, optional
+        ECL file type of the files to concatenate, e.g.
+        "CSV(HEADING(1))". "THOR" by default.
 
     Returns
     -------
     None
     """
 
-    read_files = ["DATASET('{}', {{{}}}, THOR)".format(
-        nam, record_set) for nam in to_concat]
+    read_files = ["DATASET('{}', {{{}}}, {})".format(
+        nam, record_set, file_type) for nam in to_concat]
     read_files = '+\n'.join(read_files)
 
     script = "a := {};\nOUTPUT(a, ,'{}' "
@@ -0,0 +1,290 @@
+"""
+Caches used to avoid repeating work against a HPCC instance.
+
+Classes
+-------
+- `LRUCache` -- Thread safe least recently used cache.
+- `FileCache` -- Size capped on-disk cache of pyarrow.Tables.
+
+Functions
+---------
+- `hash_text` -- Return a hex digest of some strings.
+- `fingerprint_repo` -- Return a hex digest of the files in ECL repos.
+
+"""
+__all__ = ["LRUCache", "FileCache", "hash_text", "fingerprint_repo"]
+
+from collections import OrderedDict
+import hashlib
+import os
+import threading
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+
+class LRUCache:
+    def __init__(self, maxsize=128, on_evict=None):
+        """
+        Thread safe least recently used cache.
+
+        Once `maxsize` items are held, adding another evicts the
+        least recently used one.
+
+        Parameters
+        ----------
+        maxsize: int, optional
+            Maximum number of items to hold. 128 by default.
+        on_evict: callable, optional
+            Called as on_evict(key, value) for each item evicted to
+            make room for another, once the cache is unlocked, so it
+            can free whatever the value holds. Items removed with
+            `pop` or `clear` are not passed to it. None by default.
+
+        Attributes
+        ----------
+        maxsize: int
+            Maximum number of items to hold.
+        on_evict: callable or None
+            Called with each evicted item.
+
+        """
+        self.maxsize = maxsize
+        self.on_evict = on_evict
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        # Locks can't be pickled, and items such as compiled
+        # workunits are owned by this cache, so a copy starts empty.
+        return {"maxsize": self.maxsize, "on_evict": self.on_evict}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def get(self, key, default=None):
+        """
+        Return the value of `key`, or `default` if it is missing.
+        """
+        with self._lock:
+            try:
+                value = self._items[key]
+            except KeyError:
+                return default
+            self._items.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        """
+        Set `key` to `value`, evicting the least recently used item
+        if the cache is full.
+        """
+        evicted = []
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                evicted.append(self._items.popitem(last=False))
+        if self.on_evict is not None:
+            for old_key, old_value in evicted:
+                self.on_evict(old_key, old_value)
+
+    def pop(self, key, default=None):
+        """
+        Remove `key` and return its value, or `default` if it is
+        missing.
+        """
+        with self._lock:
+            try:
+                return self._items.pop(key)
+            except KeyError:
+                return default
+
+    def values(self):
+        """
+        Return a list of all values.
+        """
+        with self._lock:
+            return list(self._items.values())
+
+    def clear(self):
+        """
+        Remove all items.
+        """
+        with self._lock:
+            self._items.clear()
+
+
+class FileCache:
+    def __init__(self, directory, max_bytes=2 ** 30):
+        """
+        Size capped on-disk cache of pyarrow.Tables.
+
+        Each table is stored as an Arrow IPC file named after its
+        key, and read back memory mapped. Reading a table marks it
+        as recently used, and once the files total more than
+        `max_bytes` the least recently used are deleted. The
+        directory can be shared between processes, but the size cap
+        is only enforced by the process writing to it.
+
+        Parameters
+        ----------
+        directory: str
+            Directory to store tables in. It is created if required.
+        max_bytes: int, optional
+            Maximum total size, in bytes, of the stored tables.
+            1GiB by default.
+
+        Attributes
+        ----------
+        directory: str
+            Directory tables are stored in.
+        max_bytes: int
+            Maximum total size, in bytes, of the stored tables.
+
+        Raises
+        ------
+        ImportError:
+            If pyarrow is not installed.
+
+        """
+        if pa is None:
+            raise ImportError("FileCache requires pyarrow, install it with "
+                              "`pip install pyarrow`.")
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ".arrow")
+
+    def get(self, key):
+        """
+        Return the table stored as `key`, or None if there isn't one.
+        """
+        path = self._path(key)
+        try:
+            os.utime(path)
+            with pa.memory_map(path) as source:
+                return pa.ipc.open_file(source).read_all()
+        except (OSError, pa.ArrowInvalid):
+            return None
+
+    def set(self, key, table):
+        """
+        Store `table` as `key`, then delete the least recently used
+        tables until the cache is within `max_bytes`.
+        """
+        path = self._path(key)
+        with pa.OSFile(path + ".tmp", "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(path + ".tmp", path)
+
+        with self._lock:
+            files = []
+            for name in os.listdir(self.directory):
+                if not name.endswith(".arrow"):
+                    continue
+                try:
+                    st = os.stat(os.path.join(self.directory, name))
+                except OSError:
+                    continue
+                files.append((st.st_mtime, st.st_size, name))
+            total = sum(size for _, size, _ in files)
+            for _, size, name in sorted(files):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError:
+                    pass
+                total -= size
+
+    def clear(self):
+        """
+        Delete all stored tables.
+        """
+        with self._lock:
+            for name in os.listdir(self.directory):
+                if name.endswith(".arrow"):
+                    os.remove(os.path.join(self.directory, name))
+
+
+def hash_text(*texts):
+    """
+    Return a hex digest of some strings.
+
+    Parameters
+    ----------
+    texts: str
+        Strings to hash. None is treated as an empty string.
+
+    Returns
+    -------
+    str
+        sha256 hex digest of `texts`.
+
+    """
+    h = hashlib.sha256()
+    for text in texts:
+        h.update((text or "").encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+def fingerprint_repo(repo):
+    """
+    Return a hex digest of the files in one or more ECL repos.
+
+    The digest is built from the path, size and modification time
+    of every file under `repo` so it changes whenever an import
+    that a script could use is edited, added or removed, without
+    reading the files themselves.
+
+    Parameters
+    ----------
+    repo : str, list, None
+        A path to a location or locations to search for ecl
+        imports, see `Connection`.
+
+    Returns
+    -------
+    str
+        sha256 hex digest of the repo's files. The digest of an
+        empty string if `repo` is None.
+
+    """
+    repos = [repo] if isinstance(repo, str) else (repo or [])
+    entries = []
+    for r in repos:
+        entries.append(r)
+        for root, dirs, files in os.walk(r):
+            dirs.sort()
+            for name in sorted(files):
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                entries.append("{}:{}:{}".format(path, st.st_size,
+                                                 st.st_mtime_ns))
+    return hash_text(*entries)
@@ -1,12 +1,28 @@
 """
 functions that chunk an iterable.
 
+Classes
+-------
+- `AdaptiveChunker` -- Chunk a file, tuning chunk size and
+  concurrency as it downloads.
+
 Functions
 ---------
 - `make_chunks` -- Return tuples of start index and chunk size.
+- `sample_chunks` -- Return tuples of start index and chunk size of
+  a random sample.
+- `coalesce_rows` -- Return tuples of start index and chunk size
+  covering given items.
 
 """
-__all__ = ["make_chunks"]
+__all__ = ["make_chunks", "sample_chunks", "coalesce_rows",
+           "AdaptiveChunker"]
+
+import random
+from math import ceil
+from time import monotonic
+
+import numpy as np
 
 
 def make_chunks(num, chunk_size=10000):
@@ -33,3 +49,282 @@ def make_chunks(num, chunk_size=10000):
         chs.append((num - left_over, left_over))
 
     return chs
+
+
+def sample_chunks(num, n, n_chunks, random_state=None):
+    """
+    Return tuples of start index and chunk size of a random sample of
+    items, drawn as a spread of non-overlapping runs.
+
+    Each arrangement of the runs among the remaining items is
+    equally likely.
+
+    Parameters
+    ----------
+    num: int
+        Total number of items.
+    n: int
+        Number of items to sample. If `num` or more, all items are
+        returned as a single chunk.
+    n_chunks: int
+        Number of runs to split the sample into. Fewer are used if
+        `n` is smaller.
+    random_state: int, optional
+        Seed for the random number generator, for a repeatable
+        sample. None by default.
+
+    Returns
+    -------
+    chs: list of tuples
+        List of chunks in the form [(start_index, num_items)], in
+        order of start_index.
+
+    """
+    if n >= num:
+        return [(0, num)] if num else []
+    if n <= 0:
+        return []
+
+    chunk_size = ceil(n / max(1, n_chunks))
+    sizes = [chunk_size] * (n // chunk_size)
+    if n % chunk_size:
+        sizes.append(n % chunk_size)
+
+    # Place the runs among the num - n unsampled items: run i is
+    # preceded by (position of run i) - i unsampled items.
+    rng = random.Random(random_state)
+    positions = sorted(rng.sample(range(num - n + len(sizes)), len(sizes)))
+    chs = []
+    sampled = 0
+    for i, (position, size) in enumerate(zip(positions, sizes)):
+        chs.append((position - i + sampled, size))
+        sampled += size
+
+    return chs
+
+
+def coalesce_rows(row_ids, gap=0, chunk_size=None):
+    """
+    Return tuples of start index and chunk size which cover the given
+    items, merging items which are close together into one chunk.
+
+    Parameters
+    ----------
+    row_ids: iterable of int
+        Indexes of the items to cover, in any order. Duplicates are
+        allowed.
+    gap: int, optional
+        Largest number of unwanted items between two wanted items
+        for them to share a chunk. 0, only adjacent items, by
+        default.
+    chunk_size: int, optional
+        Max chunk size. None, unlimited, by default.
+
+    Returns
+    -------
+    chs: list of tuples
+        List of chunks in the form [(start_index, num_items)], in
+        order of start_index.
+
+    """
+    ids = np.unique(np.asarray(row_ids, dtype=np.int64))
+    if not ids.size:
+        return []
+
+    breaks = np.flatnonzero(np.diff(ids) > gap + 1) + 1
+    starts = ids[np.r_[0, breaks]]
+    ends = ids[np.r_[breaks - 1, ids.size - 1]] + 1
+
+    chs = []
+    for start, end in zip(starts.tolist(), ends.tolist()):
+        if chunk_size:
+            chs.extend((start + ch_start, n) for ch_start, n in
+                       make_chunks(end - start, chunk_size))
+        else:
+            chs.append((start, end - start))
+
+    return chs
+
+
+class AdaptiveChunker:
+    def __init__(self, chunk_size=None, workers=None, min_chunk_size=1000,
+                 max_chunk_size=1000000, target_latency=10):
+        """
+        Chunk a file, tuning chunk size and concurrency as it
+        downloads.
+
+        Pass an instance as the `chunk_size` of `get_thor_file()`.
+        Each completed chunk is timed and the chunk size and the
+        number of chunks in flight are adjusted AIMD style:
+
+        - Chunk size grows additively while chunks take less than
+          half of `target_latency`, and halves whenever a chunk
+          takes longer than `target_latency`.
+        - Concurrency is reviewed after every `workers` chunks. It
+          grows by one while the overall bytes per second keeps
+          improving, halves if any chunk in the last round was slower
+          than `target_latency`, and otherwise stays where it is.
+
+        Once the download finishes, the settled `chunk_size` and
+        `workers` can be read back and pinned for future runs.
+
+        Parameters
+        ----------
+        chunk_size: int, optional
+            Initial number of rows per chunk. If None, the chunk size
+            `get_thor_file()` would have picked automatically. None
+            by default.
+        workers: int, optional
+            Initial number of chunks in flight. If None, half of
+            `get_thor_file()`'s `max_workers`. None by default.
+        min_chunk_size: int, optional
+            Smallest chunk size to use. 1,000 by default.
+        max_chunk_size: int, optional
+            Largest chunk size to use. 1,000,000 by default.
+        target_latency: float, optional
+            Longest time, in seconds, a chunk should take. 10 by
+            default.
+
+        Attributes
+        ----------
+        chunk_size: int or None
+            Current number of rows per chunk.
+        workers: int or None
+            Current number of chunks in flight.
+        max_workers: int or None
+            Most chunks which may be in flight, set by
+            `get_thor_file()`.
+        record_size: int
+            Size of a record in bytes, set by `get_thor_file()`.
+        history: list of tuples
+            One entry per completed chunk in the form (chunk_size,
+            workers, seconds, bytes_per_second).
+
+        """
+        self.chunk_size = chunk_size
+        self.workers = workers
+        self.min_chunk_size = min_chunk_size
+        self.max_chunk_size = max_chunk_size
+        self.target_latency = target_latency
+        self.max_workers = None
+        self.record_size = 1
+        self.history = []
+
+        self._step = None
+        self._round_start = None
+        self._round_bytes = 0
+        self._round_chunks = 0
+        self._round_slow = False
+        self._last_throughput = None
+
+    def start(self, chunk_size, max_workers, record_size):
+        """
+        Prepare to download a file.
+
+        Parameters
+        ----------
+        chunk_size: int
+            Chunk size to start from if none was given.
+        max_workers: int
+            Most chunks which may be in flight.
+        record_size: int
+            Size of a record in bytes.
+
+        Returns
+        -------
+        None
+        """
+        self.max_workers = max_workers
+        self.record_size = record_size or 1
+        if self.chunk_size is None:
+            self.chunk_size = chunk_size
+        self.chunk_size = self._bound_chunk_size(self.chunk_size)
+        if self.workers is None:
+            self.workers = ceil(max_workers / 2)
+        self.workers = max(1, min(self.workers, max_workers))
+        self._step = max(self.min_chunk_size, self.chunk_size // 4)
+        self._start_round()
+
+    def chunks(self, num, start=0):
+        """
+        Yield tuples of start index and chunk size, using the
+        current chunk size for each.
+
+        Parameters
+        ----------
+        num: int
+            Total number of items.
+        start: int, optional
+            Index of the first item. 0 by default.
+
+        Yields
+        ------
+        tuple
+            In the form (start_index, num_items).
+        """
+        while start < num:
+            n = min(self.chunk_size, num - start)
+            yield start, n
+            start += n
+
+    def record(self, n_rows, seconds, chunk_size=None):
+        """
+        Record a completed chunk and adjust chunk size and
+        concurrency.
+
+        Parameters
+        ----------
+        n_rows: int
+            Number of rows in the chunk.
+        seconds: float
+            Time taken to download the chunk.
+        chunk_size: int, optional
+            Chunk size when the chunk was requested. With several
+            chunks in flight this may differ from the current chunk
+            size. None, the current chunk size, by default.
+
+        Returns
+        -------
+        None
+        """
+        chunk_size = chunk_size or self.chunk_size
+        n_bytes = n_rows * self.record_size
+        self.history.append((chunk_size, self.workers, seconds,
+                             n_bytes / max(seconds, 1e-9)))
+
+        # Short final chunks say little about a full one, so scale up.
+        latency = seconds * chunk_size / max(n_rows, 1)
+        if latency > self.target_latency:
+            # Chunks requested before an earlier decrease shouldn't
+            # decrease it again.
+            self.chunk_size = self._bound_chunk_size(
+                min(self.chunk_size, chunk_size // 2))
+            self._round_slow = True
+        elif latency < self.target_latency / 2:
+            self.chunk_size = self._bound_chunk_size(
+                self.chunk_size + self._step)
+
+        self._round_bytes += n_bytes
+        self._round_chunks += 1
+        if self._round_chunks >= self.workers:
+            self._end_round()
+
+    def _bound_chunk_size(self, chunk_size):
+        return max(self.min_chunk_size, min(chunk_size, self.max_chunk_size))
+
+    def _start_round(self):
+        self._round_start = monotonic()
+        self._round_bytes = 0
+        self._round_chunks = 0
+        self._round_slow = False
+
+    def _end_round(self):
+        elapsed = max(monotonic() - self._round_start, 1e-9)
+        throughput = self._round_bytes / elapsed
+        if self._round_slow:
+            self.workers = max(1, self.workers // 2)
+        elif (self._last_throughput is None
+              or throughput > self._last_throughput * 1.05):
+            self.workers = min(self.max_workers, self.workers + 1)
+        self._last_throughput = throughput
+        self._start_round()
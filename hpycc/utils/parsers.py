@@ -4,6 +4,11 @@ from collections import OrderedDict
 import pandas as pd
 import numpy as np
 
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
 
 def parse_xml(xml):
     """
@@ -19,6 +24,63 @@ def parse_xml(xml):
     df : pd.DataFrame
         Parsed xml.
     """
+    vls, lvls = _parse_xml_rows(xml)
+
+    df = pd.DataFrame(vls, columns=lvls)
+    df.replace("", np.nan, inplace=True)
+    df.fillna(np.nan, inplace=True)
+
+    df = _make_col_numeric(df)
+    df = _make_col_bool(df)
+
+    return df
+
+
+def parse_xml_to_arrow(xml):
+    """
+    Return a pyarrow.Table from a nested XML.
+
+    Columns are typed as `parse_xml` would type them: integer, then
+    float, then boolean if every value can be read as one, otherwise
+    string. Empty values are null.
+
+    Parameters
+    ----------
+    xml : str
+        xml to be parsed.
+
+    Returns
+    -------
+    table : pyarrow.Table
+        Parsed xml.
+    """
+    vls, lvls = _parse_xml_rows(xml)
+
+    columns = {}
+    for i, name in enumerate(lvls):
+        values = [row[i] if i < len(row) and row[i] != "" else None
+                  for row in vls]
+        columns[name] = _infer_arrow_array(pa.array(values, type=pa.string()))
+
+    return pa.table(columns)
+
+
+def _parse_xml_rows(xml):
+    """
+    Return the text of each row of a nested XML and the column names.
+
+    Parameters
+    ----------
+    xml : str
+        xml to be parsed.
+
+    Returns
+    -------
+    vls : list of lists
+        Text of each column of each row.
+    lvls : list
+        Column names in order of occurrence.
+    """
     vls = []
     lvls = []
 
@@ -32,14 +94,22 @@ def parse_xml(xml):
             newvls.append(child.text)
         vls.append(newvls)
 
-    df = pd.DataFrame(vls, columns=lvls)
-    df.replace("", np.nan, inplace=True)
-    df.fillna(np.nan, inplace=True)
+    return vls, lvls
 
-    df = _make_col_numeric(df)
-    df = _make_col_bool(df)
 
-    return df
+def _infer_arrow_array(arr):
+    """
+    Convert a string pyarrow.Array to integer, float or boolean if
+    every value can be read as one.
+    """
+    for typ in (pa.int64(), pa.float64()):
+        try:
+            return arr.cast(typ)
+        except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+            continue
+    if set(arr.drop_null().to_pylist()).issubset(["true", "false"]):
+        return arr.cast(pa.bool_())
+    return arr
 
 
 def _make_col_numeric(df):
@@ -172,6 +242,82 @@ def parse_schema_from_xml(xml):
     return schema_out
 
 
+def parse_wuresult_metadata(resp):
+    """
+    Parse the schema and total row count of a logical file from a
+    WUResult response.
+
+    Parameters
+    ----------
+    resp : dict
+        JSON response to a WUResult request for the logical file.
+
+    Returns
+    -------
+    schema : OrderedDict
+        Parsed schema, see `parse_schema_from_xml`.
+    num_rows : int
+        Total number of rows in the logical file.
+
+    Raises
+    ------
+    KeyError, TypeError:
+        If the response does not contain a schema.
+
+    """
+    try:
+        wuresultresponse = resp["WUResultResponse"]
+        schema_str = wuresultresponse["Result"]["XmlSchema"]["xml"]
+        schema = parse_schema_from_xml(schema_str)
+        num_rows = wuresultresponse["Total"]
+    except (KeyError, TypeError) as exc:
+        msg = "Can't find schema in returned json: {}".format(resp)
+        raise type(exc)(msg) from exc
+
+    return schema, num_rows
+
+
+def _parse_int(value):
+    """
+    Return an int from an ESP number, which may be formatted with
+    thousands separators. None if it can't be parsed.
+    """
+    try:
+        return int(str(value).replace(",", ""))
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_record_size(file_detail):
+    """
+    Return the average size, in bytes, of a logical file's records.
+
+    Parameters
+    ----------
+    file_detail : dict
+        The "FileDetail" of a WsDfu DFUInfo response.
+
+    Returns
+    -------
+    int or None
+        The fixed record size if the file has one, otherwise the
+        file size divided by the record count. None if neither is
+        known.
+
+    """
+    record_size = _parse_int(file_detail.get("RecordSize"))
+    if record_size:
+        return record_size
+
+    file_size = _parse_int(file_detail.get("FileSizeInt64",
+                                           file_detail.get("Filesize")))
+    record_count = _parse_int(file_detail.get("RecordCountInt64",
+                                              file_detail.get("RecordCount")))
+    if file_size and record_count:
+        return max(1, file_size // record_count)
+    return None
+
+
 def apply_custom_dtypes(schema, dtypes):
 
     if isinstance(dtypes, dict):
@@ -189,6 +335,73 @@ def apply_custom_dtypes(schema, dtypes):
     return schema
 
 
+def arrow_type(column):
+    """
+    Return the pyarrow type of a column of a schema.
+
+    Parameters
+    ----------
+    column : dict
+        Column of a schema, see `parse_schema_from_xml`.
+
+    Returns
+    -------
+    pyarrow.DataType
+        Type of the column. Sets become lists of their item type.
+        Types which can't be mapped are string.
+
+    """
+    typ = column['type']
+    translated_type = {bool: pa.bool_(), int: pa.int64(),
+                       float: pa.float64(), str: pa.string()}
+    if typ in translated_type:
+        out = translated_type[typ]
+    else:
+        try:
+            out = pa.from_numpy_dtype(np.dtype(typ))
+        except (TypeError, pa.ArrowNotImplementedError):
+            out = pa.string()
+
+    return pa.list_(out) if column['is_a_set'] else out
+
+
+def to_arrow_array(values, column):
+    """
+    Return a column of a logical file chunk as a pyarrow.Array.
+
+    Parameters
+    ----------
+    values : list
+        Values of the column, as returned by
+        `Connection.get_logical_file_chunk`.
+    column : dict
+        Column of a schema, see `parse_schema_from_xml`.
+
+    Returns
+    -------
+    pyarrow.Array
+        `values` with the type given by `arrow_type`. Integers too
+        long for int64 are returned as float64.
+
+    """
+    typ = arrow_type(column)
+    if column['is_a_set']:  # TODO: Nested DF are also caught here. Open issue to fix
+        values = [x["Item"] for x in values]
+
+    try:
+        return pa.array(values, type=typ)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, OverflowError):
+        pass
+    try:
+        return pa.array(values).cast(typ)
+    except (pa.ArrowInvalid, pa.ArrowNotImplementedError, OverflowError):
+        if not pa.types.is_integer(typ):
+            raise
+    # An int that is horrifically long cannot be converted properly. Use float instead
+    return pa.array([None if v is None else float(v) for v in values],
+                    type=pa.float64())
+
+
 def get_python_type_from_ecl_type(child):
     """
     Get the python type from an hpcc schema node
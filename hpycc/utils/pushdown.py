@@ -0,0 +1,281 @@
+"""
+Build ECL which does work on the cluster before a logical file is
+downloaded, so that less of it has to be transferred.
+
+Functions
+---------
+- `pushdown_script` -- Return ECL to write part of a logical file to another.
+- `aggregate_script` -- Return ECL to aggregate a logical file by group.
+- `compile_where` -- Return the ECL filter for a Python expression.
+- `temp_logical_file` -- Return a unique name for a temporary logical file.
+
+"""
+__all__ = ["pushdown_script", "aggregate_script", "compile_where",
+           "temp_logical_file"]
+
+import ast
+import uuid
+
+_COMPARISONS = {ast.Eq: "=", ast.NotEq: "<>", ast.Lt: "<", ast.LtE: "<=",
+                ast.Gt: ">", ast.GtE: ">="}
+_ARITHMETIC = {ast.Add: "+", ast.Sub: "-", ast.Mult: "*", ast.Div: "/",
+               ast.Mod: "%"}
+_BOOLEAN = {ast.And: "AND", ast.Or: "OR", ast.BitAnd: "AND",
+            ast.BitOr: "OR"}
+
+AGGREGATES = {
+    "count": "COUNT(GROUP)",
+    "sum": "SUM(GROUP, ds.{})",
+    "mean": "AVE(GROUP, ds.{})",
+    "min": "MIN(GROUP, ds.{})",
+    "max": "MAX(GROUP, ds.{})",
+    # ECL's VARIANCE divides by N, pandas' var and std by N - 1.
+    "var": "VARIANCE(GROUP, ds.{0}) * COUNT(GROUP) / (COUNT(GROUP) - 1)",
+    "std": "SQRT(VARIANCE(GROUP, ds.{0}) * COUNT(GROUP) / "
+           "(COUNT(GROUP) - 1))",
+}
+
+
+def temp_logical_file(logical_file):
+    """
+    Return a unique name for a temporary logical file derived from
+    `logical_file`.
+
+    Parameters
+    ----------
+    logical_file: str
+        Name of logical file the temporary file is derived from.
+
+    Returns
+    -------
+    str
+        Name of the form ~TEMPHPYCC::`logical_file`::`uuid`.
+    """
+    return "~TEMPHPYCC::{}::{}".format(logical_file.lstrip("~"),
+                                       uuid.uuid4().hex)
+
+
+def pushdown_script(logical_file, file_detail, target, columns=None,
+                    where=None):
+    """
+    Return ECL which writes selected rows and columns of a logical
+    file to a new logical file.
+
+    The record definition of `logical_file` is taken from DFU, so
+    the file is read with its own layout whatever it is. The target
+    file expires after a day in case it isn't deleted.
+
+    Parameters
+    ----------
+    logical_file: str
+        Name of logical file to read.
+    file_detail: dict
+        The "FileDetail" of a WsDfu DFUInfo response for
+        `logical_file`, see `Connection.get_logical_file_info`.
+    target: str
+        Name of logical file to write.
+    columns: list of str, optional
+        Columns to keep, in order. None, all columns, by default.
+    where: str, optional
+        ECL filter rows must match to be kept, see `compile_where`.
+        It may use columns which aren't kept. None, all rows, by
+        default.
+
+    Returns
+    -------
+    str
+        ECL script.
+
+    Raises
+    ------
+    ValueError:
+        If `file_detail` doesn't hold the file's record definition.
+    """
+    script = _read_dataset(logical_file, file_detail)
+    result = "ds"
+    if where is not None:
+        result = "ds({})".format(where)
+    if columns is not None:
+        result = "TABLE({}, {{{}}})".format(
+            result, ", ".join("ds.{}".format(c) for c in columns))
+    script.append("OUTPUT({}, , '{}', EXPIRE(1));".format(result, target))
+
+    return "\n".join(script)
+
+
+def aggregate_script(logical_file, file_detail, by, aggs, where=None):
+    """
+    Return ECL which outputs aggregates of a logical file for each
+    group of rows, sorted by group.
+
+    Parameters
+    ----------
+    logical_file: str
+        Name of logical file to read.
+    file_detail: dict
+        The "FileDetail" of a WsDfu DFUInfo response for
+        `logical_file`, see `Connection.get_logical_file_info`.
+    by: list of str
+        Columns to group by. If empty there is a single group.
+    aggs: list of tuples
+        Aggregates in the form (name, function, column), where
+        function is a key of `AGGREGATES`. column is ignored for
+        "count".
+    where: str, optional
+        ECL filter rows must match to be aggregated, see
+        `compile_where`. None, all rows, by default.
+
+    Returns
+    -------
+    str
+        ECL script.
+
+    Raises
+    ------
+    ValueError:
+        If `file_detail` doesn't hold the file's record definition.
+    """
+    script = _read_dataset(logical_file, file_detail)
+    fields = ["ds.{}".format(col) for col in by]
+    fields += ["{} := {}".format(name, AGGREGATES[func].format(col))
+               for name, func, col in aggs]
+
+    ds = "ds({})".format(where) if where is not None else "ds"
+    result = "TABLE({}, {{{}}}{})".format(
+        ds, ", ".join(fields), "".join(", " + col for col in by))
+    if by:
+        result = "SORT({}, {})".format(result, ", ".join(by))
+    script.append("OUTPUT({}, NAMED('aggregate'), ALL);".format(result))
+
+    return "\n".join(script)
+
+
+def _read_dataset(logical_file, file_detail):
+    """
+    Return the lines of ECL which define `ds` as the contents of a
+    logical file, read with its record definition from DFU.
+    """
+    record = (file_detail.get("Ecl") or "").strip()
+    if not record:
+        raise ValueError("DFU has no record definition for {}".format(
+            logical_file))
+
+    file_type = file_detail.get("Format") or file_detail.get("ContentType")
+    file_type = "CSV" if "csv" in (file_type or "").lower() else "THOR"
+
+    return ["rec := {}".format(record),
+            "ds := DATASET('~{}', rec, {});".format(
+                logical_file.lstrip("~"), file_type)]
+
+
+def compile_where(expression, columns):
+    """
+    Return the ECL filter equivalent to a Python expression over the
+    columns of a logical file.
+
+    Only a restricted set of expressions is allowed: column names;
+    str, int, float and bool literals; comparisons, which may be
+    chained; `in` and `not in` a list, tuple or set of literals;
+    `and`, `or` and `not` (or `&`, `|` and `~`); and the arithmetic
+    operators `+`, `-`, `*`, `/` and `%`.
+
+    Parameters
+    ----------
+    expression: str
+        Python expression, e.g. "(a > 1) and b in ('x', 'y')".
+    columns: iterable of str
+        Names of the columns of the logical file.
+
+    Returns
+    -------
+    str
+        ECL filter, e.g. "((a > 1) AND (b IN ['x', 'y']))".
+
+    Raises
+    ------
+    ValueError:
+        If `expression` isn't valid Python or uses anything not
+        listed above.
+    KeyError:
+        If `expression` uses a name which isn't a column.
+    """
+    try:
+        tree = ast.parse(expression, mode="eval")
+    except SyntaxError as exc:
+        raise ValueError("where is not a valid expression: {}".format(
+            expression)) from exc
+    return _compile_node(tree.body, set(columns))
+
+
+def _compile_literal(value):
+    """
+    Return the ECL literal for a Python str, int, float or bool.
+    """
+    if isinstance(value, bool):
+        return "TRUE" if value else "FALSE"
+    if isinstance(value, (int, float)):
+        return repr(value)
+    if isinstance(value, str):
+        return "'{}'".format(value.replace("\\", "\\\\").replace("'", "\\'"))
+    raise ValueError("where can't contain {!r}".format(value))
+
+
+def _compile_node(node, columns):
+    """
+    Return the ECL for a node of a where expression, see
+    `compile_where`.
+    """
+    if isinstance(node, ast.Name):
+        if node.id not in columns:
+            raise KeyError("where uses {} which is not a column".format(
+                node.id))
+        return node.id
+    if isinstance(node, ast.Constant):
+        return _compile_literal(node.value)
+    if isinstance(node, ast.BoolOp) and type(node.op) in _BOOLEAN:
+        op = " {} ".format(_BOOLEAN[type(node.op)])
+        return "({})".format(op.join(_compile_node(v, columns)
+                                     for v in node.values))
+    if isinstance(node, ast.UnaryOp):
+        if isinstance(node.op, (ast.Not, ast.Invert)):
+            return "(NOT {})".format(_compile_node(node.operand, columns))
+        if isinstance(node.op, ast.USub):
+            return "(-{})".format(_compile_node(node.operand, columns))
+    if isinstance(node, ast.BinOp):
+        if type(node.op) in _BOOLEAN:
+            op = _BOOLEAN[type(node.op)]
+        elif type(node.op) in _ARITHMETIC:
+            op = _ARITHMETIC[type(node.op)]
+        else:
+            op = None
+        if op:
+            return "({} {} {})".format(_compile_node(node.left, columns), op,
+                                       _compile_node(node.right, columns))
+    if isinstance(node, ast.Compare):
+        parts = []
+        left = node.left
+        for op, right in zip(node.ops, node.comparators):
+            parts.append(_compile_comparison(left, op, right, columns))
+            left = right
+        return parts[0] if len(parts) == 1 else "({})".format(
+            " AND ".join(parts))
+
+    raise ValueError("where can't contain {}".format(ast.dump(node)))
+
+
+def _compile_comparison(left, op, right, columns):
+    """
+    Return the ECL for a single comparison of a where expression.
+    """
+    lhs = _compile_node(left, columns)
+    if isinstance(op, (ast.In, ast.NotIn)):
+        if not isinstance(right, (ast.List, ast.Tuple, ast.Set)):
+            raise ValueError("where can only use in with a list of values")
+        values = ", ".join(_compile_node(v, columns) for v in right.elts)
+        test = "{} IN [{}]".format(lhs, values)
+        return "({})".format(test) if isinstance(op, ast.In) else \
+            "(NOT ({}))".format(test)
+    if type(op) not in _COMPARISONS:
+        raise ValueError("where can't contain {}".format(ast.dump(op)))
+    return "({} {} {})".format(lhs, _COMPARISONS[type(op)],
+                               _compile_node(right, columns))
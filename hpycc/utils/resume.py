@@ -0,0 +1,157 @@
+"""
+On-disk store of downloaded chunks, so an interrupted download of
+a logical file can be resumed.
+
+Classes
+-------
+- `ChunkStore` -- Downloaded chunks of a logical file and their manifest.
+
+"""
+__all__ = ["ChunkStore"]
+
+import json
+import os
+
+MANIFEST = "manifest.json"
+
+
+class ChunkStore:
+    def __init__(self, directory, logical_file, modified, num_rows, chunks):
+        """
+        Downloaded chunks of a logical file and their manifest.
+
+        The manifest records the logical file, its DFU modification
+        time and the chunk plan. If `directory` already holds a
+        manifest for the same, unchanged, file then its plan and the
+        chunks saved under it are reused, otherwise a new manifest
+        is written. Each chunk is saved as a JSON file, written to a
+        temporary name and then renamed, so only whole chunks are
+        ever found on restart.
+
+        Parameters
+        ----------
+        directory: str
+            Directory to store the manifest and chunks in. It is
+            created if required and should not be shared with other
+            downloads.
+        logical_file: str
+            Name of logical file.
+        modified: str
+            DFU modification time of the logical file.
+        num_rows: int
+            Number of rows in the logical file.
+        chunks: iterable of tuples
+            Chunk plan in the form (start_row, n_rows). Ignored if
+            resuming, in favour of the stored plan.
+
+        Attributes
+        ----------
+        directory: str
+            Directory the manifest and chunks are stored in.
+        chunks: list of tuples
+            Chunk plan in the form (start_row, n_rows).
+
+        Raises
+        ------
+        ValueError:
+            If `modified` is None, as changes to the file could not
+            be detected, or if `directory` holds a manifest for a
+            different file or for the file before it was modified.
+
+        """
+        if not modified:
+            raise ValueError("Can't resume {}, DFU doesn't give its "
+                             "modification time".format(logical_file))
+        self.directory = directory
+        manifest = {"logical_file": logical_file, "modified": modified,
+                    "num_rows": num_rows}
+
+        path = os.path.join(directory, MANIFEST)
+        try:
+            with open(path) as f:
+                stored = json.load(f)
+        except FileNotFoundError:
+            stored = None
+
+        if stored is None:
+            os.makedirs(directory, exist_ok=True)
+            self.chunks = [tuple(chunk) for chunk in chunks]
+            manifest["chunks"] = self.chunks
+            self._write(MANIFEST, manifest)
+        elif any(stored.get(k) != v for k, v in manifest.items()):
+            raise ValueError(
+                "{} holds a download of {} modified {}, not {} modified {}."
+                " Remove it to start again.".format(
+                    directory, stored.get("logical_file"),
+                    stored.get("modified"), logical_file, modified))
+        else:
+            self.chunks = [tuple(chunk) for chunk in stored["chunks"]]
+
+    def _chunk_path(self, start_row):
+        return os.path.join(self.directory, "{}.json".format(start_row))
+
+    def _write(self, name, obj):
+        path = os.path.join(self.directory, name)
+        with open(path + ".tmp", "w") as f:
+            json.dump(obj, f)
+        os.replace(path + ".tmp", path)
+
+    def has(self, start_row):
+        """
+        Return True if the chunk at `start_row` has been saved.
+        """
+        return os.path.exists(self._chunk_path(start_row))
+
+    def missing(self):
+        """
+        Return the chunks of the plan which have not been saved.
+        """
+        return [chunk for chunk in self.chunks if not self.has(chunk[0])]
+
+    def save(self, start_row, chunk):
+        """
+        Save a downloaded chunk.
+
+        Parameters
+        ----------
+        start_row: int
+            First row of the chunk.
+        chunk: dict
+            Chunk as returned by `Connection.get_logical_file_chunk`.
+
+        Returns
+        -------
+        None
+        """
+        self._write("{}.json".format(start_row),
+                    {col: list(values) for col, values in chunk.items()})
+
+    def load(self, start_row):
+        """
+        Return the saved chunk at `start_row`.
+        """
+        with open(self._chunk_path(start_row)) as f:
+            return json.load(f)
+
+    def clear(self):
+        """
+        Delete the manifest and the saved chunks, then `directory`
+        if nothing else is in it. Other files in `directory` are
+        left alone.
+
+        Returns
+        -------
+        None
+        """
+        names = ["{}.json".format(start_row) for start_row, _ in self.chunks]
+        names.append(MANIFEST)
+        for name in names:
+            for path in (name, name + ".tmp"):
+                try:
+                    os.remove(os.path.join(self.directory, path))
+                except FileNotFoundError:
+                    pass
+        try:
+            os.rmdir(self.directory)
+        except OSError:  # Not empty, so it holds other files
+            pass
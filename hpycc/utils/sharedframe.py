@@ -0,0 +1,204 @@
+"""
+Share the columns of a DataFrame with other processes through shared
+memory, so that they don't have to be pickled for each task.
+
+Classes
+-------
+- `SharedFrame` -- Columns of a DataFrame copied into shared memory.
+
+Functions
+---------
+- `attach` -- Return rows of a `SharedFrame` in another process.
+
+"""
+__all__ = ["SharedFrame", "attach"]
+
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+
+class SharedFrame:
+    def __init__(self, df):
+        """
+        Columns of a DataFrame copied into shared memory.
+
+        Numeric and boolean columns are shared as their numpy
+        buffers, with a mask of missing values for nullable dtypes.
+        Other columns are converted with `str` and shared as the
+        offsets and UTF-8 data buffers of a pyarrow string array,
+        with a mask of missing values. Every column is copied in a
+        single vectorised step. Only `spec`, which names the shared
+        memory blocks, needs to be sent to another process, where
+        `attach` reads rows back without copying the rest of the
+        frame.
+
+        Use as a context manager, or call `close`, to free the
+        shared memory.
+
+        Parameters
+        ----------
+        df: pd.DataFrame
+            DataFrame to share. Its index is not shared.
+
+        Attributes
+        ----------
+        spec: list of dicts
+            Picklable description of each column and the shared
+            memory blocks which hold it, see `attach`.
+        num_rows: int
+            Number of rows in the frame.
+
+        Raises
+        ------
+        ImportError:
+            If pyarrow is not installed.
+
+        """
+        if pa is None:
+            raise ImportError("SharedFrame requires pyarrow, install it with "
+                              "`pip install pyarrow`.")
+        self._blocks = []
+        self.spec = []
+        self.num_rows = len(df)
+        try:
+            for col in df.columns:
+                self.spec.append(self._share_column(col, df[col]))
+        except BaseException:
+            self.close()
+            raise
+
+    def _share(self, array):
+        """
+        Copy an array into a new shared memory block and return the
+        block's name.
+        """
+        block = shared_memory.SharedMemory(create=True,
+                                           size=max(array.nbytes, 1))
+        self._blocks.append(block)
+        np.ndarray(array.shape, array.dtype, buffer=block.buf)[:] = array
+        return block.name
+
+    def _share_column(self, col, values):
+        dtype = values.dtype
+        nulls = values.isna().to_numpy()
+        if isinstance(dtype, np.dtype) and dtype.kind in "biuf":
+            array = values.to_numpy()
+            return {"column": col, "dtype": array.dtype.str,
+                    "values": self._share(array)}
+        if dtype.kind in "biuf":
+            # A nullable extension type, e.g. Int64 or boolean.
+            array = values.to_numpy(dtype.numpy_dtype, na_value=0)
+            return {"column": col, "dtype": str(dtype),
+                    "values": self._share(array), "nulls": self._share(nulls)}
+
+        # Missing values are masked by nulls, whatever str made of them.
+        strings = pa.array(values.astype(str), pa.large_string())
+        _, offsets, data = strings.buffers()
+        offsets = np.frombuffer(offsets, np.int64)[
+            strings.offset:strings.offset + len(strings) + 1]
+        return {"column": col, "offsets": self._share(offsets),
+                "strings": self._share(np.frombuffer(data or b"", np.uint8)),
+                "nulls": self._share(nulls)}
+
+    def close(self):
+        """
+        Free the shared memory. Frames already returned by `attach`
+        are unaffected.
+
+        Returns
+        -------
+        None
+        """
+        for block in self._blocks:
+            block.close()
+            block.unlink()
+        self._blocks = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def attach(spec, start_row, num_rows):
+    """
+    Return rows of a `SharedFrame`, which may be in another process.
+
+    Parameters
+    ----------
+    spec: list of dicts
+        `SharedFrame.spec` of the frame.
+    start_row: int
+        First row to return.
+    num_rows: int
+        Number of rows to return.
+
+    Returns
+    -------
+    df: pd.DataFrame
+        The rows, indexed from 0. Columns shared as strings hold
+        str, with missing values missing.
+    """
+    end_row = start_row + num_rows
+    columns = {}
+    with _Blocks() as blocks:
+        for column in spec:
+            nulls = None
+            if "nulls" in column:
+                nulls = np.frombuffer(blocks.open(column["nulls"]),
+                                      dtype=np.bool_, count=end_row)
+                nulls = nulls[start_row:].copy()
+
+            if "values" in column:
+                dtype = pd.api.types.pandas_dtype(column["dtype"])
+                numpy_dtype = getattr(dtype, "numpy_dtype", dtype)
+                values = np.frombuffer(blocks.open(column["values"]),
+                                       dtype=numpy_dtype,
+                                       count=end_row)[start_row:].copy()
+                if nulls is not None:
+                    values = pd.array(values, dtype=dtype)
+                    values[nulls] = pd.NA
+            else:
+                offsets = pa.py_buffer(blocks.open(column["offsets"]))
+                data = pa.py_buffer(blocks.open(column["strings"]))
+                strings = pa.LargeStringArray.from_buffers(
+                    num_rows, offsets, data, offset=start_row)
+                values = strings.to_numpy(zero_copy_only=False)
+                values[nulls] = None
+                del offsets, data, strings
+            columns[column["column"]] = values
+
+    return pd.DataFrame(columns, columns=[c["column"] for c in spec])
+
+
+class _Blocks:
+    """
+    Shared memory blocks opened by name, which are closed on exit.
+    """
+    def __init__(self):
+        self._blocks = []
+
+    def open(self, name):
+        try:
+            # Only the creating process should track the block, or it
+            # may be unlinked when another process exits.
+            block = shared_memory.SharedMemory(name=name, track=False)
+        except TypeError:  # Python < 3.13 has no track argument
+            block = shared_memory.SharedMemory(name=name)
+        self._blocks.append(block)
+        return block.buf
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        for block in self._blocks:
+            block.close()
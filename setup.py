@@ -34,6 +34,11 @@ setup(
         "passlib",
         "simplejson==3.16.0"
     ],
+    extras_require={
+        'async': ['aiohttp'],
+        'arrow': ['pyarrow'],
+        'zstd': ['zstandard'],
+    },
     project_urls={
         'Bug Reports': 'https://github.com/OdinProAgrica/hpycc/issues',
         'Source': 'https://github.com/OdinProAgrica/hpycc',
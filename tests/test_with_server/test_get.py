@@ -634,7 +634,9 @@ class TestGetThorFile(unittest.TestCase):
             True,
             None
         )
-        get_thor_file(connection=self.conn, thor_file=file_name, max_workers=1)
+        # Chunks are capped at chunk_bytes, an INTEGER is 8 bytes.
+        get_thor_file(connection=self.conn, thor_file=file_name, max_workers=1,
+                      chunk_bytes=8 * 325000)
         expected = [
             unittest.mock.call(file_name, 0, 325000, 3, 60),
             unittest.mock.call(file_name, 325000, 25000, 3, 60)
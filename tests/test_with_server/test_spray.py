@@ -132,7 +132,8 @@ class Testsprayfiles(unittest.TestCase):
 
         res = get_thor_file(connection=conn, thor_file=thor_file)[['a', 'b']]
 
-        pd.testing.assert_frame_equal(df, res)
+        # read_csv types column a as int, which is sprayed as INTEGER8.
+        pd.testing.assert_frame_equal(df.astype({"a": "int64"}), res)
 
     def test_spray_file_string_no_tilde(self):
         thor_file = 'test_spray_file_string_no_tilde'
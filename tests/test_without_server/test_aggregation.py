@@ -0,0 +1,72 @@
+import unittest
+from unittest.mock import patch
+
+import numpy as np
+import pandas as pd
+
+import hpycc
+from tests.test_without_server.test_get import FakeHPCC
+
+
+class TestAggregate(unittest.TestCase):
+    def setUp(self):
+        self.conn = hpycc.Connection("user", test_conn=False)
+        self.fake = FakeHPCC(pd.DataFrame({"g": ["a", "b"],
+                                           "x": np.arange(2)}))
+        self.stdout = ("<Result><Dataset name='aggregate'>"
+                       "<Row><g>a</g><x_sum>3</x_sum><n>2</n></Row>"
+                       "<Row><g>b</g><x_sum>3</x_sum><n>1</n></Row>"
+                       "</Dataset></Result>")
+
+    def _aggregate(self, **kwargs):
+        result = unittest.mock.Mock(stdout=self.stdout)
+        with patch.object(hpycc.Connection, "run_url_request",
+                          side_effect=self.fake), \
+                patch.object(hpycc.Connection, "run_ecl_string",
+                             return_value=result) as run:
+            res = hpycc.aggregate(self.conn, "~thor::file", **kwargs)
+        return res, run
+
+    def test_aggregate_returns_parsed_result(self):
+        res, run = self._aggregate(by="g", aggs={"x": ["sum"],
+                                                 "n": ("x", "count")})
+        expected = pd.DataFrame({"g": ["a", "b"], "x_sum": [3, 3],
+                                 "n": [2, 1]})
+        pd.testing.assert_frame_equal(expected, res, check_dtype=False)
+
+        script = run.call_args[0][0]
+        self.assertIn("SORT(TABLE(ds, {ds.g, x_sum := SUM(GROUP, ds.x), "
+                      "n := COUNT(GROUP)}, g), g)", script)
+        self.assertIn("NAMED('aggregate'), ALL);", script)
+
+    def test_aggregate_reads_file_details_once(self):
+        with patch.object(hpycc.Connection, "run_url_request",
+                          side_effect=self.fake) as mock:
+            result = unittest.mock.Mock(stdout=self.stdout)
+            with patch.object(hpycc.Connection, "run_ecl_string",
+                              return_value=result) as run:
+                hpycc.aggregate(self.conn, "~thor::file", by="g")
+        urls = [c[0][0] for c in mock.call_args_list]
+        self.assertEqual(["DFUInfo" in url for url in urls], [True, False])
+        self.assertIn("rec := RECORD", run.call_args[0][0])
+
+    def test_aggregate_counts_all_rows_by_default(self):
+        _, run = self._aggregate(where="x > 0")
+        self.assertIn("OUTPUT(TABLE(ds((x > 0)), {count := COUNT(GROUP)}), ",
+                      run.call_args[0][0])
+
+    def test_aggregate_names_single_functions_after_column(self):
+        _, run = self._aggregate(aggs={"x": "mean"})
+        self.assertIn("x := AVE(GROUP, ds.x)", run.call_args[0][0])
+
+    def test_aggregate_raises_on_unknown_function(self):
+        with self.assertRaises(ValueError):
+            self._aggregate(aggs={"x": "median"})
+
+    def test_aggregate_raises_on_bad_name(self):
+        with self.assertRaises(ValueError):
+            self._aggregate(aggs={"x total": ("x", "sum")})
+
+    def test_aggregate_raises_on_unknown_column(self):
+        with self.assertRaises(KeyError):
+            self._aggregate(by=["z"])
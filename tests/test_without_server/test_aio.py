@@ -0,0 +1,162 @@
+import asyncio
+import unittest
+from unittest.mock import patch
+
+import pandas as pd
+from requests.exceptions import RetryError
+
+from hpycc import aio
+from hpycc.aio import AsyncConnection
+
+
+def _schema_response(total):
+    xml = "".join([
+        '<xs:schema xmlns:xs="http://www.w3.org/2001/XMLSchema">',
+        '<xs:element name="Dataset"><xs:complexType><xs:sequence>',
+        '<xs:element name="Row"><xs:complexType><xs:sequence>',
+        '<xs:element name="a" type="xs:integer"/>',
+        '<xs:element name="b" type="xs:string"/>',
+        '</xs:sequence></xs:complexType></xs:element>',
+        '</xs:sequence></xs:complexType></xs:element>',
+        '</xs:schema>'])
+    return {"WUResultResponse": {"Total": total,
+                                 "Result": {"XmlSchema": {"xml": xml}}}}
+
+
+class TestAsyncConnectionAttributes(unittest.TestCase):
+    def test_defaults(self):
+        conn = AsyncConnection("user")
+        self.assertEqual(conn.server, "localhost")
+        self.assertEqual(conn.port, 8010)
+        self.assertEqual(conn.max_concurrency, 100)
+
+    def test_username_raises_error_if_blank(self):
+        with self.assertRaises(AttributeError):
+            AsyncConnection("")
+
+    def test_password_raises_error_if_blank(self):
+        with self.assertRaises(AttributeError):
+            AsyncConnection("user", password=" ")
+
+    @patch.object(aio, "aiohttp", None)
+    def test_raises_without_aiohttp(self):
+        with self.assertRaises(ImportError):
+            AsyncConnection("user")
+
+
+class TestAsyncConnectionRunURLRequest(unittest.TestCase):
+    def test_run_url_request_raises_retry_error_when_exceeded(self):
+        async def run():
+            async with AsyncConnection("user", port=1) as conn:
+                await conn.run_url_request("http://localhost:1", 2, 0)
+
+        with self.assertRaises(RetryError):
+            asyncio.run(run())
+
+    def test_run_url_request_retries_timeouts(self):
+        class Response:
+            async def __aenter__(self):
+                return self
+
+            async def __aexit__(self, *exc):
+                pass
+
+            def raise_for_status(self):
+                pass
+
+            async def json(self, content_type):
+                return {"ok": True}
+
+        class Session:
+            closed = False
+            calls = 0
+
+            def get(self, url):
+                self.calls += 1
+                if self.calls == 1:
+                    raise asyncio.TimeoutError()
+                return Response()
+
+        async def run():
+            conn = AsyncConnection("user")
+            conn._session = Session()
+            return await conn.run_url_request("http://localhost", 2, 0)
+
+        self.assertEqual(asyncio.run(run()), {"ok": True})
+
+
+class TestAsyncGetThorFile(unittest.TestCase):
+    def setUp(self):
+        self.conn = AsyncConnection("user")
+
+    def _get(self, chunk_size, max_workers=2, total=5, info=None,
+             **kwargs):
+        in_flight = []
+        seen = []
+        self.requested = []
+
+        async def get_logical_file_info(*args):
+            if info is None:
+                raise RetryError()
+            return info
+
+        async def get_chunk_from_hpcc(*args):
+            return _schema_response(total)
+
+        async def get_logical_file_chunk(thor_file, start_row, n_rows, *_):
+            self.requested.append((start_row, n_rows))
+            in_flight.append(start_row)
+            seen.append(len(in_flight))
+            await asyncio.sleep(0.01 * (total - start_row))
+            in_flight.remove(start_row)
+            rows = range(start_row, start_row + n_rows)
+            return {"a": [str(i) for i in rows], "b": [str(i) for i in rows]}
+
+        self.conn.get_logical_file_info = get_logical_file_info
+        self.conn.get_chunk_from_hpcc = get_chunk_from_hpcc
+        self.conn.get_logical_file_chunk = get_logical_file_chunk
+        res = asyncio.run(aio.get_thor_file(
+            self.conn, "file", max_workers=max_workers,
+            chunk_size=chunk_size, **kwargs))
+        return res, max(seen or [0])
+
+    def test_get_thor_file_returns_rows_in_order(self):
+        res, _ = self._get(chunk_size=2)
+        expected = pd.DataFrame({"a": [0, 1, 2, 3, 4],
+                                 "b": ["0", "1", "2", "3", "4"]})
+        pd.testing.assert_frame_equal(expected, res, check_dtype=False)
+
+    def test_get_thor_file_limits_concurrency_to_max_workers(self):
+        _, most_in_flight = self._get(chunk_size=1, max_workers=2)
+        self.assertEqual(most_in_flight, 2)
+
+    def test_get_thor_file_sizes_chunks_by_dfu_record_size(self):
+        info = {"RecordSize": "100", "Modified": "2020-01-01 00:00:00"}
+        self._get(chunk_size="auto", info=info, chunk_bytes=200)
+        self.assertEqual(self.requested, [(0, 2), (2, 2), (4, 1)])
+
+    def test_get_thor_file_returns_empty_frame(self):
+        res, _ = self._get(chunk_size=1, total=0)
+        self.assertEqual(list(res.columns), ["a", "b"])
+        self.assertEqual(len(res), 0)
+
+
+class TestAsyncDeleteWorkunit(unittest.TestCase):
+    def test_delete_workunit_returns_true(self):
+        conn = AsyncConnection("user")
+
+        async def run_url_request(*_):
+            return {"WUDeleteResponse": {}}
+
+        conn.run_url_request = run_url_request
+        self.assertTrue(asyncio.run(aio.delete_workunit(conn, "W1")))
+
+    def test_delete_workunit_raises_on_failure(self):
+        conn = AsyncConnection("user")
+
+        async def run_url_request(*_):
+            return {"WUDeleteResponse": {"Exceptions": "bad"}}
+
+        conn.run_url_request = run_url_request
+        with self.assertRaises(ValueError):
+            asyncio.run(aio.delete_workunit(conn, "W1"))
@@ -1,5 +1,8 @@
 from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+import io
 import os
+import pickle
 import random
 import subprocess
 from tempfile import TemporaryDirectory
@@ -13,6 +16,7 @@ from requests import HTTPError
 
 import hpycc
 import hpycc.connection
+from hpycc.utils.parsers import parse_wuid_from_xml
 from hpycc.utils import docker_tools
 
 
@@ -195,6 +199,69 @@ class TestConnectionCheckSyntax(unittest.TestCase):
                 conn.check_syntax(p)
 
 
+class TestConnectionSyntaxCache(unittest.TestCase):
+    def setUp(self):
+        self.d = TemporaryDirectory()
+        self.script = os.path.join(self.d.name, "test.ecl")
+        with open(self.script, "w+") as file:
+            file.write("OUTPUT(2);")
+
+    def tearDown(self):
+        self.d.cleanup()
+
+    @patch.object(hpycc.Connection, "_run_command")
+    def test_check_syntax_skips_unchanged_script(self, mock):
+        conn = hpycc.Connection("user", test_conn=False)
+        conn.check_syntax(self.script)
+        conn.check_syntax(self.script)
+        self.assertEqual(mock.call_count, 1)
+
+    @patch.object(hpycc.Connection, "_run_command")
+    def test_check_syntax_rechecks_changed_script(self, mock):
+        conn = hpycc.Connection("user", test_conn=False)
+        conn.check_syntax(self.script)
+        with open(self.script, "w+") as file:
+            file.write("OUTPUT(3);")
+        conn.check_syntax(self.script)
+        self.assertEqual(mock.call_count, 2)
+
+    @patch.object(hpycc.Connection, "_run_command")
+    def test_check_syntax_rechecks_if_repo_changes(self, mock):
+        repo = os.path.join(self.d.name, "repo")
+        os.mkdir(repo)
+        conn = hpycc.Connection("user", test_conn=False, repo=repo)
+        conn.check_syntax(self.script)
+        with open(os.path.join(repo, "a.ecl"), "w+") as file:
+            file.write("EXPORT a := 1;")
+        conn.check_syntax(self.script)
+        self.assertEqual(mock.call_count, 2)
+
+    @patch.object(hpycc.Connection, "_run_command")
+    def test_check_syntax_does_not_cache_failures(self, mock):
+        mock.side_effect = subprocess.SubprocessError
+        conn = hpycc.Connection("user", test_conn=False)
+        for _ in range(2):
+            with self.assertRaises(SyntaxError):
+                conn.check_syntax(self.script)
+        self.assertEqual(mock.call_count, 2)
+
+    @patch.object(hpycc.Connection, "_run_command")
+    def test_check_syntax_cache_can_be_disabled(self, mock):
+        conn = hpycc.Connection("user", test_conn=False, syntax_cache_size=0)
+        conn.check_syntax(self.script)
+        conn.check_syntax(self.script)
+        self.assertEqual(mock.call_count, 2)
+
+    @patch.object(hpycc.Connection, "_run_command")
+    def test_check_syntax_uses_cache_dir_across_connections(self, mock):
+        cache_dir = os.path.join(self.d.name, "cache")
+        for _ in range(2):
+            conn = hpycc.Connection("user", test_conn=False,
+                                    syntax_cache_dir=cache_dir)
+            conn.check_syntax(self.script)
+        self.assertEqual(mock.call_count, 1)
+
+
 class TestConnectionRunECLScript(unittest.TestCase):
     @patch.object(hpycc.Connection, "_run_command")
     def test_run_ecl_script_command_uses_server_port_and_username(self, mock):
@@ -341,6 +408,198 @@ class TestConnectionRunECLScript(unittest.TestCase):
                                     delete_workunit=False, stored={})
 
 
+def _esp_responses(run_state="completed"):
+    responses = {
+        "WUCreateAndUpdate": {"WUUpdateResponse": {
+            "Workunit": {"Wuid": "W20180702-085912"}}},
+        "WUSubmit": {"WUSubmitResponse": {}},
+        "WUWaitCompiled": {"WUWaitResponse": {"StateID": 1}},
+        "WURun": {"WURunResponse": {
+            "Wuid": "W20180702-085912", "State": run_state,
+            "Results": "<Result><Dataset name='Result 1'><Row><Result_1>2"
+                       "</Result_1></Row></Dataset></Result>"}},
+        "WUDelete": {"WUDeleteResponse": {}}
+    }
+
+    def side_effect(url, max_attempts, max_sleep, data=None):
+        method = url.split("/")[-1].split("?")[0].replace(".json", "")
+        r = unittest.mock.Mock()
+        r.json.return_value = responses[method]
+        return r
+    return side_effect
+
+
+class TestConnectionRunECLScriptESP(unittest.TestCase):
+    def setUp(self):
+        self.d = TemporaryDirectory()
+        self.script = os.path.join(self.d.name, "test.ecl")
+        with open(self.script, "w+") as file:
+            file.write("OUTPUT(2);")
+
+    def tearDown(self):
+        self.d.cleanup()
+
+    @patch.object(hpycc.Connection, "_run_command")
+    @patch.object(hpycc.Connection, "run_url_request")
+    def test_esp_engine_checks_syntax_without_eclcc(self, mock_url, mock_cmd):
+        mock_url.return_value.json.return_value = {"WUSyntaxCheckResponse": {
+            "Errors": {"ECLException": [
+                {"Severity": "Warning", "Message": "unused"}]}}}
+        conn = hpycc.Connection("user", test_conn=False, engine="esp")
+        conn.check_syntax(self.script)
+        mock_cmd.assert_not_called()
+        url = mock_url.call_args[0][0]
+        self.assertTrue(url.endswith("/WsWorkunits/WUSyntaxCheckECL.json"))
+        self.assertEqual(mock_url.call_args[1]["data"]["ECL"], "OUTPUT(2);")
+
+    @patch.object(hpycc.Connection, "run_url_request")
+    def test_esp_engine_raises_syntax_error(self, mock_url):
+        mock_url.return_value.json.return_value = {"WUSyntaxCheckResponse": {
+            "Errors": {"ECLException": [
+                {"Severity": "Error", "Message": "Unknown identifier",
+                 "LineNo": 1, "Column": 3}]}}}
+        conn = hpycc.Connection("user", test_conn=False, engine="esp",
+                                syntax_cache_size=0)
+        with self.assertRaises(SyntaxError):
+            conn.check_syntax(self.script)
+
+    def test_engine_defaults_to_cli(self):
+        conn = hpycc.Connection("user", test_conn=False)
+        self.assertEqual(conn.engine, "cli")
+
+    def test_engine_raises_error_if_unknown(self):
+        with self.assertRaises(AttributeError):
+            hpycc.Connection("user", test_conn=False, engine="abc")
+
+    @patch.object(hpycc.Connection, "_run_command")
+    @patch.object(hpycc.Connection, "run_url_request")
+    def test_esp_engine_does_not_call_ecl(self, mock_url, mock_cmd):
+        mock_url.side_effect = _esp_responses()
+        conn = hpycc.Connection("user", test_conn=False, engine="esp")
+        conn.run_ecl_script(self.script, syntax_check=False,
+                            delete_workunit=False, stored={})
+        mock_cmd.assert_not_called()
+        methods = [c[0][0].split("/")[-1] for c in mock_url.call_args_list]
+        self.assertEqual(methods, ["WUCreateAndUpdate.json", "WUSubmit.json",
+                                   "WUWaitCompiled.json", "WURun.json"])
+
+    @patch.object(hpycc.Connection, "run_url_request")
+    def test_esp_engine_posts_script_and_stored(self, mock_url):
+        mock_url.side_effect = _esp_responses()
+        conn = hpycc.Connection("user", test_conn=False, engine="esp")
+        conn.run_ecl_script(self.script, syntax_check=False,
+                            delete_workunit=False, stored={"a": "b"})
+        create_data = mock_url.call_args_list[0][1]["data"]
+        self.assertEqual(create_data["QueryText"], "OUTPUT(2);")
+        run_data = mock_url.call_args_list[-1][1]["data"]
+        self.assertEqual(run_data["Variables.NamedValue.0.Name"], "a")
+        self.assertEqual(run_data["Variables.NamedValue.0.Value"], "b")
+
+    @patch.object(hpycc.Connection, "run_url_request")
+    def test_esp_engine_returns_ecl_run_style_output(self, mock_url):
+        mock_url.side_effect = _esp_responses()
+        conn = hpycc.Connection("user", test_conn=False, engine="esp")
+        res = conn.run_ecl_script(self.script, syntax_check=False,
+                                  delete_workunit=False, stored={})
+        self.assertEqual(parse_wuid_from_xml(res.stdout), "W20180702-085912")
+        self.assertIn("<Dataset name='Result 1'>", res.stdout)
+
+    @patch.object(hpycc.Connection, "run_url_request")
+    def test_esp_engine_raises_if_workunit_fails(self, mock_url):
+        mock_url.side_effect = _esp_responses(run_state="failed")
+        conn = hpycc.Connection("user", test_conn=False, engine="esp")
+        with self.assertRaises(subprocess.SubprocessError):
+            conn.run_ecl_script(self.script, syntax_check=False,
+                                delete_workunit=False, stored={})
+
+    @patch.object(hpycc.Connection, "_run_command")
+    @patch.object(hpycc.Connection, "run_url_request")
+    def test_esp_engine_uses_cli_with_repo(self, mock_url, mock_cmd):
+        conn = hpycc.Connection("user", test_conn=False, engine="esp",
+                                repo="C:")
+        conn.run_ecl_script(self.script, syntax_check=False,
+                            delete_workunit=False, stored={})
+        mock_cmd.assert_called()
+        mock_url.assert_not_called()
+
+
+class TestConnectionCompileCache(unittest.TestCase):
+    def setUp(self):
+        self.d = TemporaryDirectory()
+        self.script = os.path.join(self.d.name, "test.ecl")
+        with open(self.script, "w+") as file:
+            file.write("OUTPUT(2);")
+
+    def tearDown(self):
+        self.d.cleanup()
+
+    def _methods(self, mock):
+        return [c[0][0].split("/")[-1].split("?")[0].replace(".json", "")
+                for c in mock.call_args_list]
+
+    @patch.object(hpycc.Connection, "run_url_request")
+    def test_compile_cache_compiles_once(self, mock_url):
+        mock_url.side_effect = _esp_responses()
+        conn = hpycc.Connection("user", test_conn=False, engine="esp",
+                                compile_cache_size=2)
+        for value in ("a", "b"):
+            conn.run_ecl_script(self.script, syntax_check=False,
+                                delete_workunit=False, stored={"x": value})
+        self.assertEqual(self._methods(mock_url).count("WUCreateAndUpdate"), 1)
+        self.assertEqual(self._methods(mock_url).count("WURun"), 2)
+        run_data = mock_url.call_args_list[-1][1]["data"]
+        self.assertEqual(run_data["CloneWorkunit"], 1)
+        self.assertEqual(run_data["Variables.NamedValue.0.Value"], "b")
+
+    @patch.object(hpycc.Connection, "run_url_request")
+    def test_compile_cache_recompiles_changed_script(self, mock_url):
+        mock_url.side_effect = _esp_responses()
+        conn = hpycc.Connection("user", test_conn=False, engine="esp",
+                                compile_cache_size=2)
+        conn.run_ecl_script(self.script, False, False, None)
+        with open(self.script, "w+") as file:
+            file.write("OUTPUT(3);")
+        conn.run_ecl_script(self.script, False, False, None)
+        self.assertEqual(self._methods(mock_url).count("WUCreateAndUpdate"), 2)
+
+    @patch.object(hpycc.Connection, "run_url_request")
+    @patch.object(hpycc.Connection, "_run_command")
+    def test_compile_cache_deploys_with_cli_engine(self, mock_cmd, mock_url):
+        mock_url.side_effect = _esp_responses()
+        mock_cmd.return_value = namedtuple("Result", ["stdout", "stderr"])(
+            "Deployed\r\n   wuid: W20180702-085912   state: compiled", "")
+        conn = hpycc.Connection("user", test_conn=False, repo="C:",
+                                compile_cache_size=2)
+        conn.run_ecl_script(self.script, False, False, None)
+        conn.run_ecl_script(self.script, False, False, None)
+        self.assertEqual(mock_cmd.call_count, 1)
+        self.assertEqual(mock_cmd.call_args[0][0][:2], ["ecl", "deploy"])
+        self.assertEqual(self._methods(mock_url), ["WURun", "WURun"])
+
+    @patch.object(hpycc.Connection, "run_url_request")
+    def test_compile_cache_forgets_workunit_that_fails(self, mock_url):
+        mock_url.side_effect = _esp_responses(run_state="failed")
+        conn = hpycc.Connection("user", test_conn=False, engine="esp",
+                                compile_cache_size=2)
+        with self.assertRaises(subprocess.SubprocessError):
+            conn.run_ecl_script(self.script, False, False, None)
+        self.assertEqual(len(conn._compile_cache), 0)
+        self.assertEqual(self._methods(mock_url)[-1], "WUDelete")
+
+    @patch.object(hpycc.Connection, "run_url_request")
+    def test_compile_cache_deletes_evicted_workunit(self, mock_url):
+        mock_url.side_effect = _esp_responses()
+        conn = hpycc.Connection("user", test_conn=False, engine="esp",
+                                compile_cache_size=1)
+        conn.run_ecl_script(self.script, False, False, None)
+        self.assertNotIn("WUDelete", self._methods(mock_url))
+        with open(self.script, "w+") as file:
+            file.write("OUTPUT(3);")
+        conn.run_ecl_script(self.script, False, False, None)
+        self.assertEqual(self._methods(mock_url).count("WUDelete"), 1)
+        self.assertEqual(len(conn._compile_cache), 1)
+
+
 class TestConnectionGetLogicalFileChunk(unittest.TestCase):
     @patch.object(hpycc.Connection, "run_url_request")
     def test_get_logical_file_chunk_uses_correct_url(self, mock):
@@ -361,8 +620,87 @@ class TestConnectionGetLogicalFileChunk(unittest.TestCase):
                 conn.get_logical_file_chunk("file", 1, 2, 1, 0)
 
 
+_SCHEMA_XML = "".join([
+    '<xs:schema xmlns:xs="http://www.w3.org/2001/XMLSchema">',
+    '<xs:element name="Dataset"><xs:complexType><xs:sequence>',
+    '<xs:element name="Row"><xs:complexType><xs:sequence>',
+    '<xs:element name="a" type="xs:integer"/>',
+    '</xs:sequence></xs:complexType></xs:element>',
+    '</xs:sequence></xs:complexType></xs:element>',
+    '</xs:schema>'])
+
+
+class TestConnectionGetFileMetadata(unittest.TestCase):
+    def setUp(self):
+        self.modified = "2018-07-02 08:59:12"
+        self.total = 10
+
+        def side_effect(url, max_attempts, max_sleep):
+            r = unittest.mock.Mock()
+            if "DFUInfo" in url:
+                r.json.return_value = {"DFUInfoResponse": {"FileDetail": {
+                    "Modified": self.modified, "RecordSize": 8}}}
+            else:
+                r.json.return_value = {"WUResultResponse": {
+                    "Total": self.total,
+                    "Result": {"XmlSchema": {"xml": _SCHEMA_XML}}}}
+            return r
+
+        patcher = patch.object(hpycc.Connection, "run_url_request",
+                               side_effect=side_effect)
+        self.mock = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _urls(self):
+        return [c[0][0] for c in self.mock.call_args_list]
+
+    def test_get_file_metadata_returns_metadata(self):
+        conn = hpycc.Connection("user", test_conn=False)
+        res = conn.get_file_metadata("~a::file", 3, 0)
+        self.assertEqual(list(res.schema.keys()), ["a"])
+        self.assertEqual(res.num_rows, 10)
+        self.assertEqual(res.record_size, 8)
+        self.assertEqual(res.modified, self.modified)
+
+    def test_get_file_metadata_strips_tilde_for_dfuinfo(self):
+        conn = hpycc.Connection("user", test_conn=False)
+        conn.get_file_metadata("~a::file", 3, 0)
+        self.assertTrue(self._urls()[0].endswith("DFUInfo.json?Name=a%3A%3Afile"))
+
+    def test_get_file_metadata_skips_requests_within_ttl(self):
+        conn = hpycc.Connection("user", test_conn=False,
+                                metadata_cache_ttl=60)
+        conn.get_file_metadata("file", 3, 0)
+        conn.get_file_metadata("file", 3, 0)
+        self.assertEqual(self.mock.call_count, 2)
+
+    def test_get_file_metadata_only_checks_dfuinfo_if_unchanged(self):
+        conn = hpycc.Connection("user", test_conn=False)
+        conn.get_file_metadata("file", 3, 0)
+        self.total = 20
+        res = conn.get_file_metadata("file", 3, 0)
+        self.assertEqual(res.num_rows, 10)
+        self.assertEqual(["DFUInfo" in u for u in self._urls()],
+                         [True, False, True])
+
+    def test_get_file_metadata_refreshes_if_modified(self):
+        conn = hpycc.Connection("user", test_conn=False)
+        conn.get_file_metadata("file", 3, 0)
+        self.total = 20
+        self.modified = "2018-07-03 08:59:12"
+        res = conn.get_file_metadata("file", 3, 0)
+        self.assertEqual(res.num_rows, 20)
+
+    def test_get_file_metadata_cache_can_be_disabled(self):
+        conn = hpycc.Connection("user", test_conn=False,
+                                metadata_cache_size=0)
+        conn.get_file_metadata("file", 3, 0)
+        conn.get_file_metadata("file", 3, 0)
+        self.assertEqual(self.mock.call_count, 4)
+
+
 class TestConnectionRunURLRequest(unittest.TestCase):
-    @patch.object(requests, "get")
+    @patch.object(requests.Session, "get")
     def test_run_url_request_uses_all_attempts(self, mock):
         final_response = requests.Response()
         final_response.status_code = 200
@@ -372,7 +710,7 @@ class TestConnectionRunURLRequest(unittest.TestCase):
         conn.run_url_request("dfsd.dfd", max_attempts=5, max_sleep=3)
         self.assertEqual(mock.call_count, 5)
 
-    @patch.object(requests, "get")
+    @patch.object(requests.Session, "get")
     def test_run_url_request_counts_404_as_error(self, mock):
         bad_response = requests.Response()
         bad_response.status_code = 404
@@ -381,7 +719,7 @@ class TestConnectionRunURLRequest(unittest.TestCase):
         with self.assertRaises(requests.exceptions.RetryError):
             conn.run_url_request("dfsd.dfd", max_attempts=2, max_sleep=0)
 
-    @patch.object(requests, "get")
+    @patch.object(requests.Session, "get")
     def test_run_url_request_counts_500_as_error(self, mock):
         bad_response = requests.Response()
         bad_response.status_code = 500
@@ -390,7 +728,7 @@ class TestConnectionRunURLRequest(unittest.TestCase):
         with self.assertRaises(requests.exceptions.RetryError):
             conn.run_url_request("dfsd.dfd", max_attempts=2, max_sleep=0)
 
-    @patch.object(requests, "get")
+    @patch.object(requests.Session, "get")
     def test_run_url_request_uses_auth(self, mock):
         conn = hpycc.Connection("user", test_conn=False)
         conn.run_url_request("dfsd.dfd", max_attempts=5, max_sleep=0)
@@ -403,7 +741,26 @@ class TestConnectionRunURLRequest(unittest.TestCase):
             conn.run_url_request("dfsd.dfd", max_attempts=1, max_sleep=0)
         mock.assert_called_with(0, 0)
 
-    @patch.object(requests, "get")
+    @patch.object(requests.Session, "post")
+    def test_run_url_request_rewinds_file_body_on_retry(self, mock):
+        reads = []
+
+        def side_effect(url, data, **kwargs):
+            reads.append(data.read())
+            if len(reads) == 1:
+                raise ValueError
+            return unittest.mock.Mock()
+
+        mock.side_effect = side_effect
+        conn = hpycc.Connection("user", test_conn=False)
+        with io.BytesIO(b"body") as body:
+            body.read()
+            conn.run_url_request("dfsd.dfd", max_attempts=2, max_sleep=0,
+                                 data=body, headers={"Content-Type": "x"})
+        self.assertEqual(reads, [b"body", b"body"])
+        self.assertEqual(mock.call_args[1]["headers"], {"Content-Type": "x"})
+
+    @patch.object(requests.Session, "get")
     def test_run_url_request_uses_max_attempts_default_3(self, mock):
         conn = hpycc.Connection("user", test_conn=False)
         mock.side_effect = ValueError
@@ -411,7 +768,7 @@ class TestConnectionRunURLRequest(unittest.TestCase):
             conn.run_url_request("dfsd.dfd", max_attempts=3, max_sleep=0)
         self.assertEqual(mock.call_count, 3)
 
-    @patch.object(requests, "get")
+    @patch.object(requests.Session, "get")
     def test_run_url_request_uses_max_attempts_custom(self, mock):
         conn = hpycc.Connection("user", test_conn=False)
         mock.side_effect = ValueError
@@ -419,14 +776,14 @@ class TestConnectionRunURLRequest(unittest.TestCase):
             conn.run_url_request("dfsd.dfd", max_attempts=4, max_sleep=0)
         self.assertEqual(mock.call_count, 4)
 
-    @patch.object(requests, "get")
+    @patch.object(requests.Session, "get")
     def test_run_url_request_raises_retry_error_when_exceeded(self, mock):
         conn = hpycc.Connection("user", test_conn=False)
         mock.side_effect = ValueError
         with self.assertRaises(requests.exceptions.RetryError):
             conn.run_url_request("dfsd.dfd", max_attempts=1, max_sleep=0)
 
-    @patch.object(requests, "get")
+    @patch.object(requests.Session, "get")
     def test_run_url_request_returns_response_after_single_error(self, mock):
         r = requests.Response()
         r.status_code = 200
@@ -436,6 +793,56 @@ class TestConnectionRunURLRequest(unittest.TestCase):
         self.assertIsInstance(result, requests.Response)
 
 
+class TestConnectionSession(unittest.TestCase):
+    def test_pool_size_default(self):
+        conn = hpycc.Connection("user", test_conn=False)
+        self.assertEqual(conn.pool_size, 15)
+
+    def test_session_is_reused_within_a_thread(self):
+        conn = hpycc.Connection("user", test_conn=False)
+        self.assertIs(conn.session, conn.session)
+
+    def test_sessions_share_one_adapter_across_threads(self):
+        conn = hpycc.Connection("user", test_conn=False, pool_size=4)
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            sessions = list(executor.map(lambda _: conn.session, range(2)))
+        sessions.append(conn.session)
+        adapters = {id(s.get_adapter("http://localhost")) for s in sessions}
+        self.assertEqual(adapters, {id(conn._adapter)})
+        self.assertEqual(conn._adapter._pool_maxsize, 4)
+
+    def test_reserve_pool_grows_pool_for_more_workers(self):
+        conn = hpycc.Connection("user", test_conn=False, pool_size=4)
+        old = conn.session
+        conn._reserve_pool(2)
+        self.assertIs(conn.session, old)
+        conn._reserve_pool(30)
+        adapter = conn.session.get_adapter("http://localhost")
+        self.assertIsNot(conn.session, old)
+        self.assertEqual(adapter._pool_maxsize, 30)
+        self.assertEqual(conn.pool_size, 4)
+
+    def test_connection_pickles_without_its_pool(self):
+        conn = hpycc.Connection("user", test_conn=False, pool_size=4,
+                                compile_cache_size=2)
+        conn.session
+        conn._metadata_cache.set("file", 1)
+        copy = pickle.loads(pickle.dumps(conn))
+        self.assertEqual((copy.username, copy.pool_size), ("user", 4))
+        self.assertIsNone(copy._adapter)
+        self.assertEqual(len(copy._metadata_cache), 0)
+        adapter = copy.session.get_adapter("http://localhost")
+        self.assertIsNot(adapter, conn._adapter)
+        self.assertEqual(adapter._pool_maxsize, 4)
+
+    @patch.object(requests.Session, "get")
+    def test_test_connection_uses_session(self, mock):
+        conn = hpycc.Connection("user", test_conn=False)
+        conn.test_connection()
+        mock.assert_called_with("http://localhost:8010",
+                                auth=("user", "password"), timeout=5)
+
+
 class TestConnectionTestConnectionWithAuth(unittest.TestCase):
     @classmethod
     def setUpClass(cls):
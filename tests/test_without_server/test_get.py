@@ -0,0 +1,605 @@
+import json
+import os
+from tempfile import TemporaryDirectory
+from time import sleep
+import unittest
+from unittest.mock import patch
+from urllib import parse
+
+import numpy as np
+import pandas as pd
+from requests.exceptions import RetryError
+
+import hpycc
+from hpycc.get import (get_thor_file, iter_thor_file, get_rows,
+                       _auto_chunk_size,
+                       _estimate_record_size, _assemble_thor_file)
+from hpycc.utils.filechunker import AdaptiveChunker
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+
+def _ecl_type(dtype):
+    if pd.api.types.is_bool_dtype(dtype):
+        return "BOOLEAN"
+    if pd.api.types.is_integer_dtype(dtype):
+        return "INTEGER8"
+    if pd.api.types.is_float_dtype(dtype):
+        return "REAL8"
+    return "STRING"
+
+
+def _xml_type(dtype):
+    if pd.api.types.is_bool_dtype(dtype):
+        return "xs:boolean"
+    if pd.api.types.is_integer_dtype(dtype):
+        return "xs:integer"
+    if pd.api.types.is_float_dtype(dtype):
+        return "xs:double"
+    return "xs:string"
+
+
+class FakeHPCC:
+    """
+    Serve a DataFrame as a logical file, in place of
+    `Connection.run_url_request`.
+    """
+    def __init__(self, df, record_size=None, modified="2018-07-02 08:59:12"):
+        self.df = df
+        self.record_size = record_size
+        self.modified = modified
+        self.chunks = []
+
+    def schema(self):
+        fields = "".join('<xs:element name="{}" type="{}"/>'.format(
+            col, _xml_type(dtype)) for col, dtype in self.df.dtypes.items())
+        return "".join([
+            '<xs:schema xmlns:xs="http://www.w3.org/2001/XMLSchema">',
+            '<xs:element name="Dataset"><xs:complexType><xs:sequence>',
+            '<xs:element name="Row"><xs:complexType><xs:sequence>',
+            fields,
+            '</xs:sequence></xs:complexType></xs:element>',
+            '</xs:sequence></xs:complexType></xs:element>',
+            '</xs:schema>'])
+
+    def ecl(self):
+        return "RECORD\n{}END;\n".format("".join(
+            "  {} {};\n".format(_ecl_type(dtype), col)
+            for col, dtype in self.df.dtypes.items()))
+
+    def response(self, url):
+        query = dict(parse.parse_qsl(parse.urlparse(url).query))
+        if "DFUInfo" in url:
+            return {"DFUInfoResponse": {"FileDetail": {
+                "Modified": self.modified, "RecordSize": self.record_size,
+                "RecordCount": str(len(self.df)), "Ecl": self.ecl()}}}
+        start, count = int(query["Start"]), int(query["Count"])
+        if count > 1 or start > 0:
+            self.chunks.append((start, count))
+        rows = json.loads(self.df.iloc[start:start + count].to_json(
+            orient="records"))
+        return {"WUResultResponse": {
+            "Total": len(self.df),
+            "Result": {"XmlSchema": {"xml": self.schema()}, "Row": rows}}}
+
+    def __call__(self, url, max_attempts, max_sleep, data=None):
+        r = unittest.mock.Mock()
+        r.json.return_value = self.response(url)
+        return r
+
+
+class FakeHPCCTestCase(unittest.TestCase):
+    """
+    Tests against a `FakeHPCC` serving `df`, with integer column "a"
+    and string column "b", through `conn`.
+    """
+    num_rows = 100
+
+    def setUp(self):
+        self.df = pd.DataFrame({
+            "a": np.arange(self.num_rows, dtype=np.int64),
+            "b": [str(i) for i in range(self.num_rows)]})
+        self.conn = hpycc.Connection("user", test_conn=False)
+
+    def _patched(self, fake):
+        return patch.object(hpycc.Connection, "run_url_request",
+                            side_effect=fake)
+
+    def _get(self, fake, **kwargs):
+        with self._patched(fake):
+            return get_thor_file(self.conn, "file", **kwargs)
+
+
+class TestAutoChunkSize(unittest.TestCase):
+    def test_auto_chunk_size_does_not_chunk_small_files(self):
+        self.assertEqual(_auto_chunk_size(50000, 10, 8, 2 ** 24), 50000)
+
+    def test_auto_chunk_size_splits_between_workers(self):
+        self.assertEqual(_auto_chunk_size(150000, 2, 8, 2 ** 24), 75000)
+
+    def test_auto_chunk_size_caps_wide_records(self):
+        self.assertEqual(_auto_chunk_size(10 ** 7, 10, 4000, 4000000), 1000)
+
+    def test_auto_chunk_size_caps_small_wide_files(self):
+        self.assertEqual(_auto_chunk_size(50000, 10, 4000, 4000000), 1000)
+
+    def test_auto_chunk_size_gives_narrow_records_long_chunks(self):
+        self.assertEqual(_auto_chunk_size(10 ** 7, 10, 16, 2 ** 24), 1000000)
+
+    def test_auto_chunk_size_is_at_least_one(self):
+        self.assertEqual(_auto_chunk_size(10, 1, 100, 10), 1)
+
+
+class TestEstimateRecordSize(unittest.TestCase):
+    def test_estimate_record_size(self):
+        schema = {"a": {"type": int, "is_a_set": False},
+                  "b": {"type": bool, "is_a_set": False},
+                  "c": {"type": str, "is_a_set": False},
+                  "d": {"type": int, "is_a_set": True}}
+        self.assertEqual(_estimate_record_size(schema), 8 + 1 + 32 + 64)
+
+
+class TestAssembleThorFile(unittest.TestCase):
+    def setUp(self):
+        self.schema = {"a": {"type": int, "is_a_set": False},
+                       "b": {"type": str, "is_a_set": False},
+                       "c": {"type": float, "is_a_set": True}}
+
+    def test_assemble_thor_file_orders_rows_by_start_row(self):
+        chunks = [(2, {"a": ["2", "3"], "b": ["x", "y"],
+                       "c": [{"Item": ["1"]}, {"Item": []}]}),
+                  (0, {"a": [0, 1], "b": ["v", "w"],
+                       "c": [{"Item": ["1", "2"]}, {"Item": ["3"]}]})]
+        res = _assemble_thor_file(chunks, self.schema, 4)
+        self.assertEqual(res["a"].dtype, np.int64)
+        self.assertEqual(res["a"].tolist(), [0, 1, 2, 3])
+        self.assertEqual(res["b"].tolist(), ["v", "w", "x", "y"])
+        self.assertEqual(res["c"].tolist(), [[1.0, 2.0], [3.0], [1.0], []])
+
+    def test_assemble_thor_file_drops_rows_not_returned(self):
+        chunks = [(0, {"a": [0], "b": ["v"], "c": [{"Item": []}]}),
+                  (5, {"a": [5], "b": ["w"], "c": [{"Item": []}]})]
+        res = _assemble_thor_file(chunks, self.schema, 10)
+        self.assertEqual(res["a"].tolist(), [0, 5])
+        self.assertEqual(res["b"].tolist(), ["v", "w"])
+
+    def test_assemble_thor_file_uses_float_for_long_ints(self):
+        chunks = [(0, {"a": [1, 2 ** 70], "b": ["v", "w"],
+                       "c": [{"Item": []}, {"Item": []}]})]
+        res = _assemble_thor_file(chunks, self.schema, 2)
+        self.assertEqual(res["a"].dtype, np.float64)
+        self.assertEqual(res["a"].tolist(), [1.0, float(2 ** 70)])
+
+
+class TestGetThorFile(FakeHPCCTestCase):
+    def setUp(self):
+        super().setUp()
+        self.df["c"] = [i % 2 == 0 for i in range(100)]
+
+    def test_get_thor_file_returns_file(self):
+        res = self._get(FakeHPCC(self.df), chunk_size=7)
+        res = res.sort_values("a").reset_index(drop=True)
+        pd.testing.assert_frame_equal(self.df, res, check_dtype=False)
+
+    def test_get_thor_file_returns_rows_in_order(self):
+        fake = FakeHPCC(self.df)
+
+        def side_effect(url, *args, **kwargs):
+            start = int(dict(parse.parse_qsl(url))["Start"])
+            sleep(0.001 * (100 - start))
+            return fake(url, *args)
+
+        res = self._get(side_effect, chunk_size=10, max_workers=4)
+        pd.testing.assert_frame_equal(self.df, res, check_dtype=False)
+
+    def test_get_thor_file_auto_chunks_by_record_size(self):
+        fake = FakeHPCC(self.df, record_size=100)
+        self._get(fake, chunk_bytes=2000)
+        self.assertEqual(sorted(fake.chunks),
+                         [(i, 20) for i in range(0, 100, 20)])
+
+    def test_get_thor_file_limits_chunks_in_flight(self):
+        in_flight = []
+        most = []
+        fake = FakeHPCC(self.df)
+
+        def side_effect(url, *args, **kwargs):
+            in_flight.append(url)
+            most.append(len(in_flight))
+            sleep(0.01)
+            in_flight.remove(url)
+            return fake(url, *args)
+
+        self._get(side_effect, chunk_size=5, max_workers=3)
+        self.assertLessEqual(max(most), 3)
+
+    def test_get_thor_file_grows_pool_to_max_workers(self):
+        self.conn = hpycc.Connection("user", test_conn=False, pool_size=2)
+        self._get(FakeHPCC(self.df), chunk_size=10, max_workers=6)
+        self.assertEqual(self.conn._get_adapter()._pool_maxsize, 6)
+
+    @unittest.skipUnless(pa, "requires pyarrow")
+    def test_get_thor_file_returns_arrow_table(self):
+        res = self._get(FakeHPCC(self.df), chunk_size=30, output="arrow")
+        self.assertIsInstance(res, pa.Table)
+        self.assertEqual(res.schema, pa.schema([
+            ("a", pa.int64()), ("b", pa.string()), ("c", pa.bool_())]))
+        self.assertEqual(res.column("a").num_chunks, 4)
+        self.assertEqual(res.column("a").to_pylist(), list(range(100)))
+
+    @unittest.skipUnless(pa, "requires pyarrow")
+    def test_get_thor_file_returns_empty_arrow_table(self):
+        res = self._get(FakeHPCC(self.df.iloc[:0]), output="arrow")
+        self.assertEqual(res.num_rows, 0)
+        self.assertEqual(res.column_names, ["a", "b", "c"])
+
+    def test_get_thor_file_raises_on_unknown_output(self):
+        with self.assertRaises(ValueError):
+            self._get(FakeHPCC(self.df), output="polars")
+
+    @patch.object(hpycc.get, "pa", None)
+    def test_get_thor_file_arrow_raises_without_pyarrow(self):
+        with self.assertRaises(ImportError):
+            self._get(FakeHPCC(self.df), output="arrow")
+
+    def test_get_thor_file_rereads_modified_file(self):
+        self._get(FakeHPCC(self.df.iloc[:10]))
+        res = self._get(FakeHPCC(self.df.iloc[:20],
+                                 modified="2019-01-01 00:00:00"))
+        self.assertEqual(len(res), 20)
+
+    def test_delete_logical_file_forgets_metadata(self):
+        self._get(FakeHPCC(self.df), chunk_size=50)
+        with patch.object(hpycc.Connection, "run_ecl_string"):
+            hpycc.delete_logical_file(self.conn, "~file")
+        self.assertIsNone(self.conn._metadata_cache.get("file"))
+
+    def test_get_thor_file_with_adaptive_chunker_returns_file(self):
+        tuner = AdaptiveChunker(chunk_size=10, workers=1, min_chunk_size=5,
+                                target_latency=10)
+        fake = FakeHPCC(self.df)
+        res = self._get(fake, chunk_size=tuner, max_workers=4)
+        res = res.sort_values("a").reset_index(drop=True)
+        pd.testing.assert_frame_equal(self.df, res, check_dtype=False)
+        self.assertGreater(tuner.chunk_size, 10)
+        self.assertGreater(tuner.workers, 1)
+        self.assertEqual(sum(n for _, n in fake.chunks), 100)
+
+
+class TestGetThorFileColumns(FakeHPCCTestCase):
+    num_rows = 10
+
+    def setUp(self):
+        super().setUp()
+        self.df["c"] = [float(i) for i in range(10)]
+        self.full = FakeHPCC(self.df)
+        self.narrow = FakeHPCC(self.df[["c", "a"]])
+
+    def _get(self, **kwargs):
+        def side_effect(url, *args, **kwargs):
+            if "TEMPHPYCC" in url:
+                return self.narrow(url, *args)
+            return self.full(url, *args)
+
+        with self._patched(side_effect), \
+                patch.object(hpycc.Connection, "run_ecl_string") as run, \
+                patch.object(hpycc.get, "delete_logical_file") as delete:
+            res = get_thor_file(self.conn, "~thor::file", chunk_size=3,
+                                **kwargs)
+        return res, run, delete
+
+    def test_get_thor_file_downloads_projected_temp_file(self):
+        res, run, delete = self._get(columns=["c", "a"])
+        pd.testing.assert_frame_equal(self.df[["c", "a"]], res,
+                                      check_dtype=False)
+        self.assertEqual(self.full.chunks, [])
+        self.assertEqual(len(self.narrow.chunks), 4)
+
+        script = run.call_args[0][0]
+        temp_file = delete.call_args[0][1]
+        self.assertIn("TABLE(ds, {ds.c, ds.a})", script)
+        self.assertIn("DATASET('~thor::file', rec, THOR)", script)
+        self.assertIn("'{}'".format(temp_file), script)
+        self.assertTrue(temp_file.startswith("~TEMPHPYCC::thor::file::"))
+
+    def test_get_thor_file_filters_on_cluster(self):
+        self.narrow = FakeHPCC(self.df.iloc[5:].reset_index(drop=True))
+        res, run, _ = self._get(where="a >= 5 and b != 'x'")
+        pd.testing.assert_frame_equal(
+            self.df.iloc[5:].reset_index(drop=True), res, check_dtype=False)
+        self.assertIn("OUTPUT(ds(((a >= 5) AND (b <> 'x')))",
+                      run.call_args[0][0])
+
+    def test_get_thor_file_filters_and_projects(self):
+        _, run, _ = self._get(columns=["c", "a"], where="b == '1'")
+        self.assertIn("TABLE(ds((b = '1')), {ds.c, ds.a})",
+                      run.call_args[0][0])
+
+    def test_get_thor_file_raises_on_bad_where(self):
+        with self.assertRaises(ValueError):
+            self._get(where="__import__('os')")
+        with self.assertRaises(KeyError):
+            self._get(where="z > 1")
+
+    def test_get_thor_file_raises_on_unknown_columns(self):
+        with self.assertRaises(KeyError):
+            self._get(columns=["z"])
+
+    def test_get_thor_file_columns_rejects_resume_dir(self):
+        with self.assertRaises(ValueError):
+            self._get(columns=["a"], resume_dir="resume")
+
+
+class TestGetThorFileRows(FakeHPCCTestCase):
+
+    def test_get_thor_file_limit_fetches_one_chunk(self):
+        fake = FakeHPCC(self.df)
+        res = self._get(fake, limit=20)
+        self.assertEqual(fake.chunks, [(0, 20)])
+        pd.testing.assert_frame_equal(self.df.iloc[:20], res,
+                                      check_dtype=False)
+
+    def test_get_thor_file_limit_larger_than_file_returns_file(self):
+        res = self._get(FakeHPCC(self.df), limit=1000)
+        pd.testing.assert_frame_equal(self.df, res, check_dtype=False)
+
+    def test_get_thor_file_sample_returns_rows_indexed_by_row(self):
+        fake = FakeHPCC(self.df)
+        res = self._get(fake, sample=30, max_workers=2, random_state=1)
+        self.assertEqual(len(res), 30)
+        self.assertTrue(res.index.is_monotonic_increasing)
+        self.assertTrue(res.index.is_unique)
+        pd.testing.assert_frame_equal(self.df.loc[res.index], res,
+                                      check_dtype=False)
+        self.assertEqual(len(fake.chunks), 8)
+
+    def test_get_thor_file_sample_is_repeatable(self):
+        first = self._get(FakeHPCC(self.df), sample=10, random_state=3)
+        second = self._get(FakeHPCC(self.df), sample=10, random_state=3)
+        pd.testing.assert_frame_equal(first, second)
+
+    def test_get_thor_file_sample_uses_chunk_size(self):
+        fake = FakeHPCC(self.df)
+        self._get(fake, sample=30, chunk_size=10)
+        self.assertEqual([n for _, n in fake.chunks], [10, 10, 10])
+
+    def test_get_thor_file_fraction_of_limit(self):
+        res = self._get(FakeHPCC(self.df), limit=50, fraction=0.2)
+        self.assertEqual(len(res), 10)
+        self.assertLess(res.index.max(), 50)
+
+    @unittest.skipUnless(pa, "requires pyarrow")
+    def test_get_thor_file_sample_returns_arrow_table(self):
+        res = self._get(FakeHPCC(self.df), sample=25, output="arrow")
+        values = res.column("a").to_pylist()
+        self.assertEqual(len(values), 25)
+        self.assertEqual(values, sorted(set(values)))
+
+    def test_get_thor_file_rejects_sample_and_fraction(self):
+        with self.assertRaises(ValueError):
+            self._get(FakeHPCC(self.df), sample=10, fraction=0.1)
+
+    def test_get_thor_file_sample_rejects_resume_dir(self):
+        with self.assertRaises(ValueError):
+            self._get(FakeHPCC(self.df), sample=10, resume_dir="resume")
+
+    def test_get_thor_file_rejects_bad_fraction(self):
+        with self.assertRaises(ValueError):
+            self._get(FakeHPCC(self.df), fraction=1.5)
+
+
+class TestGetRows(FakeHPCCTestCase):
+    num_rows = 1000
+
+    def _get(self, fake, row_ids, **kwargs):
+        with self._patched(fake):
+            return get_rows(self.conn, "file", row_ids, **kwargs)
+
+    def test_get_rows_returns_rows_in_given_order(self):
+        row_ids = [900, 3, 5, 3, 500]
+        res = self._get(FakeHPCC(self.df), row_ids)
+        expected = self.df.iloc[row_ids]
+        pd.testing.assert_frame_equal(expected, res, check_dtype=False,
+                                      check_index_type=False)
+
+    def test_get_rows_coalesces_close_rows(self):
+        fake = FakeHPCC(self.df)
+        self._get(fake, [900, 3, 5, 10, 500, 520], gap=5)
+        self.assertEqual(sorted(fake.chunks),
+                         [(3, 8), (500, 1), (520, 1), (900, 1)])
+
+    def test_get_rows_splits_long_ranges(self):
+        fake = FakeHPCC(self.df, record_size=100)
+        res = self._get(fake, range(0, 100), chunk_bytes=2500)
+        self.assertEqual(sorted(fake.chunks),
+                         [(i, 25) for i in range(0, 100, 25)])
+        self.assertEqual(res["a"].tolist(), list(range(100)))
+
+    @unittest.skipUnless(pa, "requires pyarrow")
+    def test_get_rows_returns_arrow_table(self):
+        res = self._get(FakeHPCC(self.df), [7, 2, 999], output="arrow")
+        self.assertIsInstance(res, pa.Table)
+        self.assertEqual(res.column("a").to_pylist(), [7, 2, 999])
+
+    def test_get_rows_returns_empty_frame(self):
+        res = self._get(FakeHPCC(self.df), [])
+        self.assertEqual(len(res), 0)
+        self.assertEqual(list(res.columns), ["a", "b"])
+
+    def test_get_rows_raises_on_rows_outside_file(self):
+        with self.assertRaises(IndexError):
+            self._get(FakeHPCC(self.df), [1, 1000])
+
+
+class TestGetThorFileResume(FakeHPCCTestCase):
+    def setUp(self):
+        super().setUp()
+        self.tmp = TemporaryDirectory()
+        self.dir = os.path.join(self.tmp.name, "resume")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _get(self, fake, fail_at=None, **kwargs):
+        def side_effect(url, *args, **kwargs):
+            if "Start={}&".format(fail_at) in url:
+                raise RetryError("failed")
+            return fake(url, *args)
+
+        return super()._get(side_effect, chunk_size=10, max_workers=1,
+                            resume_dir=self.dir, **kwargs)
+
+    def test_get_thor_file_resumes_missing_chunks(self):
+        fake = FakeHPCC(self.df)
+        with self.assertRaises(RetryError):
+            self._get(fake, fail_at=50)
+        fake.chunks.clear()
+
+        res = self._get(fake)
+        self.assertEqual(sorted(fake.chunks),
+                         [(i, 10) for i in range(50, 100, 10)])
+        pd.testing.assert_frame_equal(self.df, res, check_dtype=False)
+        self.assertFalse(os.path.exists(self.dir))
+
+    @unittest.skipUnless(pa, "requires pyarrow")
+    def test_get_thor_file_resumes_arrow_in_order(self):
+        fake = FakeHPCC(self.df)
+        with self.assertRaises(RetryError):
+            self._get(fake, fail_at=50)
+
+        res = self._get(fake, output="arrow")
+        self.assertEqual(res.column("a").to_pylist(), list(range(100)))
+
+    def test_get_thor_file_refuses_to_resume_modified_file(self):
+        with self.assertRaises(RetryError):
+            self._get(FakeHPCC(self.df), fail_at=50)
+        self.conn._metadata_cache.clear()
+
+        with self.assertRaises(ValueError):
+            self._get(FakeHPCC(self.df, modified="2019-01-01 00:00:00"))
+
+    def test_get_thor_file_resume_rejects_adaptive_chunker(self):
+        with self.assertRaises(ValueError):
+            super()._get(FakeHPCC(self.df), resume_dir=self.dir,
+                         chunk_size=AdaptiveChunker())
+
+
+@unittest.skipUnless(pa, "requires pyarrow")
+class TestGetThorFileFileCache(FakeHPCCTestCase):
+    def setUp(self):
+        super().setUp()
+        self.tmp = TemporaryDirectory()
+        self.conn = hpycc.Connection("user", test_conn=False,
+                                     file_cache_dir=self.tmp.name)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _get(self, fake, **kwargs):
+        return super()._get(fake, chunk_size=10, **kwargs)
+
+    def test_get_thor_file_reads_unchanged_file_from_cache(self):
+        fake = FakeHPCC(self.df)
+        first = self._get(fake)
+        fake.chunks.clear()
+        second = self._get(fake)
+        self.assertEqual(fake.chunks, [])
+        pd.testing.assert_frame_equal(first, second)
+
+    def test_get_thor_file_downloads_modified_file(self):
+        self._get(FakeHPCC(self.df))
+        fake = FakeHPCC(self.df, modified="2019-01-01 00:00:00")
+        self._get(fake)
+        self.assertEqual(len(fake.chunks), 10)
+
+    def test_get_thor_file_caches_each_output_and_dtype(self):
+        fake = FakeHPCC(self.df)
+        self._get(fake)
+        fake.chunks.clear()
+        res = self._get(fake, output="arrow")
+        self.assertIsInstance(res, pa.Table)
+        self._get(fake, dtype=str)
+        self.assertEqual(len(fake.chunks), 20)
+
+    def test_get_thor_file_caches_sample_with_its_index(self):
+        fake = FakeHPCC(self.df)
+        first = self._get(fake, sample=10, random_state=3)
+        fake.chunks.clear()
+        second = self._get(fake, sample=10, random_state=3)
+        self.assertEqual(fake.chunks, [])
+        pd.testing.assert_frame_equal(first, second)
+
+    def test_get_thor_file_caches_sets_as_lists(self):
+        df = pd.DataFrame({"a": [[1, 2], [], [3]]})
+        first = _assemble_thor_file(
+            [(0, {"a": [{"Item": [1, 2]}, {"Item": []}, {"Item": [3]}]})],
+            {"a": {"type": int, "is_a_set": True}}, 3)
+        hpycc.get._to_cache(self.conn, "k", first)
+        res = hpycc.get._from_cached(self.conn._file_cache.get("k"),
+                                     "pandas")
+        pd.testing.assert_frame_equal(df, res)
+
+
+class TestIterThorFile(FakeHPCCTestCase):
+    def _iter(self, fake, **kwargs):
+        with self._patched(fake):
+            return list(iter_thor_file(self.conn, "file", **kwargs))
+
+    def test_iter_thor_file_yields_chunks_in_order(self):
+        fake = FakeHPCC(self.df)
+
+        def side_effect(url, *args, **kwargs):
+            start = int(dict(parse.parse_qsl(url))["Start"])
+            sleep(0.001 * (100 - start))
+            return fake(url, *args)
+
+        res = self._iter(side_effect, chunk_size=10, max_workers=4)
+        self.assertEqual(len(res), 10)
+        self.assertEqual([df.index[0] for df in res], list(range(0, 100, 10)))
+        pd.testing.assert_frame_equal(self.df, pd.concat(res),
+                                      check_dtype=False)
+
+    def test_iter_thor_file_bounds_chunks_in_flight(self):
+        fake = FakeHPCC(self.df)
+        with self._patched(fake):
+            batches = iter_thor_file(self.conn, "file", chunk_size=10,
+                                     max_workers=4, max_in_flight=2)
+            first = next(batches)
+            requested = len(fake.chunks)
+            batches.close()
+        self.assertEqual(list(first.index), list(range(10)))
+        self.assertLessEqual(requested, 2)
+
+    def test_iter_thor_file_yields_empty_frame(self):
+        res = self._iter(FakeHPCC(self.df.iloc[:0]))
+        self.assertEqual(len(res), 1)
+        self.assertEqual(list(res[0].columns), ["a", "b"])
+        self.assertEqual(len(res[0]), 0)
+
+
+@unittest.skipUnless(pa, "requires pyarrow")
+class TestGetOutputArrow(unittest.TestCase):
+    def setUp(self):
+        self.conn = hpycc.Connection("user", test_conn=False)
+        self.stdout = ("<Result><Dataset name='Result 1'><Row><a>1</a>"
+                       "<b>x</b></Row></Dataset><Dataset name='two'><Row>"
+                       "<c>true</c></Row></Dataset></Result>")
+
+    def _run(self, func):
+        result = unittest.mock.Mock(stdout=self.stdout)
+        with patch.object(hpycc.Connection, "run_ecl_script",
+                          return_value=result):
+            return func(self.conn, "script.ecl", output="arrow")
+
+    def test_get_output_returns_arrow_table(self):
+        res = self._run(hpycc.get_output)
+        self.assertEqual(res.schema, pa.schema([("a", pa.int64()),
+                                                ("b", pa.string())]))
+
+    def test_get_outputs_returns_arrow_tables(self):
+        res = self._run(hpycc.get_outputs)
+        self.assertEqual(list(res.keys()), ["Result_1", "two"])
+        self.assertEqual(res["two"].column("c").to_pylist(), [True])
@@ -0,0 +1,148 @@
+import bz2
+import gzip
+import os
+from tempfile import TemporaryDirectory
+import unittest
+from unittest.mock import patch
+
+import numpy as np
+import pandas as pd
+
+import hpycc
+from hpycc import save
+from hpycc.save import save_output, save_thor_file
+from tests.test_without_server.test_get import FakeHPCC
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+@unittest.skipUnless(pa, "requires pyarrow")
+class TestSaveThorFileParquet(unittest.TestCase):
+    def setUp(self):
+        self.df = pd.DataFrame({"a": np.arange(100, dtype=np.int64),
+                                "b": [str(i) for i in range(100)],
+                                "c": [i % 2 == 0 for i in range(100)]})
+        self.conn = hpycc.Connection("user", test_conn=False)
+        self.dir = TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, "file.parquet")
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def _save(self, fake, **kwargs):
+        with patch.object(hpycc.Connection, "run_url_request",
+                          side_effect=fake):
+            return save_thor_file(self.conn, "file", self.path,
+                                  format="parquet", **kwargs)
+
+    def test_save_thor_file_writes_parquet_row_group_per_chunk(self):
+        self._save(FakeHPCC(self.df), chunk_size=30)
+        res = pq.ParquetFile(self.path)
+        self.assertEqual(res.metadata.num_row_groups, 4)
+        self.assertEqual(res.schema_arrow, pa.schema([
+            ("a", pa.int64()), ("b", pa.string()), ("c", pa.bool_())]))
+        pd.testing.assert_frame_equal(self.df, res.read().to_pandas(),
+                                      check_dtype=False)
+
+    def test_save_thor_file_writes_empty_parquet(self):
+        self._save(FakeHPCC(self.df.iloc[:0]))
+        res = pq.read_table(self.path)
+        self.assertEqual(res.num_rows, 0)
+        self.assertEqual(res.column_names, ["a", "b", "c"])
+
+    def test_save_thor_file_parquet_requires_path(self):
+        with self.assertRaises(ValueError):
+            save_thor_file(self.conn, "file", format="parquet")
+
+    def test_save_thor_file_raises_on_unknown_format(self):
+        with self.assertRaises(ValueError):
+            save_thor_file(self.conn, "file", self.path, format="xlsx")
+
+
+class TestSaveThorFileCSV(unittest.TestCase):
+    def setUp(self):
+        self.df = pd.DataFrame({"a": np.arange(100, dtype=np.int64),
+                                "b": [str(i) for i in range(100)]})
+        self.conn = hpycc.Connection("user", test_conn=False)
+        self.dir = TemporaryDirectory()
+        self.expected = self.df.to_csv(index=False)
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def _save(self, path, **kwargs):
+        with patch.object(hpycc.Connection, "run_url_request",
+                          side_effect=FakeHPCC(self.df)):
+            return save_thor_file(self.conn, "file", path, chunk_size=30,
+                                  index=False, **kwargs)
+
+    def test_save_thor_file_returns_csv_string(self):
+        self.assertEqual(self._save(None), self.expected)
+
+    def test_save_thor_file_writes_csv(self):
+        path = os.path.join(self.dir.name, "file.csv")
+        self._save(path)
+        with open(path, newline="") as f:
+            self.assertEqual(f.read(), self.expected)
+
+    def test_save_thor_file_writes_gzip_members_in_parallel(self):
+        path = os.path.join(self.dir.name, "file.csv.gz")
+        self._save(path, compress_workers=2)
+        with open(path, "rb") as f:
+            raw = f.read()
+        self.assertEqual(raw.count(b"\x1f\x8b\x08"), 4)
+        self.assertEqual(gzip.decompress(raw).decode(), self.expected)
+
+    @unittest.skipUnless(zstandard, "requires zstandard")
+    def test_save_thor_file_writes_zstd(self):
+        path = os.path.join(self.dir.name, "file.csv")
+        self._save(path, compression="zstd")
+        with open(path, "rb") as f:
+            reader = zstandard.ZstdDecompressor().stream_reader(
+                f, read_across_frames=True)
+            self.assertEqual(reader.read().decode(), self.expected)
+
+    @patch.object(save, "zstandard", None)
+    def test_save_thor_file_zstd_raises_without_zstandard(self):
+        path = os.path.join(self.dir.name, "file.csv.zst")
+        with self.assertRaises(ImportError):
+            self._save(path)
+
+    def test_save_thor_file_passes_other_compression_to_pandas(self):
+        path = os.path.join(self.dir.name, "file.csv.bz2")
+        self._save(path)
+        with bz2.open(path, "rt", newline="") as f:
+            self.assertEqual(f.read(), self.expected)
+
+
+class TestSaveOutputCSV(unittest.TestCase):
+    def setUp(self):
+        self.conn = hpycc.Connection("user", test_conn=False)
+        self.dir = TemporaryDirectory()
+        rows = "".join("<Row><a>{}</a></Row>".format(i) for i in range(5))
+        self.result = unittest.mock.Mock(
+            stdout="<Dataset name='Result 1'>{}</Dataset>".format(rows))
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    @patch.object(save, "CSV_CHUNK_ROWS", 2)
+    def test_save_output_writes_gzip_in_blocks(self):
+        path = os.path.join(self.dir.name, "out.csv.gz")
+        with patch.object(hpycc.Connection, "run_ecl_script",
+                          return_value=self.result):
+            save_output(self.conn, "script.ecl", path, index=False)
+        with open(path, "rb") as f:
+            raw = f.read()
+        self.assertEqual(raw.count(b"\x1f\x8b\x08"), 3)
+        self.assertEqual(gzip.decompress(raw).decode(),
+                         "a\n0\n1\n2\n3\n4\n")
@@ -0,0 +1,333 @@
+import re
+import threading
+from time import sleep
+import unittest
+from unittest.mock import patch
+from urllib import parse
+
+import numpy as np
+import pandas as pd
+
+import hpycc
+from hpycc import spray
+from hpycc.spray import (spray_file, _get_type, _get_types, _make_record_set,
+                         _stringify_rows, _to_csv)
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+
+class TestGetType(unittest.TestCase):
+    def test_get_type_maps_integers_by_size(self):
+        self.assertEqual(_get_type(np.int8), "INTEGER1")
+        self.assertEqual(_get_type(np.int64), "INTEGER8")
+        self.assertEqual(_get_type(np.uint16), "UNSIGNED2")
+        self.assertEqual(_get_type(pd.Int32Dtype()), "INTEGER4")
+
+    def test_get_type_maps_floats_and_bools(self):
+        self.assertEqual(_get_type(np.float32), "REAL4")
+        self.assertEqual(_get_type(np.float64), "REAL8")
+        self.assertEqual(_get_type(np.bool_), "BOOLEAN")
+        self.assertEqual(_get_type(pd.BooleanDtype()), "BOOLEAN")
+
+    def test_get_type_maps_others_to_utf8(self):
+        self.assertEqual(_get_type(np.object_), "UTF8")
+        self.assertEqual(_get_type("datetime64[ns]"), "UTF8")
+
+    def test_get_type_maps_columns_with_nulls_to_utf8(self):
+        self.assertEqual(_get_type(np.int64, has_nulls=True), "UTF8")
+
+
+class TestStringifyRows(unittest.TestCase):
+    def setUp(self):
+        self.df = pd.DataFrame({
+            "a": [1, 2, 3],
+            "b": [0.5, 1.5, 2.5],
+            "c": [True, False, True],
+            "d": ["x", "it's", "line\nbreak"],
+            "e": [1.5, np.nan, np.inf],
+            "f": pd.array([1, None, 3], dtype="Int8")},
+            index=[10, 11, 12])
+
+    def test_get_types_sends_nulls_and_infinities_as_utf8(self):
+        self.assertEqual(_get_types(self.df), {
+            "a": "INTEGER8", "b": "REAL8", "c": "BOOLEAN", "d": "UTF8",
+            "e": "UTF8", "f": "UTF8"})
+
+    def test_get_types_with_na_value_keeps_types_of_columns_with_nulls(self):
+        self.assertEqual(_get_types(self.df, na_value=0)["f"], "INTEGER1")
+        self.assertEqual(_get_types(self.df, na_value=0)["e"], "UTF8")
+
+    def test_make_record_set_uses_types(self):
+        self.assertEqual(_make_record_set(self.df),
+                         "INTEGER8 a;REAL8 b;BOOLEAN c;UTF8 d;UTF8 e;UTF8 f")
+
+    def test_stringify_rows_writes_typed_literals(self):
+        res = _stringify_rows(self.df, 1, 2)
+        self.assertEqual(
+            res, "{2,1.5,FALSE,U'it\\'s',U'',U''},"
+                 "{3,2.5,TRUE,U'line\\nbreak',U'inf',U'3'}")
+
+    @patch.object(spray, "pa", None)
+    def test_stringify_rows_without_pyarrow(self):
+        res = _stringify_rows(self.df, 1, 2)
+        self.assertEqual(
+            res, "{2,1.5,FALSE,U'it\\'s',U'',U''},"
+                 "{3,2.5,TRUE,U'line\\nbreak',U'inf',U'3'}")
+
+    def test_stringify_rows_keeps_nulls_blank_by_default(self):
+        df = pd.DataFrame({"a": [0.5, np.nan],
+                           "b": pd.array([None, True], dtype="boolean")})
+        self.assertEqual(_stringify_rows(df, 0, 2),
+                         "{U'0.5',U''},{U'',U'True'}")
+        self.assertEqual(_to_csv(df, _get_types(df)), b"0.5,\n,True\n")
+
+    def test_stringify_rows_writes_nan_as_na_value(self):
+        df = pd.DataFrame({"a": [0.5, np.nan],
+                           "b": pd.array([None, True], dtype="boolean")})
+        types = _get_types(df, na_value=-1.5)
+        self.assertEqual(types, {"a": "REAL8", "b": "BOOLEAN"})
+        self.assertEqual(_stringify_rows(df, 0, 2, types, na_value=-1.5),
+                         "{0.5,TRUE},{-1.5,TRUE}")
+
+    def test_to_csv_writes_nan_as_na_value(self):
+        df = pd.DataFrame({"a": [0.5, np.nan]})
+        self.assertEqual(_to_csv(df, _get_types(df, na_value=-1.5),
+                                 na_value=-1.5),
+                         b"0.5\n-1.5\n")
+
+    def test_to_csv_writes_utf8_columns_as_stringify_rows(self):
+        df = pd.DataFrame({"a": pd.to_datetime(["2020-01-01", None]),
+                           "b": [1.5, np.inf]})
+        types = _get_types(df)
+        self.assertEqual(_stringify_rows(df, 0, 2, types),
+                         "{U'2020-01-01 00:00:00',U'1.5'},{U'',U'inf'}")
+        self.assertEqual(_to_csv(df, types),
+                         b"2020-01-01 00:00:00,1.5\n,inf\n")
+
+    def test_stringify_rows_writes_shortest_reals(self):
+        df = pd.DataFrame({"a": [0.1, 1e20]})
+        self.assertEqual(_stringify_rows(df, 0, 2), "{0.1},{1e+20}")
+
+    def test_stringify_rows_with_no_rows(self):
+        self.assertEqual(_stringify_rows(self.df, 3, 2), "")
+
+    def test_to_csv_writes_bools_as_blank_or_one(self):
+        res = _to_csv(self.df[["a", "c"]], _get_types(self.df))
+        self.assertEqual(res, b"1,1\n2,\n3,1\n")
+
+
+class FakeLandingZone:
+    """
+    Serve FileSpray requests, in place of
+    `Connection.run_url_request`.
+    """
+    def __init__(self, states=(3, 6), upload_result="Success"):
+        self.states = list(states)
+        self.upload_result = upload_result
+        self.uploads = {}
+        self.sprays = []
+        self.deleted = []
+
+    def upload(self, body, headers):
+        boundary = headers["Content-Type"].split("boundary=")[1].encode()
+        body.seek(0)
+        head, _, rest = body.read().partition(b"\r\n\r\n")
+        name = re.search(b'filename="([^"]+)"', head).group(1).decode()
+        self.uploads[name] = (name, rest[:rest.rindex(
+            b"\r\n--" + boundary + b"--")])
+
+    def response(self, url, data, files, headers):
+        method = parse.urlparse(url).path.rsplit("/", 1)[-1]
+        if method == "DropZoneFiles.json":
+            return {"DropZoneFilesResponse": {"DropZones": {"DropZone": [
+                {"Name": "mydropzone", "NetAddress": "10.0.0.1",
+                 "Path": "/var/lib/HPCCSystems/mydropzone",
+                 "Linux": "true"}]}}}
+        if method == "UploadFile.json":
+            self.upload(data, headers)
+            return {"UploadFilesResponse": {"UploadFileResults": {
+                "DFUActionResult": [{"Result": self.upload_result}]}}}
+        if method == "SprayVariable.json":
+            self.sprays.append(data)
+            return {"SprayResponse": {"wuid": "D20190101-000000"}}
+        if method == "GetDFUWorkunit.json":
+            return {"GetDFUWorkunitResponse": {"result": {
+                "State": self.states.pop(0), "StateMessage": "state"}}}
+        if method == "DeleteDropZoneFiles.json":
+            self.deleted.append(data["Names_i0"])
+            return {"DFUActionResults": {}}
+        raise AssertionError(url)
+
+    def __call__(self, url, max_attempts, max_sleep, data=None, files=None,
+                 headers=None):
+        r = unittest.mock.Mock()
+        r.json.return_value = self.response(url, data, files, headers)
+        return r
+
+
+@patch.object(spray, "DFU_POLL_SECONDS", 0)
+class TestSprayFileLandingZone(unittest.TestCase):
+    def setUp(self):
+        self.conn = hpycc.Connection("user", test_conn=False)
+        self.df = pd.DataFrame({"a": [1, 2, 3], "b": ["x", 'y"z', None]})
+
+    def _spray(self, fake, **kwargs):
+        with patch.object(hpycc.Connection, "run_url_request",
+                          side_effect=fake), \
+                patch.object(hpycc.Connection, "run_ecl_string") as mock:
+            kwargs.setdefault("method", "landing_zone")
+            spray_file(self.conn, self.df, "~a::file", **kwargs)
+        return [c[0][0] for c in mock.call_args_list]
+
+    def test_spray_file_uploads_csv_to_landing_zone(self):
+        fake = FakeLandingZone()
+        self._spray(fake, chunk_size=2)
+        (name, data), = fake.uploads.values()
+        self.assertTrue(name.endswith(".csv"))
+        self.assertEqual(data, b'1,x\n2,"y""z"\n3,\n')
+
+    def test_spray_file_sprays_upload_to_temp_file(self):
+        fake = FakeLandingZone()
+        self._spray(fake, dest_group="thor2")
+        (name, _), = fake.uploads.values()
+        spray_params, = fake.sprays
+        self.assertEqual(spray_params["sourceIP"], "10.0.0.1")
+        self.assertEqual(spray_params["sourcePath"],
+                         "/var/lib/HPCCSystems/mydropzone/" + name)
+        self.assertEqual(spray_params["destGroup"], "thor2")
+        self.assertTrue(spray_params["destLogicalName"].startswith(
+            "TEMPHPYCC::a::file::"))
+
+    def test_spray_file_writes_thor_file_and_cleans_up(self):
+        fake = FakeLandingZone()
+        scripts = self._spray(fake, overwrite=True, expire=2)
+        temp_file = "~" + fake.sprays[0]["destLogicalName"]
+        write, delete = scripts
+        self.assertIn("DATASET('{}', {{INTEGER8 a;UTF8 b}}, "
+                      "CSV(QUOTE('\"'), UNICODE))".format(temp_file), write)
+        self.assertIn("'~a::file' , OVERWRITE, EXPIRE(2)", write)
+        self.assertIn(temp_file, delete)
+        self.assertEqual(fake.deleted, [n for n, _ in fake.uploads.values()])
+
+    def test_spray_file_streams_upload_from_a_file(self):
+        fake = FakeLandingZone()
+        with patch.object(spray, "_to_csv", side_effect=spray._to_csv) as m:
+            self._spray(fake, chunk_size=1)
+        self.assertEqual(m.call_count, 3)
+        (_, data), = fake.uploads.values()
+        self.assertEqual(data, b'1,x\n2,"y""z"\n3,\n')
+
+    @patch.object(spray, "monotonic", side_effect=[0, 10, 20])
+    def test_spray_file_times_out_waiting_for_dfu(self, _):
+        fake = FakeLandingZone(states=(3, 3))
+        with self.assertRaises(TimeoutError):
+            self._spray(fake, dfu_timeout=15)
+        self.assertEqual(fake.states, [])
+        self.assertEqual(len(fake.deleted), 1)
+
+    def test_spray_file_raises_if_dfu_fails(self):
+        fake = FakeLandingZone(states=(3, 5))
+        with self.assertRaises(ValueError):
+            self._spray(fake)
+        self.assertEqual(len(fake.deleted), 1)
+
+    def test_spray_file_raises_if_upload_fails(self):
+        fake = FakeLandingZone(upload_result="Fail")
+        with self.assertRaises(ValueError):
+            self._spray(fake)
+        self.assertEqual(fake.sprays, [])
+
+    def test_spray_file_auto_sprays_small_frames_inline(self):
+        fake = FakeLandingZone()
+        scripts = self._spray(fake, method="auto")
+        self.assertEqual(fake.uploads, {})
+        self.assertIn("DATASET([{1,U'x'}", scripts[0])
+
+    @patch.object(spray, "INLINE_MAX_ROWS", 2)
+    def test_spray_file_auto_uses_landing_zone_for_large_frames(self):
+        fake = FakeLandingZone()
+        self._spray(fake, method="auto")
+        self.assertEqual(len(fake.uploads), 1)
+
+    def test_spray_file_raises_on_unknown_method(self):
+        with self.assertRaises(ValueError):
+            self._spray(FakeLandingZone(), method="ftp")
+
+
+class TestSprayFileInline(unittest.TestCase):
+    def setUp(self):
+        self.conn = hpycc.Connection("user", test_conn=False)
+        self.df = pd.DataFrame({"a": range(20)})
+        self.scripts = []
+        self.held = 0
+        self.most_held = 0
+        self.lock = threading.Lock()
+
+    def _stringify(self, *args):
+        with self.lock:
+            self.held += 1
+            self.most_held = max(self.most_held, self.held)
+        return _stringify_rows(*args)
+
+    def _run(self, script, *args, fail_on=None, **kwargs):
+        sleep(0.005)
+        with self.lock:
+            self.scripts.append(script)
+            if "DATASET([" in script:
+                self.held -= 1
+        if fail_on and fail_on in script:
+            raise ValueError(script)
+
+    def _spray(self, fail_on=None, **kwargs):
+        def side_effect(script, *args, **kw):
+            return self._run(script, fail_on=fail_on)
+
+        with patch.object(hpycc.Connection, "run_ecl_string",
+                          side_effect=side_effect), \
+                patch.object(spray, "_stringify_rows",
+                             side_effect=self._stringify):
+            spray_file(self.conn, self.df, "~a::file", method="inline",
+                       chunk_size=2, **kwargs)
+
+    def test_spray_file_forgets_metadata_of_file(self):
+        self.conn._metadata_cache.set("~a::file", ("stale", 0))
+        self._spray()
+        self.assertIsNone(self.conn._metadata_cache.get("~a::file"))
+
+    def test_spray_file_bounds_chunks_held(self):
+        self._spray(max_workers=2, queue_depth=3)
+        self.assertLessEqual(self.most_held, 3)
+        self.assertEqual(sum("DATASET([" in s for s in self.scripts), 10)
+
+    def test_spray_file_concatenates_and_deletes_chunks(self):
+        self._spray(max_workers=3)
+        concat = [s for s in self.scripts if "+\n" in s]
+        self.assertEqual(len(concat), 1)
+        deletes = [s for s in self.scripts if "DeleteLogicalFile" in s]
+        self.assertEqual(len(deletes), 10)
+
+    def test_spray_file_deletes_sprayed_chunks_on_failure(self):
+        with self.assertRaises(ValueError):
+            self._spray(max_workers=1, queue_depth=1,
+                        fail_on="from6to8")
+        sprayed = [s for s in self.scripts if "DATASET([" in s]
+        deletes = [s for s in self.scripts if "DeleteLogicalFile" in s]
+        self.assertEqual(len(sprayed), 4)
+        self.assertEqual(len(deletes), 3)
+        self.assertFalse(any("from6to8" in s for s in deletes))
+
+    @unittest.skipUnless(pa, "requires pyarrow")
+    def test_spray_file_serialises_in_processes(self):
+        self.df["b"] = ["x{}".format(i) for i in range(20)]
+        self._spray(max_workers=2)
+        expected = sorted(self.scripts)
+        self.scripts = []
+        with patch.object(hpycc.Connection, "run_ecl_string",
+                          side_effect=self._run):
+            spray_file(self.conn, self.df, "~a::file", method="inline",
+                       chunk_size=2, max_workers=2, serialise_workers=2,
+                       queue_depth=4)
+        self.assertEqual(sorted(self.scripts), expected)
@@ -0,0 +1,136 @@
+import os
+import pickle
+import unittest
+from tempfile import TemporaryDirectory
+from unittest.mock import patch
+
+from hpycc.utils import cache
+from hpycc.utils.cache import LRUCache, FileCache, fingerprint_repo, hash_text
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+
+class TestLRUCache(unittest.TestCase):
+    def test_get_returns_default_if_missing(self):
+        c = LRUCache()
+        self.assertEqual(c.get("a", 1), 1)
+
+    def test_get_returns_set_value(self):
+        c = LRUCache()
+        c.set("a", 2)
+        self.assertEqual(c.get("a"), 2)
+
+    def test_evicts_least_recently_used(self):
+        c = LRUCache(maxsize=2)
+        c.set("a", 1)
+        c.set("b", 2)
+        c.get("a")
+        c.set("c", 3)
+        self.assertEqual(c.get("a"), 1)
+        self.assertIsNone(c.get("b"))
+        self.assertEqual(len(c), 2)
+
+    def test_pickles_settings_but_not_items(self):
+        cache = LRUCache(2)
+        cache.set("a", 1)
+        copy = pickle.loads(pickle.dumps(cache))
+        self.assertEqual((copy.maxsize, len(copy)), (2, 0))
+        copy.set("b", 2)
+        self.assertEqual(copy.get("b"), 2)
+
+    def test_set_passes_evicted_items_to_on_evict(self):
+        evicted = []
+        c = LRUCache(maxsize=1, on_evict=lambda k, v: evicted.append((k, v)))
+        c.set("a", 1)
+        c.set("b", 2)
+        c.pop("b")
+        self.assertEqual(evicted, [("a", 1)])
+
+    def test_pop_removes_value(self):
+        c = LRUCache()
+        c.set("a", 1)
+        self.assertEqual(c.pop("a"), 1)
+        self.assertIsNone(c.get("a"))
+
+
+@unittest.skipUnless(pa, "requires pyarrow")
+class TestFileCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = TemporaryDirectory()
+        self.table = pa.table({"a": list(range(1000))})
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_get_returns_set_table(self):
+        c = FileCache(self.tmp.name)
+        c.set("k", self.table)
+        self.assertTrue(c.get("k").equals(self.table))
+
+    def test_get_returns_none_if_missing(self):
+        self.assertIsNone(FileCache(self.tmp.name).get("k"))
+
+    def test_set_evicts_least_recently_used(self):
+        c = FileCache(self.tmp.name)
+        c.set("a", self.table)
+        size = os.path.getsize(os.path.join(self.tmp.name, "a.arrow"))
+        c.max_bytes = 2 * size
+        os.utime(os.path.join(self.tmp.name, "a.arrow"), (0, 0))
+        c.set("b", self.table)
+        os.utime(os.path.join(self.tmp.name, "b.arrow"), (1, 1))
+        c.get("a")
+        c.set("c", self.table)
+        self.assertIsNotNone(c.get("a"))
+        self.assertIsNone(c.get("b"))
+        self.assertIsNotNone(c.get("c"))
+
+    def test_clear_removes_tables(self):
+        c = FileCache(self.tmp.name)
+        c.set("k", self.table)
+        c.clear()
+        self.assertIsNone(c.get("k"))
+
+    def test_pickled_copy_reads_same_directory(self):
+        c = FileCache(self.tmp.name)
+        c.set("k", self.table)
+        copy = pickle.loads(pickle.dumps(c))
+        self.assertTrue(copy.get("k").equals(self.table))
+
+    @patch.object(cache, "pa", None)
+    def test_raises_without_pyarrow(self):
+        with self.assertRaises(ImportError):
+            FileCache(self.tmp.name)
+
+
+class TestHashText(unittest.TestCase):
+    def test_hash_text_is_stable(self):
+        self.assertEqual(hash_text("a", "b"), hash_text("a", "b"))
+
+    def test_hash_text_separates_arguments(self):
+        self.assertNotEqual(hash_text("ab", ""), hash_text("a", "b"))
+
+
+class TestFingerprintRepo(unittest.TestCase):
+    def test_fingerprint_repo_none(self):
+        self.assertEqual(fingerprint_repo(None), fingerprint_repo([]))
+
+    def test_fingerprint_repo_changes_when_file_changes(self):
+        with TemporaryDirectory() as d:
+            p = os.path.join(d, "a.ecl")
+            with open(p, "w+") as file:
+                file.write("EXPORT a := 1;")
+            before = fingerprint_repo(d)
+            self.assertEqual(before, fingerprint_repo([d]))
+            with open(p, "w+") as file:
+                file.write("EXPORT a := 12;")
+            self.assertNotEqual(before, fingerprint_repo(d))
+
+    def test_fingerprint_repo_changes_when_file_added(self):
+        with TemporaryDirectory() as d:
+            before = fingerprint_repo(d)
+            with open(os.path.join(d, "b.ecl"), "w+") as file:
+                file.write("EXPORT b := 1;")
+            self.assertNotEqual(before, fingerprint_repo(d))
@@ -1,6 +1,7 @@
 import unittest
 
-from hpycc.utils.filechunker import make_chunks
+from hpycc.utils.filechunker import (make_chunks, sample_chunks,
+                                     coalesce_rows, AdaptiveChunker)
 
 
 class TestMakeChunks(unittest.TestCase):
@@ -42,3 +43,122 @@ class TestMakeChunks(unittest.TestCase):
         res = make_chunks(10000)
         expected = [(0, 10000)]
         self.assertEqual(expected, res)
+
+
+class TestSampleChunks(unittest.TestCase):
+    def test_sample_chunks_are_sorted_and_do_not_overlap(self):
+        res = sample_chunks(1000, 95, 10, random_state=0)
+        self.assertEqual(len(res), 10)
+        self.assertEqual(sum(n for _, n in res), 95)
+        for (start, n), (next_start, _) in zip(res, res[1:]):
+            self.assertLessEqual(start + n, next_start)
+        self.assertGreaterEqual(res[0][0], 0)
+        self.assertLessEqual(res[-1][0] + res[-1][1], 1000)
+
+    def test_sample_chunks_are_repeatable(self):
+        self.assertEqual(sample_chunks(10 ** 9, 100, 5, random_state=2),
+                         sample_chunks(10 ** 9, 100, 5, random_state=2))
+
+    def test_sample_chunks_can_fill_all_items(self):
+        res = sample_chunks(10, 9, 9, random_state=1)
+        self.assertEqual(sum(n for _, n in res), 9)
+        self.assertEqual(len({start for start, _ in res}), 9)
+
+    def test_sample_chunks_returns_all_items_if_n_is_num(self):
+        self.assertEqual(sample_chunks(10, 20, 3), [(0, 10)])
+
+    def test_sample_chunks_returns_nothing_if_n_is_zero(self):
+        self.assertEqual(sample_chunks(10, 0, 3), [])
+
+
+class TestCoalesceRows(unittest.TestCase):
+    def test_coalesce_rows_merges_adjacent_rows(self):
+        self.assertEqual(coalesce_rows([4, 1, 2, 3, 7]), [(1, 4), (7, 1)])
+
+    def test_coalesce_rows_merges_rows_within_gap(self):
+        self.assertEqual(coalesce_rows([1, 4, 9, 20], gap=4),
+                         [(1, 9), (20, 1)])
+
+    def test_coalesce_rows_ignores_duplicates(self):
+        self.assertEqual(coalesce_rows([3, 3, 2]), [(2, 2)])
+
+    def test_coalesce_rows_splits_by_chunk_size(self):
+        self.assertEqual(coalesce_rows(range(5), chunk_size=2),
+                         [(0, 2), (2, 2), (4, 1)])
+
+    def test_coalesce_rows_with_no_rows(self):
+        self.assertEqual(coalesce_rows([]), [])
+
+
+class TestAdaptiveChunker(unittest.TestCase):
+    def setUp(self):
+        self.tuner = AdaptiveChunker(min_chunk_size=10, max_chunk_size=1000,
+                                     target_latency=10)
+        self.tuner.start(chunk_size=100, max_workers=8, record_size=10)
+
+    def test_start_uses_defaults(self):
+        self.assertEqual(self.tuner.chunk_size, 100)
+        self.assertEqual(self.tuner.workers, 4)
+
+    def test_start_keeps_given_values(self):
+        tuner = AdaptiveChunker(chunk_size=50, workers=2, min_chunk_size=10)
+        tuner.start(chunk_size=100, max_workers=8, record_size=10)
+        self.assertEqual((tuner.chunk_size, tuner.workers), (50, 2))
+
+    def test_chunks_cover_all_rows(self):
+        chunks = list(self.tuner.chunks(250))
+        self.assertEqual(chunks, [(0, 100), (100, 100), (200, 50)])
+
+    def test_chunks_use_current_chunk_size(self):
+        chunks = self.tuner.chunks(1000)
+        next(chunks)
+        self.tuner.chunk_size = 300
+        self.assertEqual(next(chunks), (100, 300))
+
+    def test_record_grows_chunk_size_when_fast(self):
+        self.tuner.record(100, 1)
+        self.assertEqual(self.tuner.chunk_size, 125)
+
+    def test_record_halves_chunk_size_when_slow(self):
+        self.tuner.record(100, 11)
+        self.assertEqual(self.tuner.chunk_size, 50)
+
+    def test_record_scales_latency_of_short_chunks(self):
+        self.tuner.record(10, 2)
+        self.assertEqual(self.tuner.chunk_size, 50)
+
+    def test_record_scales_latency_by_requested_chunk_size(self):
+        self.tuner.chunk_size = 300
+        self.tuner.record(50, 4, chunk_size=100)
+        self.assertEqual(self.tuner.chunk_size, 300)
+
+    def test_record_halves_chunk_size_once_for_chunks_in_flight(self):
+        self.tuner.record(100, 11, chunk_size=100)
+        self.tuner.record(100, 11, chunk_size=100)
+        self.assertEqual(self.tuner.chunk_size, 50)
+        self.assertEqual([h[0] for h in self.tuner.history], [100, 100])
+
+    def test_record_keeps_chunk_size_within_bounds(self):
+        for _ in range(10):
+            self.tuner.record(100, 100)
+        self.assertEqual(self.tuner.chunk_size, 10)
+
+    def test_record_adds_worker_after_fast_round(self):
+        for _ in range(4):
+            self.tuner.record(100, 1)
+        self.assertEqual(self.tuner.workers, 5)
+
+    def test_record_halves_workers_after_slow_round(self):
+        for _ in range(3):
+            self.tuner.record(100, 1)
+        self.tuner.record(100, 20)
+        self.assertEqual(self.tuner.workers, 2)
+
+    def test_record_keeps_workers_at_most_max_workers(self):
+        for _ in range(100):
+            self.tuner.record(1, 0.001)
+        self.assertLessEqual(self.tuner.workers, 8)
+
+    def test_record_keeps_history(self):
+        self.tuner.record(100, 2)
+        self.assertEqual(self.tuner.history, [(100, 4, 2, 500)])
@@ -1,14 +1,25 @@
 import unittest
 from xml.etree import ElementTree
 
+import numpy as np
+
 from hpycc.utils.parsers import (
     parse_wuid_from_failed_response,
     parse_wuid_from_xml,
     parse_schema_from_xml,
     get_python_type_from_ecl_type,
-    apply_custom_dtypes
+    apply_custom_dtypes,
+    parse_record_size,
+    parse_xml_to_arrow,
+    arrow_type,
+    to_arrow_array
 )
 
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
 
 class TestParseWUIDFromFailedResponseWithoutServer(unittest.TestCase):
     def test_parse_wuid_from_failed_response_with_bracketed_wuid(self):
@@ -322,3 +333,76 @@ class TestGetPythonTypeFromECLType(unittest.TestCase):
             child = ElementTree.fromstring(sch)[0]
             r = get_python_type_from_ecl_type(child)
             self.assertEqual(t[1], r)
+
+
+class TestParseRecordSize(unittest.TestCase):
+    def test_parse_record_size_uses_fixed_size(self):
+        res = parse_record_size({"RecordSize": 12, "Filesize": "1,000",
+                                 "RecordCount": "10"})
+        self.assertEqual(res, 12)
+
+    def test_parse_record_size_uses_average_size_if_variable(self):
+        res = parse_record_size({"RecordSize": 0, "Filesize": "1,000",
+                                 "RecordCount": "10"})
+        self.assertEqual(res, 100)
+
+    def test_parse_record_size_prefers_int64_fields(self):
+        res = parse_record_size({"FileSizeInt64": 500, "Filesize": "1,000",
+                                 "RecordCountInt64": 10})
+        self.assertEqual(res, 50)
+
+    def test_parse_record_size_returns_none_if_unknown(self):
+        self.assertIsNone(parse_record_size({}))
+
+
+@unittest.skipUnless(pa, "requires pyarrow")
+class TestParseXMLToArrow(unittest.TestCase):
+    def test_parse_xml_to_arrow_infers_types(self):
+        xml = ("<Dataset name='Result 1'>"
+               "<Row><a>1</a><b>1.5</b><c>true</c><d>x</d></Row>"
+               "<Row><a>2</a><b>2</b><c>false</c><d></d></Row>"
+               "</Dataset>")
+        res = parse_xml_to_arrow(xml)
+        self.assertEqual(res.schema, pa.schema([
+            ("a", pa.int64()), ("b", pa.float64()), ("c", pa.bool_()),
+            ("d", pa.string())]))
+        self.assertEqual(res.column("d").to_pylist(), ["x", None])
+
+    def test_parse_xml_to_arrow_returns_empty_table(self):
+        res = parse_xml_to_arrow("<Dataset name='Result 1'></Dataset>")
+        self.assertEqual(res.num_rows, 0)
+
+
+@unittest.skipUnless(pa, "requires pyarrow")
+class TestArrowType(unittest.TestCase):
+    def test_arrow_type_maps_python_types(self):
+        for typ, expected in [(int, pa.int64()), (float, pa.float64()),
+                              (bool, pa.bool_()), (str, pa.string())]:
+            self.assertEqual(arrow_type({"type": typ, "is_a_set": False}),
+                             expected)
+
+    def test_arrow_type_maps_numpy_types(self):
+        res = arrow_type({"type": np.int32, "is_a_set": False})
+        self.assertEqual(res, pa.int32())
+
+    def test_arrow_type_makes_sets_lists(self):
+        res = arrow_type({"type": int, "is_a_set": True})
+        self.assertEqual(res, pa.list_(pa.int64()))
+
+
+@unittest.skipUnless(pa, "requires pyarrow")
+class TestToArrowArray(unittest.TestCase):
+    def test_to_arrow_array_converts_strings(self):
+        res = to_arrow_array(["1", "2"], {"type": int, "is_a_set": False})
+        self.assertEqual(res.to_pylist(), [1, 2])
+
+    def test_to_arrow_array_converts_sets(self):
+        res = to_arrow_array([{"Item": ["1", "2"]}, {"Item": []}],
+                             {"type": float, "is_a_set": True})
+        self.assertEqual(res.type, pa.list_(pa.float64()))
+        self.assertEqual(res.to_pylist(), [[1.0, 2.0], []])
+
+    def test_to_arrow_array_uses_float_for_long_ints(self):
+        res = to_arrow_array([1, 2 ** 70], {"type": int, "is_a_set": False})
+        self.assertEqual(res.type, pa.float64())
+        self.assertEqual(res.to_pylist(), [1.0, float(2 ** 70)])
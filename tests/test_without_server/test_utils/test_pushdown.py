@@ -0,0 +1,107 @@
+import unittest
+
+from hpycc.utils.pushdown import (pushdown_script, aggregate_script,
+                                   compile_where,
+                                   temp_logical_file)
+
+
+class TestTempLogicalFile(unittest.TestCase):
+    def test_temp_logical_file_is_unique(self):
+        a = temp_logical_file("~thor::file")
+        self.assertTrue(a.startswith("~TEMPHPYCC::thor::file::"))
+        self.assertNotEqual(a, temp_logical_file("~thor::file"))
+
+
+class TestPushdownScript(unittest.TestCase):
+    def setUp(self):
+        self.detail = {"Ecl": "RECORD\n  STRING1 a;\n  INTEGER8 b;\nEND;\n"}
+
+    def test_pushdown_script_projects_columns(self):
+        res = pushdown_script("~thor::file", self.detail, "~temp", ["b"])
+        self.assertEqual(res, "\n".join([
+            "rec := RECORD\n  STRING1 a;\n  INTEGER8 b;\nEND;",
+            "ds := DATASET('~thor::file', rec, THOR);",
+            "OUTPUT(TABLE(ds, {ds.b}), , '~temp', EXPIRE(1));"]))
+
+    def test_pushdown_script_reads_csv_files_as_csv(self):
+        self.detail["Format"] = "csv"
+        res = pushdown_script("thor::file", self.detail, "~temp", ["b"])
+        self.assertIn("DATASET('~thor::file', rec, CSV);", res)
+
+    def test_pushdown_script_raises_without_record(self):
+        with self.assertRaises(ValueError):
+            pushdown_script("~thor::file", {}, "~temp", ["b"])
+
+    def test_pushdown_script_filters_before_projecting(self):
+        res = pushdown_script("~thor::file", self.detail, "~temp", ["b"],
+                              "(a = 'x')")
+        self.assertIn("OUTPUT(TABLE(ds((a = 'x')), {ds.b}), , '~temp'", res)
+
+
+class TestAggregateScript(unittest.TestCase):
+    def setUp(self):
+        self.detail = {"Ecl": "RECORD\n  STRING1 a;\n  INTEGER8 b;\nEND;\n"}
+
+    def test_aggregate_script_groups_and_sorts(self):
+        res = aggregate_script("~thor::file", self.detail, ["a"],
+                               [("b_max", "max", "b"), ("n", "count", "*")])
+        self.assertEqual(res.splitlines()[-1], (
+            "OUTPUT(SORT(TABLE(ds, {ds.a, b_max := MAX(GROUP, ds.b), "
+            "n := COUNT(GROUP)}, a), a), NAMED('aggregate'), ALL);"))
+
+    def test_aggregate_script_without_groups(self):
+        res = aggregate_script("~thor::file", self.detail, [],
+                               [("b", "std", "b")], "(b > 1)")
+        self.assertEqual(res.splitlines()[-1], (
+            "OUTPUT(TABLE(ds((b > 1)), {b := SQRT(VARIANCE(GROUP, ds.b) * "
+            "COUNT(GROUP) / (COUNT(GROUP) - 1))}), NAMED('aggregate'), "
+            "ALL);"))
+
+    def test_aggregate_script_var_is_sample_variance(self):
+        res = aggregate_script("~thor::file", self.detail, [],
+                               [("v", "var", "b")])
+        self.assertIn("v := VARIANCE(GROUP, ds.b) * COUNT(GROUP) / "
+                      "(COUNT(GROUP) - 1)", res)
+
+
+class TestCompileWhere(unittest.TestCase):
+    def setUp(self):
+        self.columns = ["a", "b", "c"]
+
+    def _compile(self, expression):
+        return compile_where(expression, self.columns)
+
+    def test_compile_where_comparisons(self):
+        self.assertEqual(self._compile("a == 1"), "(a = 1)")
+        self.assertEqual(self._compile("a != 1.5"), "(a <> 1.5)")
+        self.assertEqual(self._compile("1 < a <= b"),
+                         "((1 < a) AND (a <= b))")
+
+    def test_compile_where_boolean_operators(self):
+        self.assertEqual(self._compile("a > 1 and (b or not c)"),
+                         "((a > 1) AND (b OR (NOT c)))")
+        self.assertEqual(self._compile("(a > 1) & ~(c == True)"),
+                         "((a > 1) AND (NOT (c = TRUE)))")
+
+    def test_compile_where_in(self):
+        self.assertEqual(self._compile("b in ('x', 'y')"),
+                         "(b IN ['x', 'y'])")
+        self.assertEqual(self._compile("a not in [1, -2]"),
+                         "(NOT (a IN [1, (-2)]))")
+
+    def test_compile_where_arithmetic(self):
+        self.assertEqual(self._compile("a % 2 == 0"), "((a % 2) = 0)")
+
+    def test_compile_where_escapes_strings(self):
+        self.assertEqual(self._compile("b == \"it's\\\\\""),
+                         "(b = 'it\\'s\\\\')")
+
+    def test_compile_where_rejects_unknown_columns(self):
+        with self.assertRaises(KeyError):
+            self._compile("d == 1")
+
+    def test_compile_where_rejects_other_expressions(self):
+        for expression in ["a.b == 1", "f(a)", "a == None", "a[0] == 1",
+                           "a in b", "a is b", "a ==", "lambda: a"]:
+            with self.assertRaises(ValueError, msg=expression):
+                self._compile(expression)
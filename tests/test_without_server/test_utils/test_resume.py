@@ -0,0 +1,61 @@
+import os
+from tempfile import TemporaryDirectory
+import unittest
+
+from hpycc.utils.resume import ChunkStore
+
+
+class TestChunkStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp = TemporaryDirectory()
+        self.dir = os.path.join(self.tmp.name, "resume")
+        self.chunks = [(0, 2), (2, 2), (4, 1)]
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _store(self, logical_file="file", modified="2018-01-01", chunks=None):
+        return ChunkStore(self.dir, logical_file, modified, 5,
+                          chunks or self.chunks)
+
+    def test_chunk_store_saves_and_loads_chunks(self):
+        store = self._store()
+        store.save(2, {"a": [2, 3]})
+        self.assertTrue(store.has(2))
+        self.assertEqual(store.load(2), {"a": [2, 3]})
+        self.assertEqual(store.missing(), [(0, 2), (4, 1)])
+
+    def test_chunk_store_resumes_with_stored_plan(self):
+        self._store().save(0, {"a": [0, 1]})
+        store = self._store(chunks=[(0, 5)])
+        self.assertEqual(store.chunks, self.chunks)
+        self.assertEqual(store.missing(), [(2, 2), (4, 1)])
+
+    def test_chunk_store_refuses_modified_file(self):
+        self._store()
+        with self.assertRaises(ValueError):
+            self._store(modified="2019-01-01")
+
+    def test_chunk_store_refuses_other_file(self):
+        self._store()
+        with self.assertRaises(ValueError):
+            self._store(logical_file="other")
+
+    def test_chunk_store_requires_modified(self):
+        with self.assertRaises(ValueError):
+            self._store(modified=None)
+
+    def test_chunk_store_clear_removes_directory(self):
+        store = self._store()
+        store.save(0, {"a": [0, 1]})
+        store.clear()
+        self.assertFalse(os.path.exists(self.dir))
+
+    def test_chunk_store_clear_keeps_other_files(self):
+        store = self._store()
+        store.save(0, {"a": [0, 1]})
+        other = os.path.join(self.dir, "notes.txt")
+        with open(other, "w") as f:
+            f.write("mine")
+        store.clear()
+        self.assertEqual(os.listdir(self.dir), ["notes.txt"])
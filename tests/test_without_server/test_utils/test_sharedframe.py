@@ -0,0 +1,75 @@
+from concurrent.futures import ProcessPoolExecutor
+import unittest
+from unittest.mock import patch
+
+import numpy as np
+import pandas as pd
+
+from hpycc.utils import sharedframe
+from hpycc.utils.sharedframe import SharedFrame, attach
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+
+class TestSharedFrame(unittest.TestCase):
+    def setUp(self):
+        self.df = pd.DataFrame({
+            "a": np.arange(5, dtype=np.int32),
+            "b": [0.5, np.nan, 1.5, 2.5, 3.5],
+            "c": [True, False, True, False, True],
+            "d": ["x", None, "é", "", "it's"],
+            "e": pd.array([1, 2, 3, 4, 5], dtype="Int8"),
+            "f": pd.array([1, None, 3, 4, 5], dtype="Int8")},
+            index=list("vwxyz"))
+
+    @unittest.skipUnless(pa, "requires pyarrow")
+    def test_attach_returns_rows(self):
+        with SharedFrame(self.df) as shared:
+            res = attach(shared.spec, 1, 3)
+        expected = self.df.iloc[1:4].reset_index(drop=True)
+        self.assertEqual(res["a"].dtype, np.int32)
+        self.assertEqual(res["c"].dtype, np.bool_)
+        pd.testing.assert_series_equal(res["b"], expected["b"])
+        self.assertEqual(res["d"].tolist()[1:], ["é", ""])
+        self.assertTrue(pd.isna(res["d"][0]))
+        pd.testing.assert_series_equal(res["e"], expected["e"])
+        pd.testing.assert_series_equal(res["f"], expected["f"])
+
+    @unittest.skipUnless(pa, "requires pyarrow")
+    def test_attach_in_another_process(self):
+        with SharedFrame(self.df) as shared, \
+                ProcessPoolExecutor(1) as executor:
+            res = executor.submit(attach, shared.spec, 0, 5).result()
+        self.assertEqual(res["a"].tolist(), list(range(5)))
+        self.assertEqual(res["d"][4], "it's")
+
+    @unittest.skipUnless(pa, "requires pyarrow")
+    def test_attach_reads_strings_of_a_slice(self):
+        df = pd.DataFrame({"a": ["x", "yy", None, "zzz"]}).iloc[1:]
+        with SharedFrame(df) as shared:
+            res = attach(shared.spec, 1, 2)
+        self.assertTrue(pd.isna(res["a"][0]))
+        self.assertEqual(res["a"][1], "zzz")
+
+    @patch.object(sharedframe, "pa", None)
+    def test_raises_without_pyarrow(self):
+        with self.assertRaises(ImportError):
+            SharedFrame(self.df)
+
+    @unittest.skipUnless(pa, "requires pyarrow")
+    def test_shares_empty_frame(self):
+        with SharedFrame(self.df.iloc[:0]) as shared:
+            res = attach(shared.spec, 0, 0)
+        self.assertEqual(list(res.columns), list(self.df.columns))
+        self.assertEqual(len(res), 0)
+
+    @unittest.skipUnless(pa, "requires pyarrow")
+    def test_close_frees_shared_memory(self):
+        shared = SharedFrame(self.df)
+        spec = shared.spec
+        shared.close()
+        with self.assertRaises(FileNotFoundError):
+            attach(spec, 0, 1)